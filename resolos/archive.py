@@ -14,24 +14,47 @@ from .exception import (
     NotAProjectFolderError,
     NotAResolosArchiveError,
 )
-from .platform import find_project_dir, get_arch, get_user_platform, find_resolos_dir
+from .platform import (
+    find_project_dir,
+    get_arch,
+    get_user_platform,
+    find_resolos_dir,
+    get_downloads_dir,
+)
 from .config import (
     get_project_dict_config,
     randomString,
     DictConfig,
     get_option,
     verify_mutually_exclusive_options,
+    is_config_lock_file,
 )
 from .shell import run_shell_cmd
-from .storage.yareta import deposit_archive, download_archive
+from .compression import (
+    CompressedStream,
+    DecompressedStream,
+    GzipCodec,
+    get_codec,
+    detect_compression,
+    read_footer,
+)
+from .storage.yareta import deposit_archive, download_archive, submit_deposit
+from .chunk_store import ChunkStore
 from .version import __version__
 
+import io
+import json
+import stat
+import hashlib
+import time
 import shutil
 import tempfile
 import urllib.request
 import glob
 import os
 import tarfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -47,7 +70,16 @@ FILES_NAME = "files"
 RESOLOS_FOLDER_NAME = ".resolos"
 TAR_HEADER_RESOLOS_VERSION = "resolos_version"
 TAR_HEADER_CREATED_ON = "created_on"
+TAR_HEADER_COMPRESSION = "compression"
 ARCHIVE_FILENAME = "resolos_archive.tar.gz"
+# The index of the archive is its last tar member, it maps the names of the files in the
+# archive to their offsets
+INDEX_NAME = "resolos_index.json"
+INDEX_VERSION = 1
+INDEX_FIELDS = ["member_offset", "member_start", "offset", "size"]
+# Files are split into compressed members of about this size, so that reading a file
+# through the index only decompresses the member that contains it
+INDEX_MEMBER_SIZE = 4 * 1024 * 1024
 
 EXCLUDE_FILES = [".DS_Store", ".tmp"]
 SUPPORTED_REMOTE_PROTOCOLS = ["http", "https", "ftp", "sftp"]
@@ -71,6 +103,8 @@ def filter_resolos(ti: tarfile.TarInfo):
             if ti.name.endswith(exc_dir):
                 return None
     if ti.type in tarfile.REGULAR_TYPES:
+        if is_config_lock_file(ti.name):
+            return None
         for exc_file in EXCLUDE_FILES:
             if ti.name.endswith(exc_file):
                 return None
@@ -79,14 +113,27 @@ def filter_resolos(ti: tarfile.TarInfo):
 
 def make_archive(env_name: str, **kwargs):
     verify_mutually_exclusive_options(
-        ["filename", "organizational_unit_id"],
-        ["--filename", "--organizational-unit-id"],
+        ["filename", "organizational_unit_id", "store"],
+        ["--filename", "--organizational-unit-id", "--store"],
         **kwargs,
     )
-    if kwargs.get("filename"):
+    if kwargs.get("store"):
+        store_path = kwargs.get("store")
+        snapshot_id = make_archive_snapshot(
+            env_name, store_path, light=kwargs.get("light")
+        )
+        clog.info(
+            f"Successfully stored snapshot '{snapshot_id}' of resolos project in {store_path}."
+        )
+    elif kwargs.get("filename"):
         output_filename = kwargs.get("filename")
         light = kwargs.get("light")
-        make_archive_file(env_name, output_filename=output_filename, light=light)
+        make_archive_file(
+            env_name,
+            output_filename=output_filename,
+            light=light,
+            compression=kwargs.get("compression"),
+        )
         clog.info(f"Successfully archived resolos project to {output_filename}.")
     elif kwargs.get("organizational_unit_id"):
         with tempfile.TemporaryDirectory() as tmpdirname:
@@ -115,7 +162,10 @@ def make_archive(env_name: str, **kwargs):
                 f"Missing required option: --description",
                 pop=True,
             )
-            make_archive_file(env_name, output_filename=output_filename)
+            compression = get_option(kwargs, "compression", pop=True)
+            make_archive_file(
+                env_name, output_filename=output_filename, compression=compression
+            )
             clog.debug(f"Successfully created archive file {output_filename}!")
             clog.info(f"Depositing resolos project archive to Yareta...")
             deposit_id = deposit_archive(
@@ -135,63 +185,419 @@ def make_archive(env_name: str, **kwargs):
         raise ResolosException(f"Unknown resolos archival destination")
 
 
-def make_archive_file(env_name: str, output_filename: str, light: bool = False):
+class ArchiveWriter(object):
+    """
+    Writes the archive tarball through a CompressedStream, so that members which are
+    compressed already (like the conda-pack tarball) are stored instead of compressed again.
+    The offsets of the files are written to an index at the end of the archive, which the
+    footer of the archive points to.
+    """
+
+    def __init__(self, output_filename, codec=None, pax_headers=None):
+        codec = codec or GzipCodec()
+        pax_headers = dict(pax_headers or {})
+        pax_headers[TAR_HEADER_COMPRESSION] = codec.name
+        self.file = open(output_filename, "wb")
+        self.stream = CompressedStream(self.file, codec)
+        self.tar = tarfile.open(
+            fileobj=self.stream,
+            mode="w",
+            format=tarfile.PAX_FORMAT,
+            pax_headers=pax_headers,
+        )
+        self.index = {}
+
+    def index_filter(self, filter):
+        def index_member(tarinfo: tarfile.TarInfo):
+            if filter is not None:
+                tarinfo = filter(tarinfo)
+            if tarinfo is not None and tarinfo.isreg():
+                if self.stream.member_size >= INDEX_MEMBER_SIZE:
+                    self.stream.new_member(store=self.stream.store)
+                # The header of the member is written right after the filter is applied
+                self.index[tarinfo.name] = [
+                    self.stream.member_offset,
+                    self.stream.member_start,
+                    self.stream.tell(),
+                    tarinfo.size,
+                ]
+            return tarinfo
+
+        return index_member
+
+    def add(self, path, arcname, filter=None, compressed=False):
+        if compressed:
+            self.stream.new_member(store=True)
+        self.tar.add(path, arcname=arcname, filter=self.index_filter(filter))
+        if compressed:
+            self.stream.new_member()
+
+    def write_index(self):
+        self.stream.new_member()
+        index_offset = self.stream.member_offset
+        data = json.dumps(
+            {"version": INDEX_VERSION, "fields": INDEX_FIELDS, "members": self.index}
+        ).encode("utf-8")
+        tarinfo = tarfile.TarInfo(INDEX_NAME)
+        tarinfo.size = len(data)
+        tarinfo.mtime = int(time.time())
+        self.tar.addfile(tarinfo, io.BytesIO(data))
+        return index_offset
+
+    def close(self):
+        try:
+            index_offset = self.write_index()
+            self.tar.close()
+            self.stream.end_member()
+            self.stream.write_compressed(self.stream.codec.footer(index_offset))
+            self.stream.close()
+        finally:
+            self.release()
+
+    def release(self):
+        """Stops the threads of the codec and closes the output file, also after errors"""
+        try:
+            self.stream.codec.close()
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.release()
+
+
+def start_env_exports(executor, env_name: str, tmpdirname: str, light: bool = False):
+    """
+    Starts packing and exporting the environment to tmpdirname on the executor. Returns the
+    list of (path, name in the archive, future) of the files being created, pack first.
+    """
+    pack_absolute_path = f"{tmpdirname}/{PACK_NAME}"
+    env_yaml_path = f"{tmpdirname}/{ENV_YAML_NAME}"
+    env_history_yaml_path = f"{tmpdirname}/{ENV_FROM_HISTORY_YAML_NAME}"
+    explicit_packages_path = f"{tmpdirname}/{EXPLICIT_PACKAGES_NAME}"
+    requirements_path = f"{tmpdirname}/{REQUIREMENTS_NAME}"
+    exports = []
+    if not light:
+        clog.info(f"Packing environment...")
+        exports.append(
+            (
+                pack_absolute_path,
+                PACK_NAME,
+                executor.submit(pack_conda_env, env_name, pack_absolute_path),
+            )
+        )
+    else:
+        clog.info("Skipping environment packing")
+    clog.info(f"Exporting environment, explicit packages list and pip requirements...")
+    exports += [
+        (
+            env_yaml_path,
+            ENV_YAML_NAME,
+            executor.submit(
+                export_conda_env,
+                env_name,
+                filename=env_yaml_path,
+                only_explicitly_installed=False,
+            ),
+        ),
+        (
+            env_history_yaml_path,
+            ENV_FROM_HISTORY_YAML_NAME,
+            executor.submit(export_conda_env, env_name, filename=env_history_yaml_path),
+        ),
+        (
+            explicit_packages_path,
+            EXPLICIT_PACKAGES_NAME,
+            executor.submit(
+                explicit_package_list, env_name, filename=explicit_packages_path
+            ),
+        ),
+        (
+            requirements_path,
+            REQUIREMENTS_NAME,
+            executor.submit(
+                pip_installed_package_list,
+                env_name,
+                filename=requirements_path,
+            ),
+        ),
+    ]
+    return exports
+
+
+def make_archive_file(
+    env_name: str, output_filename: str, light: bool = False, compression: str = None
+):
+    codec = get_codec(compression)
     resolos_dir = find_resolos_dir()
     project_dir = resolos_dir.parent
     files_path = str(project_dir.absolute())
     resolos_path = str(resolos_dir.absolute())
     with tempfile.TemporaryDirectory() as tmpdirname:
-        pack_absolute_path = f"{tmpdirname}/{PACK_NAME}"
-        env_yaml_path = f"{tmpdirname}/{ENV_YAML_NAME}"
-        env_history_yaml_path = f"{tmpdirname}/{ENV_FROM_HISTORY_YAML_NAME}"
-        explicit_packages_path = f"{tmpdirname}/{EXPLICIT_PACKAGES_NAME}"
-        requirements_path = f"{tmpdirname}/{REQUIREMENTS_NAME}"
-        if not light:
-            clog.info(f"Packing environment...")
-            pack_conda_env(env_name, pack_absolute_path)
-        else:
-            clog.info("Skipping environment packing")
-        clog.info(f"Exporting environment...")
-        export_conda_env(env_name, filename=env_history_yaml_path)
-        export_conda_env(
-            env_name, filename=env_yaml_path, only_explicitly_installed=False
-        )
-        clog.info(f"Exporting explicit packages list...")
-        explicit_package_list(env_name, filename=explicit_packages_path)
-        clog.info(f"Exporting requirements file for pip packages...")
-        pip_installed_package_list(env_name, filename=requirements_path)
         pax_headers = {
             TAR_HEADER_RESOLOS_VERSION: __version__,
             TAR_HEADER_CREATED_ON: datetime.now().isoformat(),
         }
+        # The environment is packed and exported while the project files are archived
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            exports = start_env_exports(executor, env_name, tmpdirname, light)
+            with ArchiveWriter(
+                output_filename, codec=codec, pax_headers=pax_headers
+            ) as archive:
+                clog.info(f"Archiving project files...")
+                archive.add(files_path, FILES_NAME, filter=filter_files)
+                archive.add(resolos_path, RESOLOS_FOLDER_NAME, filter=filter_resolos)
+                for path, arcname, future in exports:
+                    future.result()
+                    archive.add(path, arcname, compressed=arcname == PACK_NAME)
+                    # Keep at most one copy of the environment on disk
+                    os.remove(path)
+
+
+def snapshot_entry(store: ChunkStore, path: str, arcname: str, filter=None):
+    """
+    Stores a file of a snapshot, returns its manifest entry, or None if it is filtered out.
+    The filters of the tarball archives are applied to the entries.
+    """
+    st = os.lstat(path)
+    ti = tarfile.TarInfo(arcname)
+    ti.mode = stat.S_IMODE(st.st_mode)
+    ti.mtime = st.st_mtime
+    if stat.S_ISLNK(st.st_mode):
+        ti.type = tarfile.SYMTYPE
+        ti.linkname = os.readlink(path)
+    elif stat.S_ISDIR(st.st_mode):
+        ti.type = tarfile.DIRTYPE
+    elif stat.S_ISREG(st.st_mode):
+        ti.type = tarfile.REGTYPE
+        ti.size = st.st_size
+    else:
+        return None
+    if filter is not None and filter(ti) is None:
+        return None
+    entry = {"name": arcname, "mode": ti.mode, "mtime": ti.mtime}
+    if ti.issym():
+        entry.update(type="symlink", target=ti.linkname)
+    elif ti.isdir():
+        entry.update(type="dir")
+    else:
+        entry.update(type="file", size=ti.size, chunks=store.put_file(path))
+    return entry
+
+
+def snapshot_tree(store: ChunkStore, path: str, arcname: str, filter=None):
+    entry = snapshot_entry(store, path, arcname, filter)
+    if entry is None:
+        return []
+    entries = [entry]
+    if entry["type"] == "dir":
+        for name in sorted(os.listdir(path)):
+            entries += snapshot_tree(
+                store, os.path.join(path, name), f"{arcname}/{name}", filter
+            )
+    return entries
+
+
+def make_archive_snapshot(env_name: str, store_path: str, light: bool = False):
+    """
+    Stores a snapshot of the project and its environment in a chunk store, returns the id
+    of the snapshot. Only the chunks that are not in the store yet are written.
+    """
+    store = ChunkStore(store_path)
+    resolos_dir = find_resolos_dir()
+    files_path = str(resolos_dir.parent.absolute())
+    resolos_path = str(resolos_dir.absolute())
+    created_on = datetime.now().isoformat()
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            exports = start_env_exports(executor, env_name, tmpdirname, light)
+            clog.info(f"Storing project files...")
+            entries = snapshot_tree(store, files_path, FILES_NAME, filter_files)
+            entries += snapshot_tree(
+                store, resolos_path, RESOLOS_FOLDER_NAME, filter_resolos
+            )
+            for path, arcname, future in exports:
+                future.result()
+                entries.append(snapshot_entry(store, path, arcname))
+                os.remove(path)
+    snapshot_id = store.write_manifest(
+        {
+            TAR_HEADER_RESOLOS_VERSION: __version__,
+            TAR_HEADER_CREATED_ON: created_on,
+            "entries": entries,
+        }
+    )
+    clog.info(
+        f"Stored {store.written_chunks} new chunks ({store.written_bytes} bytes) "
+        f"in store {store_path}"
+    )
+    return snapshot_id
+
+
+def archive_compression(input_filename):
+    compression = detect_compression(input_filename)
+    if compression is None:
+        raise NotAResolosArchiveError(
+            f"{input_filename} is not an archive created by resolos."
+        )
+    return compression
+
+
+@contextmanager
+def open_archive(input_filename):
+    """
+    Opens an archive for a single pass over its members, detecting its compression
+    """
+    compression = archive_compression(input_filename)
+    with open(input_filename, "rb") as f:
         with tarfile.open(
-            output_filename, "w:gz", format=tarfile.PAX_FORMAT, pax_headers=pax_headers
+            fileobj=DecompressedStream(f, compression),
+            mode="r|",
+            format=tarfile.PAX_FORMAT,
         ) as tar:
-            tar.add(files_path, arcname=FILES_NAME, filter=filter_files)
-            tar.add(resolos_path, arcname=RESOLOS_FOLDER_NAME, filter=filter_resolos)
-            if not light:
-                tar.add(pack_absolute_path, arcname=PACK_NAME)
-            tar.add(env_yaml_path, arcname=ENV_YAML_NAME)
-            tar.add(env_history_yaml_path, arcname=ENV_FROM_HISTORY_YAML_NAME)
-            tar.add(explicit_packages_path, arcname=EXPLICIT_PACKAGES_NAME)
-            tar.add(requirements_path, arcname=REQUIREMENTS_NAME)
+            yield tar
+
+
+def read_archive_index(input_filename):
+    """
+    Returns the map of file names to their index entries, or None if the archive was
+    created without an index
+    """
+    compression = archive_compression(input_filename)
+    with open(input_filename, "rb") as f:
+        index_offset = read_footer(f)
+        if index_offset is None:
+            return None
+        f.seek(index_offset)
+        with tarfile.open(fileobj=DecompressedStream(f, compression), mode="r|") as tar:
+            member = tar.next()
+            if member is None or member.name != INDEX_NAME:
+                return None
+            index = json.load(tar.extractfile(member))
+    return {
+        name: dict(zip(index["fields"], entry))
+        for name, entry in index["members"].items()
+    }
+
 
+@contextmanager
+def open_archive_member(input_filename, name, index=None):
+    """
+    Opens a file of the archive for reading. If the archive has an index, only the compressed
+    member that contains the file is decompressed, otherwise the archive is scanned for it.
+    """
+    compression = archive_compression(input_filename)
+    if index is None:
+        index = read_archive_index(input_filename) or {}
+    entry = index.get(name)
+    with open(input_filename, "rb") as f:
+        stream = DecompressedStream(f, compression)
+        if entry is not None:
+            f.seek(entry["member_offset"])
+            stream.skip(entry["offset"] - entry["member_start"])
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if member.name == name:
+                    yield tar.extractfile(member)
+                    return
+    raise ResolosException(f"File {name} was not found in archive {input_filename}")
 
-def members_in_subfolder(tar, folder):
-    pattern = f"{folder}/"
-    l = len(pattern)
-    for member in tar.getmembers():
-        if member.path.startswith(pattern):
-            member.path = member.path[l:]
-            yield member
 
+def extract_members(tar, folders: dict, files: dict):
+    """
+    Extracts the archive in a single pass over its members. The contents of the top-level
+    folders in folders are extracted to their destination, the top-level files in files
+    to their destination folder, other members are skipped.
+    Returns the names of all members.
+    """
+    names = []
+    for member in tar:
+        folder, sep, path = member.name.partition("/")
+        if sep and path and folder in folders:
+            member.name = path
+            # Like extractall, do not apply the permissions of folders, as read-only
+            # folders would block extracting their contents
+            tar.extract(member, path=folders[folder], set_attrs=not member.isdir())
+        elif member.name in files:
+            tar.extract(member, path=files[member.name])
+        names.append(member.name)
+    return names
 
-def extract_subfolder(tar, subfolder: str, path: str = "."):
-    tar.extractall(path=path, members=members_in_subfolder(tar, subfolder))
 
+def extract_tarball(fileobj, path):
+    """Extracts a tarball, like the conda-pack one, from a stream straight into path"""
+    os.makedirs(path, exist_ok=True)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        tar.extractall(path)
 
-def extract_file(tar, file: str, path: str = ""):
-    tar.extract(file, path=path)
+
+def extract_pack(input_filename, path):
+    """
+    Extracts the conda-pack tarball stored in the archive straight into path, without
+    extracting the tarball itself to disk first
+    """
+    with open_archive_member(input_filename, PACK_NAME) as pack:
+        extract_tarball(pack, path)
+
+
+def restore_snapshot(store: ChunkStore, manifest: dict, folders: dict, files: dict):
+    """
+    Restores the files of a snapshot from the chunk store, routed like extract_members.
+    Returns the names of all entries.
+    """
+    for entry in manifest["entries"]:
+        if os.path.isabs(entry["name"]) or ".." in Path(entry["name"]).parts:
+            raise ResolosException(f"Invalid path '{entry['name']}' in snapshot")
+    names = []
+    for entry in manifest["entries"]:
+        folder, sep, path = entry["name"].partition("/")
+        if sep and path and folder in folders:
+            target = os.path.join(folders[folder], path)
+        elif entry["name"] in files:
+            target = os.path.join(files[entry["name"]], entry["name"])
+        else:
+            names.append(entry["name"])
+            continue
+        if entry["type"] == "dir":
+            os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if entry["type"] == "symlink":
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(entry["target"], target)
+            else:
+                store.write_file(entry["chunks"], target)
+                os.chmod(target, entry["mode"])
+                os.utime(target, (entry["mtime"], entry["mtime"]))
+        names.append(entry["name"])
+    return names
+
+
+def extraction_routes(files_path, tmpdirname):
+    """
+    Returns where the folders and the files of an archive are extracted to, the conda-pack
+    tarball is left in the archive until it is needed
+    """
+    folders = {
+        FILES_NAME: str(files_path.absolute()),
+        RESOLOS_FOLDER_NAME: f"{tmpdirname}/{RESOLOS_FOLDER_NAME}",
+    }
+    files = {
+        name: tmpdirname
+        for name in [
+            ENV_YAML_NAME,
+            ENV_FROM_HISTORY_YAML_NAME,
+            EXPLICIT_PACKAGES_NAME,
+            REQUIREMENTS_NAME,
+        ]
+    }
+    return folders, files
 
 
 def clean_folder(folder_path):
@@ -221,133 +627,173 @@ def install_pip_packages(
 
 
 def load_archive_file(input_filename: str, files_path):
+    new_env_name = f"resolos_env_{randomString()}"
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with open_archive(input_filename) as tar:
+            if TAR_HEADER_RESOLOS_VERSION not in tar.pax_headers:
+                raise NotAResolosArchiveError(
+                    f"{input_filename} is not an archive created by resolos."
+                )
+            clog.info(f"Loading archive to new conda env [{new_env_name}]...")
+            resolos_version = tar.pax_headers[TAR_HEADER_RESOLOS_VERSION]
+            created_on = tar.pax_headers[TAR_HEADER_CREATED_ON]
+            compression = tar.pax_headers.get(TAR_HEADER_COMPRESSION, GzipCodec.name)
+            clog.debug(
+                f"Archive created by resolos version {resolos_version} on {created_on}, "
+                f"compressed with {compression}"
+            )
+            clean_folder(files_path)
+            # All members are extracted while the archive is decompressed once, except the
+            # conda-pack tarball which is only read through the index if it is needed
+            member_names = extract_members(
+                tar, *extraction_routes(files_path, tmpdirname)
+            )
+        if PACK_NAME in member_names:
+            load_pack = lambda path: extract_pack(input_filename, path)
+        else:
+            load_pack = None
+        load_extracted_archive(tmpdirname, new_env_name, resolos_version, load_pack)
+
+
+def load_archive_snapshot(store_path: str, snapshot_id, files_path):
+    store = ChunkStore(store_path)
+    manifest = store.read_manifest(snapshot_id)
+    new_env_name = f"resolos_env_{randomString()}"
+    clog.info(
+        f"Loading snapshot '{manifest['snapshot_id']}' to new conda env [{new_env_name}]..."
+    )
+    resolos_version = manifest[TAR_HEADER_RESOLOS_VERSION]
+    clog.debug(
+        f"Snapshot created by resolos version {resolos_version} on {manifest[TAR_HEADER_CREATED_ON]}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        clean_folder(files_path)
+        restore_snapshot(store, manifest, *extraction_routes(files_path, tmpdirname))
+        load_pack = None
+        pack = [e for e in manifest["entries"] if e["name"] == PACK_NAME]
+        if pack:
+            load_pack = lambda path: extract_tarball(
+                store.open_file(pack[0]["chunks"]), path
+            )
+        load_extracted_archive(tmpdirname, new_env_name, resolos_version, load_pack)
+
+
+def load_extracted_archive(
+    tmpdirname: str, new_env_name: str, resolos_version: str, load_pack=None
+):
+    """
+    Creates the environment of the project from the files extracted from an archive to
+    tmpdirname. If the archive has a conda pack, load_pack(path) extracts it to path.
+    """
     pdc = get_project_dict_config()
     project_settings = pdc.read()
     old_env_name = project_settings.get("env_name")
-    new_env_name = f"resolos_env_{randomString()}"
-    with tarfile.open(input_filename, "r:gz", format=tarfile.PAX_FORMAT) as tar:
-        if TAR_HEADER_RESOLOS_VERSION not in tar.pax_headers:
-            raise NotAResolosArchiveError(
-                f"{input_filename} is not an archive created by resolos."
+    env_yaml_path = f"{tmpdirname}/{ENV_YAML_NAME}"
+    env_history_yaml_path = f"{tmpdirname}/{ENV_FROM_HISTORY_YAML_NAME}"
+    explicit_packages_path = f"{tmpdirname}/{EXPLICIT_PACKAGES_NAME}"
+    requirements_path = f"{tmpdirname}/{REQUIREMENTS_NAME}"
+    resolos_path = f"{tmpdirname}/{RESOLOS_FOLDER_NAME}"
+    apdc = DictConfig(f"{resolos_path}/config.yaml")
+    archive_settings = apdc.read()
+    create_conda_env_local(new_env_name)
+    if (
+        archive_settings.get("platform") == get_user_platform()
+        and archive_settings.get("arch") == get_arch()
+    ):
+        try:
+            clog.info(
+                f"Archive was created on the same platform ({get_user_platform()}) "
+                f"and architecture ({get_arch()}) "
+                f"as the current machine, will try to use the explicit packages "
+                f"list to load the environment"
             )
-        clog.info(f"Loading archive to new conda env [{new_env_name}]...")
-        resolos_version = tar.pax_headers[TAR_HEADER_RESOLOS_VERSION]
-        created_on = tar.pax_headers[TAR_HEADER_CREATED_ON]
-        clog.debug(
-            f"Archive created by resolos version {resolos_version} on {created_on}"
-        )
-        clean_folder(files_path)
-        extract_subfolder(tar, "files", path=str(files_path.absolute()))
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            pack_absolute_path = f"{tmpdirname}/{PACK_NAME}"
-            env_yaml_path = f"{tmpdirname}/{ENV_YAML_NAME}"
-            env_history_yaml_path = f"{tmpdirname}/{ENV_FROM_HISTORY_YAML_NAME}"
-            explicit_packages_path = f"{tmpdirname}/{EXPLICIT_PACKAGES_NAME}"
-            requirements_path = f"{tmpdirname}/{REQUIREMENTS_NAME}"
-            resolos_path = f"{tmpdirname}/{RESOLOS_FOLDER_NAME}"
-            extract_file(tar, ENV_YAML_NAME, tmpdirname)
-            extract_file(tar, ENV_FROM_HISTORY_YAML_NAME, tmpdirname)
-            extract_file(tar, EXPLICIT_PACKAGES_NAME, tmpdirname)
-            extract_file(tar, REQUIREMENTS_NAME, tmpdirname)
-            extract_subfolder(tar, RESOLOS_FOLDER_NAME, path=resolos_path)
-            apdc = DictConfig(f"{resolos_path}/config.yaml")
-            archive_settings = apdc.read()
-            create_conda_env_local(new_env_name)
-            if (
-                archive_settings.get("platform") == get_user_platform()
-                and archive_settings.get("arch") == get_arch()
-            ):
-                try:
-                    clog.info(
-                        f"Archive was created on the same platform ({get_user_platform()}) "
-                        f"and architecture ({get_arch()}) "
-                        f"as the current machine, will try to use the explicit packages "
-                        f"list to load the environment"
-                    )
-                    execute_local_conda_command(
-                        f"install -y --name {new_env_name} --file {explicit_packages_path}"
-                    )
-                    install_pip_packages(
-                        new_env_name, requirements_path, resolos_version
-                    )
-                    project_settings["env_name"] = new_env_name
-                    if old_env_name:
-                        execute_local_conda_command(
-                            f"remove -y --name {old_env_name} --all"
-                        )
-                    pdc.write(project_settings)
-                except Exception as ex:
-                    clog.warning(
-                        "Failed to load conda env using explicit packages list"
-                    )
-                    if Path(pack_absolute_path).exists():
-                        clog.info(f"Loading conda env from conda-pack archive...")
-                        clog.debug(f"The error was:\n\n{ex}\n\n")
-                        extract_file(tar, PACK_NAME, pack_absolute_path)
-                        run_shell_cmd(
-                            f"mkdir -p ~/.resolos/envs/{new_env_name} && "
-                            f"tar -xzf {pack_absolute_path} -C ~/.resolos/envs/{new_env_name} && "
-                            f"source ~/.resolos/envs/{new_env_name}/bin/activate && "
-                            f"conda-unpack",
-                        )
-                    else:
-                        clog.info(
-                            "Conda environment was not packed in the archive, will try the explicitly installed packages list"
-                        )
-                        execute_local_conda_command(
-                            f"env update -n {new_env_name} -f {env_history_yaml_path}"
-                        )
-                    install_pip_packages(
-                        new_env_name, requirements_path, resolos_version
-                    )
-                    project_settings[
-                        "env_name"
-                    ] = f"source ~/.resolos/envs/{new_env_name}/bin/activate"
-                    pdc.write(project_settings)
+            execute_local_conda_command(
+                f"install -y --name {new_env_name} --file {explicit_packages_path}"
+            )
+            install_pip_packages(new_env_name, requirements_path, resolos_version)
+            project_settings["env_name"] = new_env_name
+            if old_env_name:
+                execute_local_conda_command(f"remove -y --name {old_env_name} --all")
+            pdc.write(project_settings)
+        except Exception as ex:
+            clog.warning("Failed to load conda env using explicit packages list")
+            if load_pack is not None:
+                clog.info(f"Loading conda env from conda-pack archive...")
+                clog.debug(f"The error was:\n\n{ex}\n\n")
+                load_pack(os.path.expanduser(f"~/.resolos/envs/{new_env_name}"))
+                run_shell_cmd(
+                    f"source ~/.resolos/envs/{new_env_name}/bin/activate && "
+                    f"conda-unpack",
+                )
             else:
-                try:
-                    clog.info(
-                        f"Archive was created on a different platform/architecture "
-                        f"({project_settings.get('platform')}/{project_settings.get('arch')}) "
-                        f"as the current machine's platform/architecture ({get_user_platform()}/{get_arch()}) "
-                        f", will try to use the conda environment file"
-                    )
-                    execute_local_conda_command(
-                        f"env update -n {new_env_name} -f {env_yaml_path}"
-                    )
-                    install_pip_packages(
-                        new_env_name, requirements_path, resolos_version
-                    )
-                    project_settings["env_name"] = new_env_name
-                    if old_env_name:
-                        execute_local_conda_command(
-                            f"remove -y --name {old_env_name} --all"
-                        )
-                    pdc.write(project_settings)
-                except Exception as ex:
-                    clog.info(
-                        f"Failed to load conda env using environment file, "
-                        f"will try  to install now only the explicitly installed packages"
-                    )
-                    clog.debug(f"The error was:\n\n{ex}\n\n")
-                    execute_local_conda_command(
-                        f"env update -n {new_env_name} -f {env_history_yaml_path}"
-                    )
-                    install_pip_packages(
-                        new_env_name, requirements_path, resolos_version
-                    )
-                    project_settings["env_name"] = new_env_name
-                    if old_env_name:
-                        execute_local_conda_command(
-                            f"remove -y --name {old_env_name} --all"
-                        )
-                    pdc.write(project_settings)
+                clog.info(
+                    "Conda environment was not packed in the archive, will try the explicitly installed packages list"
+                )
+                execute_local_conda_command(
+                    f"env update -n {new_env_name} -f {env_history_yaml_path}"
+                )
+            install_pip_packages(new_env_name, requirements_path, resolos_version)
+            project_settings[
+                "env_name"
+            ] = f"source ~/.resolos/envs/{new_env_name}/bin/activate"
+            pdc.write(project_settings)
+    else:
+        try:
+            clog.info(
+                f"Archive was created on a different platform/architecture "
+                f"({project_settings.get('platform')}/{project_settings.get('arch')}) "
+                f"as the current machine's platform/architecture ({get_user_platform()}/{get_arch()}) "
+                f", will try to use the conda environment file"
+            )
+            execute_local_conda_command(
+                f"env update -n {new_env_name} -f {env_yaml_path}"
+            )
+            install_pip_packages(new_env_name, requirements_path, resolos_version)
+            project_settings["env_name"] = new_env_name
+            if old_env_name:
+                execute_local_conda_command(f"remove -y --name {old_env_name} --all")
+            pdc.write(project_settings)
+        except Exception as ex:
+            clog.info(
+                f"Failed to load conda env using environment file, "
+                f"will try  to install now only the explicitly installed packages"
+            )
+            clog.debug(f"The error was:\n\n{ex}\n\n")
+            execute_local_conda_command(
+                f"env update -n {new_env_name} -f {env_history_yaml_path}"
+            )
+            install_pip_packages(new_env_name, requirements_path, resolos_version)
+            project_settings["env_name"] = new_env_name
+            if old_env_name:
+                execute_local_conda_command(f"remove -y --name {old_env_name} --all")
+            pdc.write(project_settings)
+
+
+def archive_status(**kwargs):
+    base_url = get_option(kwargs, "base_url", f"No Yareta base url was found")
+    access_token = get_option(kwargs, "access_token", f"No access token was found")
+    deposit_id = get_option(
+        kwargs, "deposit_id", "Missing required option: --deposit-id"
+    )
+    return submit_deposit(deposit_id, access_token, base_url, wait=kwargs.get("wait"))
+
+
+def download_target(source: str):
+    """
+    Returns the path to download an archive to. The path only depends on the source,
+    so that an interrupted download is resumed, and a finished one reused, the next time
+    the archive is loaded.
+    """
+    downloads_dir = get_downloads_dir()
+    downloads_dir.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    return str(downloads_dir / f"{name}.archive")
 
 
 def load_archive(**kwargs):
     verify_mutually_exclusive_options(
-        ["url", "filename", "deposit_id"],
-        ["--url", "--filename", "--deposit-id"],
+        ["url", "filename", "deposit_id", "store"],
+        ["--url", "--filename", "--deposit-id", "--store"],
         **kwargs,
     )
     project_dir = find_project_dir()
@@ -367,13 +813,31 @@ def load_archive(**kwargs):
                     f"the only supported ones are: {SUPPORTED_REMOTE_PROTOCOLS}"
                 )
             clog.info(f"Downloading archive '{url}'...")
-            with urllib.request.urlopen(url) as response:
-                with tempfile.NamedTemporaryFile(delete=True) as arch_file:
-                    shutil.copyfileobj(response, arch_file)
-                    load_archive_file(arch_file.name, project_dir)
-                    clog.info(
-                        f"Successfully loaded archive '{url}' into project '{project_dir.absolute()}'"
-                    )
+            if url.startswith("http"):
+                from .download import download, discard_download
+
+                arch_filename = download_target(url)
+                download(url, arch_filename, checksum=kwargs.get("checksum"))
+                # The download is kept if the load fails, so that the next attempt reuses it
+                load_archive_file(arch_filename, project_dir)
+                discard_download(arch_filename)
+                clog.info(
+                    f"Successfully loaded archive '{url}' into project '{project_dir.absolute()}'"
+                )
+            else:
+                with urllib.request.urlopen(url) as response:
+                    with tempfile.NamedTemporaryFile(delete=True) as arch_file:
+                        shutil.copyfileobj(response, arch_file)
+                        load_archive_file(arch_file.name, project_dir)
+                        clog.info(
+                            f"Successfully loaded archive '{url}' into project '{project_dir.absolute()}'"
+                        )
+        elif kwargs.get("store"):
+            store_path = kwargs.get("store")
+            load_archive_snapshot(store_path, kwargs.get("snapshot"), project_dir)
+            clog.info(
+                f"Successfully loaded snapshot from store '{store_path}' into project '{project_dir.absolute()}'"
+            )
         elif kwargs.get("filename"):
             input_filename = get_option(
                 kwargs, "filename", "Missing required option: --filename"
@@ -390,13 +854,16 @@ def load_archive(**kwargs):
             deposit_id = get_option(
                 kwargs, "deposit_id", "Missing required option: --deposit-id"
             )
-            with tempfile.NamedTemporaryFile(delete=True) as arch_file:
-                download_archive(
-                    arch_file.name, ARCHIVE_FILENAME, deposit_id, access_token, base_url
-                )
-                load_archive_file(arch_file.name, project_dir)
-                clog.info(
-                    f"Successfully loaded archive from Yareta deposit '{deposit_id}' into project '{project_dir.absolute()}'"
-                )
+            from .download import discard_download
+
+            arch_filename = download_target(f"{base_url}/{deposit_id}")
+            download_archive(
+                arch_filename, ARCHIVE_FILENAME, deposit_id, access_token, base_url
+            )
+            load_archive_file(arch_filename, project_dir)
+            discard_download(arch_filename)
+            clog.info(
+                f"Successfully loaded archive from Yareta deposit '{deposit_id}' into project '{project_dir.absolute()}'"
+            )
         else:
             raise ResolosException(f"Missing source specification")
@@ -0,0 +1,172 @@
+from .logging import clog
+from .config import read_project_remote_config, write_project_remote_config
+from .platform import in_resolos_dir
+from .shell import run_ssh_cmd, conda_load_prefix
+from .exception import RemoteCommandError
+from datetime import datetime
+import json
+import shlex
+
+# Seconds the capabilities probed on a remote are reused for before probing it again
+CAPABILITIES_TTL = 3600
+PROBE_MARKER = "resolos-probe"
+
+# Capabilities probed by this process, by remote connection settings. Outside of projects
+# this is the only cache, inside projects they are also stored in the project remote config.
+probed_capabilities = {}
+
+
+def remote_key(remote_settings):
+    return tuple(
+        remote_settings.get(key)
+        for key in [
+            "hostname",
+            "port",
+            "username",
+            "conda_load_command",
+            "unison_path",
+        ]
+    )
+
+
+def shell_path(path):
+    """Quotes a remote path for the shell, keeping ~/ expandable"""
+    if path.startswith("~/"):
+        return f'"$HOME"/{shlex.quote(path[2:])}'
+    return shlex.quote(path)
+
+
+def probe_command(remote_settings, env_name=None, files_path=None):
+    """
+    Command printing a JSON object of the capabilities of the remote on a single line,
+    after PROBE_MARKER. Checks that fail leave their field empty.
+    """
+    checks = {
+        "conda": "conda --version",
+        "unison": f"{remote_settings['unison_path']} -version",
+        "bash": 'echo "$BASH_VERSION"',
+        "sbatch": "command -v sbatch",
+        "squeue": "command -v squeue",
+    }
+    if env_name is not None:
+        if env_name.startswith("source "):
+            activate = env_name[len("source ") :]
+            checks["env_prefix"] = (
+                f"test -f {activate} && cd $(dirname {activate})/.. && pwd"
+            )
+        else:
+            checks["env_prefix"] = (
+                f"conda env list | awk '$1 == \"{env_name}\" {{print $NF}}'"
+            )
+    if files_path is not None:
+        # The project folder might not exist yet, the space is checked on its closest parent
+        checks["free_space"] = (
+            f"p={shell_path(files_path)}; "
+            f'while [ ! -e "$p" ]; do p=$(dirname "$p"); done; '
+            f"df -Pk \"$p\" | tail -n 1 | awk '{{print $4}}'"
+        )
+        checks["quota"] = "quota -s | tail -n 1"
+    fields = ", ".join(f'\\"{name}\\": \\"%s\\"' for name in checks)
+    values = " ".join(
+        f'"$( ({cmd}) 2>/dev/null | probe_value)"' for cmd in checks.values()
+    )
+    # The checks run even if loading conda fails, so that its absence is reported too
+    return (
+        f"{conda_load_prefix(remote_settings)}true; "
+        f"probe_value() {{ head -n 1 | tr -d '\\r' | sed -e 's/[\\\\\"]/\\\\&/g' -e 's/\\t/ /g'; }}; "
+        f'printf "{PROBE_MARKER} {{{fields}}}\\n" {values}'
+    )
+
+
+def parse_probe_output(output):
+    for line in output.splitlines():
+        if line.startswith(f"{PROBE_MARKER} "):
+            try:
+                values = json.loads(line[len(PROBE_MARKER) + 1 :])
+            except ValueError:
+                continue
+            return {name: value.strip() or None for name, value in values.items()}
+    return None
+
+
+def probe_remote(remote_settings, env_name=None, files_path=None):
+    """
+    Finds the conda, unison and bash versions, the scheduler, the prefix of env_name and
+    the free space under files_path on the remote with a single command
+    """
+    ret_val, output = run_ssh_cmd(
+        remote_settings, probe_command(remote_settings, env_name, files_path)
+    )
+    values = parse_probe_output(output)
+    if ret_val != 0 or values is None:
+        raise RemoteCommandError(
+            f"Could not probe the capabilities of remote '{remote_settings.get('name')}', "
+            f"the error was:\n\n{output}\n\n"
+        )
+    free_space = values.get("free_space")
+    return {
+        "probed_at": datetime.utcnow(),
+        "conda_version": values.get("conda"),
+        "unison_version": values.get("unison"),
+        "bash_version": values.get("bash"),
+        "scheduler": "slurm" if values.get("sbatch") and values.get("squeue") else None,
+        "env_name": env_name,
+        "env_prefix": values.get("env_prefix") if env_name is not None else None,
+        "files_path": files_path,
+        # df reports the available space in KiB
+        "free_space": (
+            int(free_space) * 1024 if free_space and free_space.isdigit() else None
+        ),
+        "quota": values.get("quota"),
+    }
+
+
+def project_remote_config(remote_settings):
+    remote_id = remote_settings.get("name")
+    if remote_id is None or not in_resolos_dir():
+        return None
+    return read_project_remote_config(remote_id)
+
+
+def capabilities_valid(capabilities, env_name=None):
+    if not capabilities or capabilities.get("probed_at") is None:
+        return False
+    age = (datetime.utcnow() - capabilities["probed_at"]).total_seconds()
+    if age < 0 or age > CAPABILITIES_TTL:
+        return False
+    return env_name is None or capabilities.get("env_name") == env_name
+
+
+def remote_capabilities(remote_settings, env_name=None, refresh=False):
+    """
+    Returns the capabilities of the remote, probing it only if they were not probed in the
+    last CAPABILITIES_TTL seconds, or for another environment, or if refresh is set
+    """
+    key = remote_key(remote_settings)
+    capabilities = probed_capabilities.get(key)
+    prc = project_remote_config(remote_settings)
+    if capabilities is None and prc is not None:
+        capabilities = prc.get("capabilities")
+    if not refresh and capabilities_valid(capabilities, env_name):
+        return capabilities
+    if env_name is None and capabilities:
+        # Keep track of the environment probed before
+        env_name = capabilities.get("env_name")
+    if env_name is None and prc is not None:
+        env_name = prc.get("env_name")
+    files_path = prc.get("files_path") if prc is not None else None
+    clog.debug(f"Probing the capabilities of remote '{remote_settings.get('name')}'...")
+    capabilities = probe_remote(remote_settings, env_name, files_path)
+    probed_capabilities[key] = capabilities
+    if prc is not None:
+        write_project_remote_config(
+            remote_settings["name"], {"capabilities": capabilities}
+        )
+    return capabilities
+
+
+def forget_remote_capabilities(remote_settings):
+    """Invalidates the capabilities of the remote after something was installed or removed"""
+    probed_capabilities.pop(remote_key(remote_settings), None)
+    if project_remote_config(remote_settings) is not None:
+        write_project_remote_config(remote_settings["name"], {"capabilities": None})
@@ -10,13 +10,16 @@ from .unison import (
     check_unison_connection,
     install_unison_remote,
 )
-from .config import get_global_dict_config
+from .config import get_global_dict_config, BASH_MIN_VERSION, ver_re
+from .capabilities import remote_capabilities
 from .platform import in_resolos_dir
-from .remote import read_remote_db, list_remote_ids, get_remote
+from .remote import read_remote_db, get_remote
+from .fanout import run_on_remotes, list_remotes, report_results
 from .exception import MissingDependency, ShellError
 from .shell import run_ssh_cmd, run_shell_cmd, check_bash_version_local
 import click
 from platform import node
+from semver import VersionInfo
 import pathlib
 import os
 
@@ -31,7 +34,8 @@ def check_target(target=None, raise_on_error=False, no_confirm=False):
         clog.info(f"PASS - Unison is installed locally")
     else:
         try:
-            check_conda_installed_remote(target)
+            # Checks probe the remote again, the following checks reuse the fresh results
+            check_conda_installed_remote(target, refresh=True)
             clog.info(f"PASS - Conda is installed on remote '{target['name']}'")
         except MissingDependency as ex:
             if raise_on_error:
@@ -54,17 +58,70 @@ def check_target(target=None, raise_on_error=False, no_confirm=False):
                 default=True,
             ):
                 install_unison_remote(target)
+        report_remote_capabilities(target)
+
+
+def report_remote_capabilities(target):
+    """Reports the bash version, scheduler and free space found by the last probe of the remote"""
+    capabilities = remote_capabilities(target)
+    m = ver_re.search(capabilities.get("bash_version") or "")
+    if m is None:
+        clog.warning(
+            f"Could not determine the bash version on remote '{target['name']}', "
+            f"resolos might not function correctly"
+        )
+    elif VersionInfo.parse(m.group()) < BASH_MIN_VERSION:
+        clog.warning(
+            f"Resolos requires a minimum bash version {BASH_MIN_VERSION}, while remote "
+            f"'{target['name']}' has version {m.group()}"
+        )
+    else:
+        clog.info(f"PASS - Bash {m.group()} is installed on remote '{target['name']}'")
+    if capabilities.get("scheduler") is None:
+        clog.warning(
+            f"No job scheduler was found on remote '{target['name']}', "
+            f"jobs cannot be submitted to it"
+        )
+    else:
+        clog.info(
+            f"PASS - Scheduler {capabilities['scheduler']} is available on remote '{target['name']}'"
+        )
+    if capabilities.get("free_space") is not None:
+        clog.info(
+            f"Free space under {capabilities['files_path']} on remote '{target['name']}': "
+            f"{capabilities['free_space'] / (1024 ** 3):.1f} GiB"
+        )
+    if capabilities.get("quota"):
+        clog.info(f"Quota on remote '{target['name']}': {capabilities['quota']}")
+
+
+def check_remote(remote_settings, raise_on_error=False):
+    check_target(remote_settings, raise_on_error=raise_on_error)
+    if in_resolos_dir():
+        check_unison_connection(remote_settings)
 
 
 def check(raise_on_error=False):
     check_target(raise_on_error=raise_on_error)
     db = read_remote_db()
-    for remote_id in list_remote_ids(db):
-        clog.info(f"Checking remote '{remote_id}'")
-        remote_settings = get_remote(db, remote_id)
-        check_target(remote_settings, raise_on_error=raise_on_error)
-        if in_resolos_dir():
-            check_unison_connection(remote_settings)
+    remotes = list_remotes(db)
+    if not remotes:
+        return
+    clog.info(f"Checking remotes {', '.join(r['name'] for r in remotes)}")
+    results = run_on_remotes(check_remote, remotes, raise_on_error=True)
+    if not raise_on_error:
+        # Offering to install the missing dependencies needs the terminal, so the remotes
+        # with missing dependencies are checked again one at a time
+        for remote_id, (success, ex) in results.items():
+            if success or not isinstance(ex, MissingDependency):
+                continue
+            clog.info(f"Checking remote '{remote_id}'")
+            try:
+                check_remote(get_remote(db, remote_id))
+                results[remote_id] = (True, None)
+            except Exception as ex:
+                results[remote_id] = (False, ex)
+    report_results(results, "Checks")
 
 
 def setup_ssh(remote_settings):
@@ -0,0 +1,138 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from datetime import datetime
+from pathlib import Path
+from .exception import ResolosException
+
+# Files are split into chunks of this size, so that unchanged parts of a file which was
+# appended to or partially rewritten are stored only once
+CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_COMPRESSION_LEVEL = 6
+MANIFEST_VERSION = 1
+
+
+def chunk_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkStore(object):
+    """
+    Folder of file chunks stored by the sha256 hash of their contents, and of the manifests
+    of the snapshots made to it. A manifest lists the files of a snapshot with the hashes
+    of their chunks. Chunks that are in the store already are not written again, so each
+    snapshot of a project only adds the chunks that changed since the previous ones.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.chunks_dir = self.path / "chunks"
+        self.manifests_dir = self.path / "manifests"
+        self.written_chunks = 0
+        self.written_bytes = 0
+        self.lock = threading.Lock()
+
+    def chunk_path(self, digest):
+        return self.chunks_dir / digest[:2] / digest
+
+    def put_chunk(self, data):
+        digest = chunk_digest(data)
+        path = self.chunk_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Chunks are renamed into place, so an interrupted write leaves no broken chunk
+            tmp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}")
+            tmp_path.write_bytes(zlib.compress(data, CHUNK_COMPRESSION_LEVEL))
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.written_chunks += 1
+                self.written_bytes += len(data)
+        return digest
+
+    def get_chunk(self, digest):
+        path = self.chunk_path(digest)
+        if not path.exists():
+            raise ResolosException(f"Chunk {digest} is missing from store {self.path}")
+        data = zlib.decompress(path.read_bytes())
+        if chunk_digest(data) != digest:
+            raise ResolosException(f"Chunk {digest} of store {self.path} is corrupted")
+        return data
+
+    def put_file(self, path):
+        """Stores the chunks of a file, returns the list of their hashes"""
+        chunks = []
+        with open(path, "rb") as f:
+            for data in iter(lambda: f.read(CHUNK_SIZE), b""):
+                chunks.append(self.put_chunk(data))
+        return chunks
+
+    def open_file(self, chunks):
+        return ChunkReader(self, chunks)
+
+    def write_file(self, chunks, target_path):
+        with open(target_path, "wb") as f:
+            for digest in chunks:
+                f.write(self.get_chunk(digest))
+
+    def snapshots(self):
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(p.stem for p in self.manifests_dir.glob("*.json"))
+
+    def write_manifest(self, manifest: dict):
+        """Writes the manifest of a new snapshot, returns the id of the snapshot"""
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        snapshot_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        manifest = dict(manifest, version=MANIFEST_VERSION, snapshot_id=snapshot_id)
+        tmp_path = self.manifests_dir / f".{snapshot_id}.json"
+        tmp_path.write_text(json.dumps(manifest))
+        os.replace(tmp_path, self.manifests_dir / f"{snapshot_id}.json")
+        return snapshot_id
+
+    def read_manifest(self, snapshot_id=None):
+        """Returns the manifest of the snapshot, or of the latest snapshot if no id is given"""
+        if snapshot_id is None:
+            snapshots = self.snapshots()
+            if not snapshots:
+                raise ResolosException(f"There are no snapshots in store {self.path}")
+            snapshot_id = snapshots[-1]
+        path = self.manifests_dir / f"{snapshot_id}.json"
+        if not path.exists():
+            raise ResolosException(
+                f"Snapshot '{snapshot_id}' was not found in store {self.path}"
+            )
+        manifest = json.loads(path.read_text())
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ResolosException(
+                f"Snapshot '{snapshot_id}' has unsupported manifest version {manifest.get('version')}"
+            )
+        return manifest
+
+
+class ChunkReader(object):
+    """Read-only file object over the chunks of a stored file"""
+
+    def __init__(self, store, chunks):
+        self.store = store
+        self.chunks = list(chunks)
+        self.buffer = b""
+        self.position = 0
+
+    def read(self, size=-1):
+        parts = []
+        remaining = None if size is None or size < 0 else size
+        while remaining is None or remaining > 0:
+            if self.position >= len(self.buffer):
+                if not self.chunks:
+                    break
+                self.buffer = self.store.get_chunk(self.chunks.pop(0))
+                self.position = 0
+            end = len(self.buffer)
+            if remaining is not None:
+                end = min(end, self.position + remaining)
+                remaining -= end - self.position
+            parts.append(self.buffer[self.position : end])
+            self.position = end
+        return b"".join(parts)
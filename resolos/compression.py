@@ -0,0 +1,342 @@
+import os
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .exception import MissingDependency, ResolosException
+
+# Compression level of the members that hold data which is compressed already
+STORE_LEVEL = 0
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_ZSTD_LEVEL = 3
+# Zstd has no store mode, but its fastest levels emit raw blocks for incompressible data
+ZSTD_STORE_LEVEL = 1
+# Size of the blocks that parallel gzip compresses independently
+PARALLEL_GZIP_BLOCK_SIZE = 1024 * 1024
+DEFAULT_CODEC = "pgzip"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Size of the compressed chunks read at once when decompressing
+READ_CHUNK_SIZE = 64 * 1024
+
+# The footer is an empty gzip member, or a zstd skippable frame, at the end of an archive.
+# It holds the compressed offset of the member with the archive index.
+GZIP_FOOTER_SUBFIELD = b"RI"
+# ID1 ID2 CM FLG(FEXTRA) MTIME XFL OS XLEN, then the subfield ID, length and offset
+GZIP_FOOTER_HEADER = struct.Struct("<2sBBIBBH2sHQ")
+# Deflate stream of an empty input, followed by its CRC32 and size
+GZIP_FOOTER_TRAILER = b"\x03\x00" + struct.pack("<II", 0, 0)
+GZIP_FOOTER_SIZE = GZIP_FOOTER_HEADER.size + len(GZIP_FOOTER_TRAILER)
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_FOOTER_ID = b"RIDX"
+ZSTD_FOOTER = struct.Struct("<II4sQ")
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise MissingDependency(
+            "The zstd compression needs the 'zstandard' package, "
+            "please install it with 'pip install resolos[zstd]'"
+        )
+    return zstandard
+
+
+def default_threads():
+    return os.cpu_count() or 1
+
+
+class GzipCodec(object):
+    """
+    Compresses each member of a stream into a separate gzip member. Concatenated gzip
+    members form a valid gzip file, so the output can be read with 'tar -xzf' or
+    tarfile's 'r:gz' mode.
+    """
+
+    name = "gzip"
+
+    def __init__(self, level=DEFAULT_GZIP_LEVEL):
+        self.level = level
+
+    def compressobj(self, store=False):
+        level = STORE_LEVEL if store else self.level
+        # wbits=31 writes the gzip header and trailer around the deflate stream
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def footer(self, index_offset):
+        return (
+            GZIP_FOOTER_HEADER.pack(
+                GZIP_MAGIC,
+                zlib.DEFLATED,
+                4,
+                0,
+                0,
+                255,
+                12,
+                GZIP_FOOTER_SUBFIELD,
+                8,
+                index_offset,
+            )
+            + GZIP_FOOTER_TRAILER
+        )
+
+    def close(self):
+        pass
+
+
+def gzip_member(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipCompressor(object):
+    """
+    Splits the data into blocks and compresses each block into a separate gzip member on a
+    thread pool, like pigz. The compressed blocks are returned in order.
+    """
+
+    def __init__(self, executor, level, threads, block_size=PARALLEL_GZIP_BLOCK_SIZE):
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        # Limits the memory used by blocks waiting to be written
+        self.max_pending = 2 * threads
+        self.buffer = bytearray()
+        self.pending = deque()
+
+    def compress(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[: self.block_size])
+            del self.buffer[: self.block_size]
+            self.pending.append(self.executor.submit(gzip_member, block, self.level))
+        output = []
+        while self.pending and (
+            self.pending[0].done() or len(self.pending) > self.max_pending
+        ):
+            output.append(self.pending.popleft().result())
+        return b"".join(output)
+
+    def flush(self):
+        if self.buffer:
+            self.pending.append(
+                self.executor.submit(gzip_member, bytes(self.buffer), self.level)
+            )
+            self.buffer = bytearray()
+        output = [future.result() for future in self.pending]
+        self.pending.clear()
+        return b"".join(output)
+
+
+class ParallelGzipCodec(GzipCodec):
+    """
+    Gzip codec that compresses on all cores. The output is a standard multi-member gzip file.
+    """
+
+    name = "pgzip"
+
+    def __init__(self, level=DEFAULT_GZIP_LEVEL, threads=None):
+        super().__init__(level)
+        self.threads = threads or default_threads()
+        self.executor = None
+
+    def compressobj(self, store=False):
+        if store or self.threads == 1:
+            return super().compressobj(store=store)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        return ParallelGzipCompressor(self.executor, self.level, self.threads)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class ZstdCodec(object):
+    """
+    Multi-threaded zstd codec, it needs the optional 'zstandard' package
+    """
+
+    name = "zstd"
+
+    def __init__(self, level=DEFAULT_ZSTD_LEVEL, threads=None):
+        self.zstandard = import_zstandard()
+        self.level = level
+        self.threads = threads or default_threads()
+
+    def compressobj(self, store=False):
+        return self.zstandard.ZstdCompressor(
+            level=ZSTD_STORE_LEVEL if store else self.level, threads=self.threads
+        ).compressobj()
+
+    def footer(self, index_offset):
+        return ZSTD_FOOTER.pack(
+            ZSTD_SKIPPABLE_MAGIC, ZSTD_FOOTER.size - 8, ZSTD_FOOTER_ID, index_offset
+        )
+
+    def close(self):
+        pass
+
+
+CODECS = {
+    GzipCodec.name: GzipCodec,
+    ParallelGzipCodec.name: ParallelGzipCodec,
+    ZstdCodec.name: ZstdCodec,
+}
+
+
+def get_codec(name=None, level=None):
+    name = name or DEFAULT_CODEC
+    if name not in CODECS:
+        raise ResolosException(
+            f"Unknown compression '{name}', the supported ones are: {', '.join(CODECS)}"
+        )
+    return CODECS[name]() if level is None else CODECS[name](level=level)
+
+
+def detect_compression(path):
+    """Returns the compression of a file from its magic bytes"""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(ZSTD_MAGIC):
+        return ZstdCodec.name
+    if magic.startswith(GZIP_MAGIC):
+        return GzipCodec.name
+    return None
+
+
+def read_footer(fileobj):
+    """
+    Returns the index offset stored in the footer of an archive, or None if it has no footer
+    """
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    if size >= ZSTD_FOOTER.size:
+        fileobj.seek(size - ZSTD_FOOTER.size)
+        magic, length, footer_id, offset = ZSTD_FOOTER.unpack(
+            fileobj.read(ZSTD_FOOTER.size)
+        )
+        if magic == ZSTD_SKIPPABLE_MAGIC and footer_id == ZSTD_FOOTER_ID:
+            return offset
+    if size >= GZIP_FOOTER_SIZE:
+        fileobj.seek(size - GZIP_FOOTER_SIZE)
+        footer = fileobj.read(GZIP_FOOTER_SIZE)
+        fields = GZIP_FOOTER_HEADER.unpack(footer[: GZIP_FOOTER_HEADER.size])
+        if (
+            fields[0] == GZIP_MAGIC
+            and fields[7] == GZIP_FOOTER_SUBFIELD
+            and footer[GZIP_FOOTER_HEADER.size :] == GZIP_FOOTER_TRAILER
+        ):
+            return fields[9]
+    return None
+
+
+class DecompressedStream(object):
+    """
+    Read-only file object that decompresses the consecutive gzip members or zstd frames
+    of fileobj, starting at its current position
+    """
+
+    def __init__(self, fileobj, compression):
+        self.fileobj = fileobj
+        if compression == ZstdCodec.name:
+            self.new_decompressor = import_zstandard().ZstdDecompressor().decompressobj
+        elif compression == GzipCodec.name:
+            self.new_decompressor = lambda: zlib.decompressobj(31)
+        else:
+            raise ResolosException(f"Unknown compression '{compression}'")
+        self.decompressor = self.new_decompressor()
+        self.buffer = bytearray()
+        self.unused_data = b""
+        self.eof = False
+
+    def fill(self):
+        data = self.unused_data or self.fileobj.read(READ_CHUNK_SIZE)
+        self.unused_data = b""
+        if not data:
+            self.eof = True
+            return
+        self.buffer += self.decompressor.decompress(data)
+        if self.decompressor.eof:
+            self.unused_data = self.decompressor.unused_data
+            self.decompressor = self.new_decompressor()
+
+    def read(self, size=-1):
+        while not self.eof and (size is None or size < 0 or len(self.buffer) < size):
+            self.fill()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def skip(self, size):
+        while size > 0:
+            data = self.read(min(size, READ_CHUNK_SIZE))
+            if not data:
+                break
+            size -= len(data)
+
+
+class CompressedStream(object):
+    """
+    Write-only file object that compresses the written data with a codec, starting a new
+    compressed member whenever new_member is called. Tarfile only needs write and tell.
+    """
+
+    def __init__(self, fileobj, codec):
+        self.fileobj = fileobj
+        self.codec = codec
+        self.position = 0
+        # Number of compressed bytes written, the start offsets of the current member
+        # in the compressed and in the uncompressed stream
+        self.compressed_position = 0
+        self.member_offset = 0
+        self.member_start = 0
+        self.compressor = None
+        self.member_size = 0
+        self.new_member()
+
+    def new_member(self, store=False):
+        """Ends the current member, the data written next is compressed into a new one"""
+        if (
+            self.compressor is not None
+            and self.member_size == 0
+            and self.store == store
+        ):
+            return
+        self.end_member()
+        self.compressor = self.codec.compressobj(store=store)
+        self.store = store
+        self.member_size = 0
+        self.member_offset = self.compressed_position
+        self.member_start = self.position
+
+    def write_compressed(self, data):
+        self.fileobj.write(data)
+        self.compressed_position += len(data)
+
+    def end_member(self):
+        if self.compressor is not None:
+            if self.member_size > 0:
+                self.write_compressed(self.compressor.flush())
+            self.compressor = None
+
+    def write(self, data):
+        if not data:
+            return 0
+        self.write_compressed(self.compressor.compress(data))
+        self.position += len(data)
+        self.member_size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.end_member()
+        self.codec.close()
+        self.fileobj.flush()
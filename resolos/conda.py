@@ -10,11 +10,31 @@ from .config import (
     write_project_remote_config,
 )
 from .exception import MissingDependency, RemoteCommandError, LocalCommandError
-from .shell import run_shell_cmd, run_ssh_cmd
+from .shell import run_shell_cmd, run_ssh_cmd, conda_load_prefix
 from .platform import find_project_dir, is_linux_64
+from .conda_meta import read_local_env
+from .env_delta import (
+    env_snapshot,
+    plan_env_delta,
+    plan_is_empty,
+    write_plan_files,
+    plan_command,
+    describe_plan,
+    write_env_snapshot,
+    forget_env_snapshot,
+)
+from .fast_shell import (
+    fast_shell_enabled,
+    run_local_conda_cmd,
+    get_conda_env_prefix,
+    forget_conda_env_prefixes,
+)
 from .exception import ResolosException, DependencyVersionError, SSHError
 from .unison import sync_files
+from .capabilities import remote_capabilities, forget_remote_capabilities
+from .fanout import run_local_and_remotes, report_results
 import pathlib
+import threading
 import json
 import yaml
 import ast
@@ -22,8 +42,10 @@ from semver import VersionInfo
 from datetime import datetime
 import re
 
-
 conda_ver_re = re.compile(r"conda (\d+.\d+.\d+)")
+# Set once conda-pack is known to be installed in the local base environment
+conda_pack_installed = False
+conda_pack_lock = threading.Lock()
 
 
 def verify_conda_version(output):
@@ -65,6 +87,8 @@ def check_conda_env_exists_local(env_name: str):
                 f"Unexpected conda error for command '{env_name}':\n\n{output}\n\n"
             )
     else:
+        if fast_shell_enabled() and get_conda_env_prefix(env_name) is not None:
+            return True
         cmd = f"conda activate {env_name}"
         ret_val, output = run_shell_cmd(cmd)
         if ret_val == 0:
@@ -78,69 +102,41 @@ def check_conda_env_exists_local(env_name: str):
 
 
 def create_conda_env_local(env_name: str):
-    # Python < 3.9 is required by conda-tree
-    # https://stackoverflow.com/questions/66174862/import-error-cant-import-name-gcd-from-fractions
     ret_val, output = run_shell_cmd(
-        f'conda create -y -n {env_name} "python<3.9"',
+        f"conda create -y -n {env_name} python",
     )
+    forget_conda_env_prefixes()
     if ret_val != 0:
         raise ResolosException(
             f"Unexpected conda error for command 'conda create -n {env_name}':\n\n{output}\n\n"
         )
 
 
-def check_conda_installed_remote(remote_settings):
-    ret_val, output = run_ssh_cmd(
-        remote_settings,
-        f"{remote_settings['conda_load_command']} && conda --version",
-    )
-    if ret_val != 0:
+def check_conda_installed_remote(remote_settings, refresh=False):
+    capabilities = remote_capabilities(remote_settings, refresh=refresh)
+    if capabilities["conda_version"] is None:
         raise MissingDependency(
-            f"Conda test command 'conda --version' raised error on remote {remote_settings['name']}:\n\n{output}\n\n"
+            f"Conda test command 'conda --version' raised error on remote {remote_settings['name']}\n\n"
             f"Please run 'res check'"
         )
-    verify_conda_version(output)
+    verify_conda_version(capabilities["conda_version"])
 
 
 def check_conda_env_exists_remote(remote_settings, env_name):
-    if env_name.startswith("source "):
-        ret_val, output = run_ssh_cmd(
-            remote_settings,
-            env_name,
-        )
-        if ret_val == 0:
-            return True
-        elif "Could not find conda environment" in output:
-            return False
-        else:
-            raise ResolosException(
-                f"Unexpected conda error for command '{env_name}':\n\n{output}\n\n"
-            )
-    else:
-        cmd = f"{remote_settings['conda_load_command']} && conda activate {env_name}"
-        ret_val, output = run_ssh_cmd(
-            remote_settings,
-            cmd,
-        )
-        if ret_val == 0:
-            return True
-        elif "Could not find conda environment" in output:
-            return False
-        else:
-            raise ResolosException(
-                f"Unexpected conda error for command '{cmd}':\n\n{output}\n\n"
-            )
+    capabilities = remote_capabilities(remote_settings, env_name=env_name)
+    return capabilities["env_prefix"] is not None
 
 
 def create_conda_env_remote(remote_settings, env_name: str):
     ret_val, output = run_ssh_cmd(
         remote_settings,
-        f"{remote_settings['conda_load_command']} && conda create -y -n {env_name}",
+        f"{conda_load_prefix(remote_settings)}conda create -y -n {env_name}",
     )
     if ret_val != 0:
         raise ResolosException(
             f"Unexpected conda error for command 'conda create -n {env_name}':\n\n{output}\n\n"
         )
+    forget_remote_capabilities(remote_settings)
 
 
 def install_conda_remote(remote_settings):
@@ -155,6 +151,7 @@ def install_conda_remote(remote_settings):
         raise RemoteCommandError(
             f"Could not install conda on remote, the error message was:\n\n{output}\n\n"
         )
+    forget_remote_capabilities(remote_settings)
 
 
 def execute_command_in_local_conda_env(cmd, env, stdout_as_info=True):
@@ -178,9 +175,7 @@ def execute_command_in_remote_conda_env(cmd, remote_settings, env, stdout_as_inf
     if env.startswith("source "):
         conda_cmd = f"{env} && {cmd}"
     else:
-        conda_cmd = (
-            f"{remote_settings['conda_load_command']} && conda activate {env} && {cmd}"
-        )
+        conda_cmd = f"{conda_load_prefix(remote_settings)}conda activate {env} && {cmd}"
     ret_val, output = run_ssh_cmd(
         remote_settings,
         conda_cmd,
@@ -214,7 +209,14 @@ def execute_local_conda_command(cmd, env=None, stdout_as_info=False, mamba=None)
             conda_cmd = f"mamba {cmd}"
         else:
             conda_cmd = f"conda {cmd}"
-    ret_val, output = run_shell_cmd(conda_cmd, stdout_as_info=stdout_as_info)
+    result = None
+    if fast_shell_enabled():
+        result = run_local_conda_cmd(
+            cmd, env_name=env, stdout_as_info=stdout_as_info, mamba=mamba
+        )
+    if result is None:
+        result = run_shell_cmd(conda_cmd, stdout_as_info=stdout_as_info)
+    ret_val, output = result
     if ret_val != 0:
         raise LocalCommandError(
             f"Command '{conda_cmd}' raised error on local machine:\n\n{output}\n\n"
@@ -233,14 +235,14 @@ def execute_remote_conda_command(
                 conda_cmd = f"{env} && conda {cmd}"
         else:
             if mamba:
-                conda_cmd = f"{remote_settings['conda_load_command']} && conda activate {env} && mamba {cmd}"
+                conda_cmd = f"{conda_load_prefix(remote_settings)}conda activate {env} && mamba {cmd}"
             else:
-                conda_cmd = f"{remote_settings['conda_load_command']} && conda activate {env} && conda {cmd}"
+                conda_cmd = f"{conda_load_prefix(remote_settings)}conda activate {env} && conda {cmd}"
     else:
         if mamba:
-            conda_cmd = f"{remote_settings['conda_load_command']} && mamba {cmd}"
+            conda_cmd = f"{conda_load_prefix(remote_settings)}mamba {cmd}"
         else:
-            conda_cmd = f"{remote_settings['conda_load_command']} && conda {cmd}"
+            conda_cmd = f"{conda_load_prefix(remote_settings)}conda {cmd}"
 
     ret_val, output = run_ssh_cmd(
         remote_settings,
@@ -302,6 +304,9 @@ def install_conda_packages(package_list, target=None, channel=None, mamba=None):
         execute_remote_conda_command(
             install_command, target, env=remote_env, mamba=mamba
         )
+        # The remote environment no longer matches the last synced local environment
+        write_project_remote_config(remote_id, {"last_env_fingerprint": None})
+        forget_env_snapshot(remote_id)
     else:
         clog.info(f"Installing packages {packages} in local environment")
         local_env = get_project_env()
@@ -312,6 +317,52 @@ def install_conda_packages(package_list, target=None, channel=None, mamba=None):
         )
 
 
+def install_conda_packages_local_and_remote(
+    package_list, remotes, channel=None, mamba=None
+):
+    """
+    Installs the packages locally and on the remotes at the same time
+    """
+    if not remotes:
+        install_conda_packages(package_list, channel=channel, mamba=mamba)
+        return
+    packages = " ".join(package_list)
+    local_result, results = run_local_and_remotes(
+        lambda: install_conda_packages(package_list, channel=channel, mamba=mamba),
+        lambda remote_settings: install_conda_packages(
+            package_list, target=remote_settings, channel=channel, mamba=mamba
+        ),
+        remotes,
+    )
+    report_results(
+        results,
+        f"Installing packages {packages}",
+        local_result=local_result,
+        rollback_hint=f"Run the install again to retry, or roll back with 'r3s uninstall {packages}'",
+    )
+
+
+def uninstall_conda_packages_local_and_remote(package_list, remotes):
+    """
+    Uninstalls the packages locally and on the remotes at the same time
+    """
+    if not remotes:
+        uninstall_conda_packages(package_list)
+        return
+    packages = " ".join(package_list)
+    local_result, results = run_local_and_remotes(
+        lambda: uninstall_conda_packages(package_list),
+        lambda remote_settings: uninstall_conda_packages(package_list, remote_settings),
+        remotes,
+    )
+    report_results(
+        results,
+        f"Uninstalling packages {packages}",
+        local_result=local_result,
+        rollback_hint=f"Run the uninstall again to retry, or roll back with 'r3s install {packages}'",
+    )
+
+
 def uninstall_conda_packages(package_list, target=None):
     packages = " ".join(package_list)
     uninstall_command = f"uninstall -y {packages}"
@@ -325,6 +376,8 @@ def uninstall_conda_packages(package_list, target=None):
             target,
             env=remote_env,
         )
+        write_project_remote_config(remote_id, {"last_env_fingerprint": None})
+        forget_env_snapshot(remote_id)
     else:
         local_env = get_project_env()
         if not check_conda_env_exists_local(local_env):
@@ -336,21 +389,45 @@ def uninstall_conda_packages(package_list, target=None):
         )
 
 
+def ensure_conda_pack():
+    """
+    Installs conda-pack unless it is installed already. The check is done once per process,
+    so packing several environments does not solve the base environment every time.
+    """
+    global conda_pack_installed
+    with conda_pack_lock:
+        if conda_pack_installed:
+            return
+        try:
+            execute_local_conda_command("pack --version")
+        except LocalCommandError:
+            clog.debug(f"Installing conda-pack...")
+            ret_val, output = execute_local_conda_command(f"install -y conda-pack")
+            if ret_val != 0:
+                raise LocalCommandError(
+                    f"Could not install conda-pack "
+                    f"with command 'conda install -y conda-pack', "
+                    f"the error was:\n\n{output}\n\n"
+                )
+        conda_pack_installed = True
+
+
 def pack_conda_env(env_name: str, pack_name: str, target=None):
-    clog.debug(f"Installing conda-pack...")
-    ret_val, output = execute_local_conda_command(f"install -y conda-pack")
-    if ret_val != 0:
-        raise LocalCommandError(
-            f"Could not install conda-pack "
-            f"with command 'conda install -y conda-pack', "
-            f"the error was:\n\n{output}\n\n"
-        )
+    ensure_conda_pack()
     return execute_conda_command(f"pack -n {env_name} -o {pack_name}", target=target)
 
 
 def export_conda_env(
     env_name: str, only_explicitly_installed=True, target=None, filename=None
 ):
+    local_env = read_local_env(env_name) if target is None else None
+    if local_env is not None:
+        output = local_env.env_yaml(only_explicitly_installed)
+        if filename is None:
+            return 0, output
+        with open(filename, "w") as f:
+            f.write(output)
+        return
     flags = "--from-history" if only_explicitly_installed else ""
     if filename is None:
         return execute_conda_command(
@@ -370,6 +447,14 @@ def export_conda_env(
 
 
 def explicit_package_list(env_name: str, target=None, filename=None):
+    local_env = read_local_env(env_name) if target is None else None
+    if local_env is not None:
+        output = local_env.explicit_list()
+        if filename is None:
+            return 0, output
+        with open(filename, "w") as f:
+            f.write(output)
+        return
     if filename is None:
         return execute_conda_command(
             f"list --explicit", target=target, env=env_name, stdout_as_info=False
@@ -388,15 +473,19 @@ def explicit_package_list(env_name: str, target=None, filename=None):
 
 
 def pip_installed_package_list(env_name: str, target=None, filename=None):
-    ret_val, env_yaml = execute_conda_command(
-        f"env export", target=target, env=env_name, stdout_as_info=False
-    )
-    env = yaml.safe_load(env_yaml)
+    local_env = read_local_env(env_name) if target is None else None
+    if local_env is not None:
+        pip_packages = local_env.pip_requirements()
+    else:
+        ret_val, env_yaml = execute_conda_command(
+            f"env export", target=target, env=env_name, stdout_as_info=False
+        )
+        env = yaml.safe_load(env_yaml)
 
-    pip_packages = []
-    for dep in env["dependencies"]:
-        if isinstance(dep, dict) and "pip" in dep:
-            pip_packages = dep["pip"]
+        pip_packages = []
+        for dep in env["dependencies"]:
+            if isinstance(dep, dict) and "pip" in dep:
+                pip_packages = dep["pip"]
 
     if filename:
         with open(filename, "w") as f:
@@ -406,27 +495,31 @@ def pip_installed_package_list(env_name: str, target=None, filename=None):
 
 
 def get_requirements(env_name, filename=None):
-    ret_val, output = execute_local_conda_command(f"list --json", env=env_name)
-    if ret_val != 0:
-        raise LocalCommandError(
-            f"Could not get list of installed packages in json format "
-            f"with command 'conda list --json', "
-            f"the error was:\n\n{output}\n\n"
-        )
-    packages_data = json.loads(output)
-    res = []
-    for pkg in packages_data:
-        skip = False
-        name = pkg.get("name")
-        if name is None:
-            clog.warning(f"Could not get name of package {pkg}, will skip it")
-            skip = True
-        version = pkg.get("version")
-        if version is None:
-            clog.warning(f"Could not get version of package {pkg}, will skip it")
-            skip = True
-        if not skip:
-            res.append(f"{name}=={version}")
+    local_env = read_local_env(env_name)
+    if local_env is not None:
+        res = local_env.requirements()
+    else:
+        ret_val, output = execute_local_conda_command(f"list --json", env=env_name)
+        if ret_val != 0:
+            raise LocalCommandError(
+                f"Could not get list of installed packages in json format "
+                f"with command 'conda list --json', "
+                f"the error was:\n\n{output}\n\n"
+            )
+        packages_data = json.loads(output)
+        res = []
+        for pkg in packages_data:
+            skip = False
+            name = pkg.get("name")
+            if name is None:
+                clog.warning(f"Could not get name of package {pkg}, will skip it")
+                skip = True
+            version = pkg.get("version")
+            if version is None:
+                clog.warning(f"Could not get version of package {pkg}, will skip it")
+                skip = True
+            if not skip:
+                res.append(f"{name}=={version}")
     requirements = "\n".join(res)
     clog.debug(f"The requirements file is:\n{requirements}\n")
     if filename is None:
@@ -437,47 +530,21 @@ def get_requirements(env_name, filename=None):
 
 
 def get_nondep_packages(env_name, filename=None):
-    clog.debug(f"Installing conda-tree...")
-    ret_val, output = execute_local_conda_command(
-        f"install -y -c conda-forge conda-tree", env=env_name
-    )
-    if ret_val != 0:
-        raise LocalCommandError(
-            f"Could not install conda-tree to get the list of non-dependency packages "
-            f"with command 'conda install -y -c conda-forge conda-tree', "
-            f"the error was:\n\n{output}\n\n"
-        )
-    clog.debug(f"Getting list of packages...")
-    ret_val, output = execute_local_conda_command(f"list --json", env=env_name)
-    if ret_val != 0:
-        raise LocalCommandError(
-            f"Could not get list of installed packages in json format "
-            f"with command 'conda list --json', "
-            f"the error was:\n\n{output}\n\n"
-        )
-    packages_data = json.loads(output)
-    ret_val, output = execute_command_in_local_conda_env(
-        "conda-tree leaves --json", env_name, stdout_as_info=False
-    )
-    if ret_val != 0:
+    clog.debug(f"Reading dependency graph of environment '{env_name}'...")
+    local_env = read_local_env(env_name)
+    if local_env is None:
         raise LocalCommandError(
-            f"Could not get list of non-dependency packages "
-            f"with command 'conda-tree leaves', "
-            f"the error was:\n\n{output}\n\n"
+            f"Could not get list of non-dependency packages, "
+            f"the conda-meta folder of environment '{env_name}' was not found"
         )
-    leaves = json.loads(output)
     res = []
-    for pkg in leaves:
-        if pkg not in ["conda-tree", "pip", "conda"]:
-            pgk_data = [i for i in packages_data if i.get("name") == pkg]
-            if len(pgk_data) == 0:
-                res.append(pkg)
+    for pkg in local_env.dependency_graph().leaves():
+        if pkg not in ["pip", "conda"]:
+            ver = local_env.packages[pkg].get("version")
+            if ver:
+                res.append(f"{pkg}=={ver}")
             else:
-                ver = pgk_data[0].get("version")
-                if ver:
-                    res.append(f"{pkg}=={ver}")
-                else:
-                    res.append(pkg)
+                res.append(pkg)
     clog.debug(f"Found non-dependent packages: {res}")
     if filename is None:
         return res
@@ -504,10 +571,54 @@ def unpack_env_on_remote(remote_settings, remote_path):
     return remote_env_name
 
 
-def sync_env_and_files(remote_settings):
+def get_local_env_fingerprint(env_name):
+    local_env = read_local_env(env_name)
+    return local_env.fingerprint() if local_env is not None else None
+
+
+def record_env_sync(remote_id, env_fingerprint=None, **settings):
+    project_remote_settings = read_project_remote_config(remote_id)
+    project_remote_settings.update(settings)
+    project_remote_settings["last_env_sync"] = datetime.utcnow()
+    project_remote_settings["last_env_fingerprint"] = env_fingerprint
+    write_project_remote_config(remote_id, project_remote_settings)
+
+
+def sync_env_delta(remote_settings, remote_env, remote_path, plan):
+    """
+    Applies the delta plan of the environment sync on the remote, as a single remote command
+    """
+    if plan_is_empty(plan):
+        clog.info("The remote conda environment already has all the local packages")
+        return
+    clog.info(f"Syncing changed packages ({describe_plan(plan)})...")
+    execute_command_in_remote_conda_env(
+        cmd=plan_command(
+            plan,
+            remote_env,
+            f"{remote_path}/.env/spec-delta.txt",
+            f"{remote_path}/.env/requirements-delta.txt",
+        ),
+        remote_settings=remote_settings,
+        env=remote_env,
+    )
+
+
+def sync_env_and_files(remote_settings, force=False):
     project_dir = find_project_dir()
     remote_id = remote_settings["name"]
     local_env, remote_env, remote_path = get_project_settings_for_remote(remote_id)
+    env_fingerprint = get_local_env_fingerprint(local_env)
+    last_env_fingerprint = read_project_remote_config(remote_id).get(
+        "last_env_fingerprint"
+    )
+    if not force and env_fingerprint and env_fingerprint == last_env_fingerprint:
+        clog.info(
+            f"The local conda environment did not change since the last sync with remote '{remote_id}', "
+            f"will only sync the project files"
+        )
+        sync_files(remote_settings)
+        return
     env_folder = project_dir / ".env"
     pathlib.Path.mkdir(env_folder, exist_ok=True)
     requirements_file = env_folder / "requirements.txt"
@@ -519,10 +630,40 @@ def sync_env_and_files(remote_settings):
         )
         explicit_packages_file = env_folder / "spec-file.txt"
         explicit_package_list(local_env, filename=explicit_packages_file)
+        local_conda_env = read_local_env(local_env)
+        plan = None
+        # A forced sync reinstalls everything, as the remote environment might have drifted
+        # from the snapshot
+        if (
+            not force
+            and local_conda_env is not None
+            and not remote_env.startswith("source ")
+        ):
+            plan = plan_env_delta(remote_id, remote_env, local_conda_env)
+        if plan is not None:
+            write_plan_files(
+                plan,
+                local_conda_env.platform,
+                env_folder / "spec-delta.txt",
+                env_folder / "requirements-delta.txt",
+            )
         clog.info(f"Syncing project files...")
         sync_files(remote_settings)
         if not check_conda_env_exists_remote(remote_settings, remote_env):
             create_conda_env_remote(remote_settings, remote_env)
+            plan = None
+        if plan is not None:
+            try:
+                sync_env_delta(remote_settings, remote_env, remote_path, plan)
+                write_env_snapshot(remote_id, env_snapshot(local_conda_env, remote_env))
+                record_env_sync(remote_id, env_fingerprint)
+                return
+            except RemoteCommandError as ex:
+                clog.info(
+                    f"Failed to sync only the changed packages to remote '{remote_id}', "
+                    f"will sync the complete explicit packages list instead..."
+                )
+                clog.debug(ex.msg)
         try:
             clog.info("Syncing conda-installed packages...")
             execute_remote_conda_command(
@@ -535,10 +676,11 @@ def sync_env_and_files(remote_settings):
                 remote_settings=remote_settings,
                 env=remote_env,
             )
-            project_remote_settings = read_project_remote_config(remote_id)
-            project_remote_settings["last_env_sync"] = datetime.utcnow()
-            write_project_remote_config(remote_id, project_remote_settings)
+            record_env_sync(remote_id, env_fingerprint)
+            if local_conda_env is not None:
+                write_env_snapshot(remote_id, env_snapshot(local_conda_env, remote_env))
         except RemoteCommandError as ex:
+            forget_env_snapshot(remote_id)
             clog.info(
                 f"Failed to sync conda env to remote '{remote_id}' using explicit packages list, "
                 f"will use now conda-pack..."
@@ -553,12 +695,11 @@ def sync_env_and_files(remote_settings):
                 remote_settings=remote_settings,
                 env=remote_env,
             )
-            project_remote_settings = read_project_remote_config(remote_id)
-            project_remote_settings[
-                "env_name"
-            ] = f"source ./.resolos/envs/{remote_env_name}/bin/activate"
-            project_remote_settings["last_env_sync"] = datetime.utcnow()
-            write_project_remote_config(remote_id, project_remote_settings)
+            record_env_sync(
+                remote_id,
+                env_fingerprint,
+                env_name=f"source ./.resolos/envs/{remote_env_name}/bin/activate",
+            )
     else:
         clog.info(
             f"The local machine has a different platform or OS as the remote (linux, x86_64), will use the environment "
@@ -581,19 +722,20 @@ def sync_env_and_files(remote_settings):
                 remote_settings=remote_settings,
                 env=remote_env,
             )
-            project_remote_settings = read_project_remote_config(remote_id)
-            project_remote_settings["last_env_sync"] = datetime.utcnow()
-            write_project_remote_config(remote_id, project_remote_settings)
+            record_env_sync(remote_id, env_fingerprint)
         except RemoteCommandError as ex:
             clog.info(
                 f"Failed to sync conda env to remote '{remote_id}' using complete environment description, "
                 f"will try  to replay conda install history on remote instead..."
             )
+            # Only a successful fallback leaves the remote in sync with the local environment
+            synced_fingerprint = None
             try:
                 execute_remote_conda_command(
                     f"env update -n {remote_env} -f {remote_path}/.env/env_from_history.yaml",
                     remote_settings,
                 )
+                synced_fingerprint = env_fingerprint
             except RemoteCommandError:
                 clog.info(
                     f"Failed to sync conda env to remote '{remote_id}' using conda env --from-history, "
@@ -601,6 +743,7 @@ def sync_env_and_files(remote_settings):
                 )
                 nondep_packages = get_nondep_packages(local_env)
                 install_conda_packages(nondep_packages, target=remote_settings)
+                synced_fingerprint = env_fingerprint
             finally:
                 clog.info("Syncing pip-installed packages...")
                 execute_command_in_remote_conda_env(
@@ -608,24 +751,7 @@ def sync_env_and_files(remote_settings):
                     remote_settings=remote_settings,
                     env=remote_env,
                 )
-                project_remote_settings = read_project_remote_config(remote_id)
-                project_remote_settings["last_env_sync"] = datetime.utcnow()
-                write_project_remote_config(remote_id, project_remote_settings)
-
-
-def get_dependency_tree(pipenv_json: pathlib.Path, env_name: str):
-    clog.debug(f"Collecting package dependencies...")
-    ret_val, output = execute_command_in_local_conda_env(
-        f'pipdeptree --exclude pip,pipdeptree,setuptools,wheel --json-tree > "{pipenv_json}"',
-        env_name,
-        stdout_as_info=False,
-    )
-    if ret_val != 0:
-        raise LocalCommandError(
-            f"Could not run pipdeptree to collect package dependencies, "
-            f"with command 'pipdeptree --exclude pip,pipdeptree,setuptools,wheel --json-tree', "
-            f"the error was:\n\n{output}\n\n"
-        )
+                record_env_sync(remote_id, synced_fingerprint)
 
 
 def sync_env_and_files_with_auto_resolve_deps(remote_settings, mamba=False):
@@ -637,58 +763,34 @@ def sync_env_and_files_with_auto_resolve_deps(remote_settings, mamba=False):
     it will not match for exact python version/architecture/artifact ID.
 
     New algorithm:
-    1. Export the complete (conda + pip packages) dependency tree of the local environment using pipdeptree.
-       This includes both conda and pip installed packages. The root nodes of the tree need to be installed.
-    2. Export the conda environment to a YAML file using `conda env export`. This will list conda-installed packages
-       with their version specifications. It also includes architecture-specific versions which we will discard.
-       It also includes a list of pip-installed packages.
-    3. Take the intersection of conda-installed packages from `conda env export` and the roots of the `pipdeptree` output.
-       These are packages that were installed using conda and are not depended upon.
-    4. Install these packages on the remote using `conda install -c channel1 -c channel2 package1==version1 package2==version2` on the remote.
+    1. Build the combined (conda + pip packages) dependency graph of the local environment.
+       Conda packages are linked by the `depends` fields of their conda-meta records,
+       pip packages by the `Requires-Dist` entries of their dist-info metadata.
+       The graph is read directly from the environment folder and reused while the environment is unchanged.
+    2. The roots of the graph (packages that are not depended upon) need to be installed.
+       Roots installed by conda are pinned to their local version, it does not match for exact
+       python version/architecture/artifact ID.
+    3. Install the conda roots on the remote using `conda install -c channel1 -c channel2 package1==version1 package2==version2` on the remote.
        We will list all channels specified in the local environment.
-    5. Install the remaining of the pip-installed root packages from the `pipdeptree` output
-       using a single `pip install --upgrade package3==version3 package4==version4` on the remote.
-    6. We assume that pip-installed packages that are dependencies of conda packages,
+    4. Install the pip-installed roots using a single `pip install package3==version3 package4==version4` on the remote.
+    5. We assume that pip-installed packages that are dependencies of conda packages,
        will be installed by conda as a dependency on the remote.
 
     :param remote_settings: Remote settings dictionary
     :param mamba: Use `mamba` instead of `conda` if True.
     """
-    project_dir = find_project_dir()
     remote_id = remote_settings["name"]
     local_env, remote_env, remote_path = get_project_settings_for_remote(remote_id)
-    env_folder = project_dir / ".env"
-    pathlib.Path.mkdir(env_folder, exist_ok=True)
 
     clog.info("Collecting details of conda environment...")
-    env_file = env_folder / "env.yaml"
-    export_conda_env(local_env, filename=env_file, only_explicitly_installed=False)
-    with open(env_file, "r") as f:
-        env_data = yaml.safe_load(f)
-
-    channels = ["-c " + c for c in env_data["channels"]]
-
-    all_conda_packages = {}
-    for package in env_data["dependencies"]:
-        if isinstance(package, str):  # Pip package list is a dict, skipped
-            all_conda_packages[package.split("=")[0]] = (
-                package.split("=")[0] + "==" + package.split("=")[1]
-            )
-
-    pipenv_json = env_folder / "pipenv.json"
-    get_dependency_tree(pipenv_json, local_env)
-    with pipenv_json.open("r") as f:
-        dep_tree = json.load(f)
-
-    root_conda_packages = []
-    root_pip_packages = []
-    for p in dep_tree:
-        versioned_package = f'{p["package_name"]}=={p["installed_version"]}'
-        # Compare only package names as reported conda/pip versions can differ, see the case of conda-tree
-        if p["package_name"] in all_conda_packages:
-            root_conda_packages.append(all_conda_packages[p["package_name"]])
-        else:
-            root_pip_packages.append(versioned_package)
+    env = read_local_env(local_env)
+    if env is None:
+        raise LocalCommandError(
+            f"Could not collect package dependencies, "
+            f"the conda-meta folder of environment '{local_env}' was not found"
+        )
+    channels = ["-c " + c for c in env.channels()]
+    root_conda_packages, root_pip_packages = env.root_packages()
     clog.debug(
         f"Root conda packages to install on remote {remote_id}: "
         + ", ".join(root_conda_packages)
@@ -698,20 +800,22 @@ def sync_env_and_files_with_auto_resolve_deps(remote_settings, mamba=False):
         + ", ".join(root_pip_packages)
     )
 
-    clog.info(f"Installing conda packages on remote {remote_id} ...")
-    execute_remote_conda_command(
-        cmd=f"install -y {' '.join(channels)} {' '.join(root_conda_packages)}",
-        remote_settings=remote_settings,
-        env=remote_env,
-        mamba=mamba,
-    )
+    if root_conda_packages:
+        clog.info(f"Installing conda packages on remote {remote_id} ...")
+        execute_remote_conda_command(
+            cmd=f"install -y {' '.join(channels)} {' '.join(root_conda_packages)}",
+            remote_settings=remote_settings,
+            env=remote_env,
+            mamba=mamba,
+        )
 
-    clog.info(f"Installing pip packages on remote {remote_id} ...")
-    execute_command_in_remote_conda_env(
-        cmd=f"pip install --no-cache-dir {' '.join(root_pip_packages)}",
-        remote_settings=remote_settings,
-        env=remote_env,
-    )
+    if root_pip_packages:
+        clog.info(f"Installing pip packages on remote {remote_id} ...")
+        execute_command_in_remote_conda_env(
+            cmd=f"pip install --no-cache-dir {' '.join(root_pip_packages)}",
+            remote_settings=remote_settings,
+            env=remote_env,
+        )
     clog.info(
         f"Remote conda and pip environment successfully synced on remote {remote_id} with local environment."
     )
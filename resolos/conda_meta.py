@@ -0,0 +1,385 @@
+import os
+import re
+import json
+import ast
+import yaml
+import hashlib
+from email.parser import HeaderParser
+from pathlib import Path
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.markers import UndefinedEnvironmentName, UndefinedComparison
+from .logging import clog
+from .fast_shell import get_conda_env_prefix, get_conda_shell_env
+from .graph import conda_dependency_graph
+
+DEFAULT_CHANNEL_URLS = [
+    "https://repo.anaconda.com/pkgs/main",
+    "https://repo.anaconda.com/pkgs/r",
+    "https://repo.anaconda.com/pkgs/msys2",
+]
+ANACONDA_ORG_URL = "https://conda.anaconda.org/"
+# Packaging tools that are never pinned as root packages, like 'pipdeptree --exclude' did
+ROOT_PACKAGE_EXCLUDES = ["pip", "pipdeptree", "setuptools", "wheel"]
+EXPLICIT_HEADER = (
+    "# This file may be used to create an environment using:\n"
+    "# $ conda create --name <env> --file <this file>\n"
+)
+
+history_specs_re = re.compile(
+    r"^# (install|update|create|remove|neutered) specs: (.*)$"
+)
+subdir_re = re.compile(r"/(noarch|(linux|osx|win|zos)-[a-z0-9_]+)/?$")
+dist_info_re = re.compile(r"^(.*/)?([^/]+\.(dist|egg)-info)(/|$)")
+
+
+def canonical_name(name: str):
+    # PEP 503 normalization, as used by pip when comparing package names
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def dist_info_name(dist_info: str):
+    # Installers escape '-' in the distribution name, so the name ends at the first '-'
+    return canonical_name(re.sub(r"\.(dist|egg)-info$", "", dist_info).split("-")[0])
+
+
+def requirement_names(requires_dist, marker_env: dict):
+    """
+    Returns the canonical names of the Requires-Dist entries that apply to the environment.
+    Requirements of extras are left out.
+    """
+    names = []
+    for entry in requires_dist:
+        try:
+            req = Requirement(entry)
+        except InvalidRequirement:
+            clog.debug(f"Could not parse requirement '{entry}'")
+            continue
+        if req.marker is not None:
+            try:
+                if not req.marker.evaluate(marker_env):
+                    continue
+            except (UndefinedEnvironmentName, UndefinedComparison):
+                continue
+        names.append(canonical_name(req.name))
+    return names
+
+
+def active_envs_dirs():
+    """Returns the default environment folders of the conda install resolos runs"""
+    conda_exe, env = get_conda_shell_env()
+    if conda_exe is None:
+        return []
+    envs_dirs = [
+        Path(conda_exe).parent.parent / "envs",
+        Path.home() / ".conda" / "envs",
+    ]
+    for var in ["CONDA_ENVS_PATH", "CONDA_ENVS_DIRS"]:
+        envs_dirs.extend(Path(p) for p in env.get(var, "").split(os.pathsep) if p)
+    return [d.absolute() for d in envs_dirs]
+
+
+def find_env_prefix(env_name: str):
+    """
+    Returns the prefix of a local conda environment, given either its name or
+    the 'source <prefix>/bin/activate' command used for conda-pack environments
+    """
+    if env_name.startswith("source "):
+        activate_script = Path(os.path.expanduser(env_name[len("source ") :].strip()))
+        prefix = activate_script.parent.parent
+    else:
+        found = get_conda_env_prefix(env_name)
+        prefix = Path(found) if found else None
+        environments_txt = Path.home() / ".conda" / "environments.txt"
+        if prefix is None and env_name != "base" and environments_txt.exists():
+            # environments.txt lists the environments of every conda install the user ran,
+            # only those of the active install can be meant by name
+            envs_dirs = active_envs_dirs()
+            for line in environments_txt.read_text().splitlines():
+                path = Path(line.strip()).absolute()
+                if line.strip() and path.name == env_name and path.parent in envs_dirs:
+                    prefix = path
+                    break
+    if prefix is None or not (prefix / "conda-meta").is_dir():
+        return None
+    return prefix.absolute()
+
+
+def channel_name(record: dict):
+    channel = subdir_re.sub("", record.get("channel") or "")
+    if channel in DEFAULT_CHANNEL_URLS:
+        return "defaults"
+    if channel.startswith(ANACONDA_ORG_URL):
+        return channel[len(ANACONDA_ORG_URL) :]
+    return channel
+
+
+def record_url(record: dict):
+    url = record.get("url")
+    if url:
+        return url
+    channel = (record.get("channel") or "").rstrip("/")
+    subdir = record.get("subdir")
+    if subdir and not channel.endswith(subdir):
+        channel = f"{channel}/{subdir}"
+    return f"{channel}/{record['fn']}"
+
+
+def parse_history_specs(history_path: Path):
+    """
+    Replays the spec changes of conda-meta/history, like 'conda env export --from-history'
+    """
+    specs = {}
+    if not history_path.exists():
+        return specs
+    with history_path.open("r") as f:
+        for line in f:
+            m = history_specs_re.match(line.strip())
+            if not m:
+                continue
+            action, spec_list = m.groups()
+            try:
+                parsed = ast.literal_eval(spec_list)
+            except (ValueError, SyntaxError):
+                clog.debug(f"Could not parse conda history line '{line.strip()}'")
+                continue
+            for spec in parsed:
+                name = re.split(r"[\s=<>!\[~]", spec.split("::")[-1], 1)[0]
+                if action == "remove":
+                    specs.pop(name, None)
+                elif action != "neutered":
+                    specs[name] = spec.split("::")[-1]
+    return specs
+
+
+def read_metadata_headers(path: Path):
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        return HeaderParser().parse(f)
+
+
+class CondaEnvironment(object):
+    """
+    Description of a local conda environment, read directly from the conda-meta records
+    and the dist-info folders of its site-packages, instead of starting conda.
+    """
+
+    def __init__(self, prefix, name=None):
+        self.prefix = Path(prefix)
+        self.name = name or self.prefix.name
+        self.packages = {}
+        self.pip_packages = {}
+        self.dist_info_owners = {}
+        self._graph = None
+        self._full_graph = None
+        self._scan()
+
+    def _scan(self):
+        conda_dist_infos = set()
+        for meta_file in sorted((self.prefix / "conda-meta").glob("*.json")):
+            with meta_file.open("r") as f:
+                record = json.load(f)
+            if "name" not in record or "version" not in record:
+                clog.warning(f"Skipping malformed conda record {meta_file}")
+                continue
+            self.packages[record["name"]] = record
+            for file in record.get("files", []):
+                m = dist_info_re.match(file)
+                if m:
+                    conda_dist_infos.add(m.group(2))
+                    self.dist_info_owners[dist_info_name(m.group(2))] = record["name"]
+        for site_packages in self.site_packages_dirs():
+            for dist_info in sorted(site_packages.iterdir()):
+                if dist_info.name in conda_dist_infos:
+                    continue
+                if dist_info.suffix == ".dist-info":
+                    metadata_path = dist_info / "METADATA"
+                elif dist_info.suffix == ".egg-info":
+                    metadata_path = (
+                        dist_info / "PKG-INFO" if dist_info.is_dir() else dist_info
+                    )
+                else:
+                    continue
+                if not metadata_path.is_file():
+                    continue
+                headers = read_metadata_headers(metadata_path)
+                name = headers.get("Name")
+                if name is None:
+                    continue
+                self.pip_packages[canonical_name(name)] = {
+                    "name": name,
+                    "version": headers.get("Version"),
+                    "requires_dist": headers.get_all("Requires-Dist") or [],
+                    "path": str(dist_info),
+                }
+
+    def site_packages_dirs(self):
+        dirs = list(self.prefix.glob("lib/python*/site-packages"))
+        win_dir = self.prefix / "Lib" / "site-packages"
+        if win_dir.is_dir():
+            dirs.append(win_dir)
+        return [d for d in dirs if d.is_dir()]
+
+    @property
+    def platform(self):
+        for record in self.packages.values():
+            if record.get("subdir") and record["subdir"] != "noarch":
+                return record["subdir"]
+        return "noarch"
+
+    def channels(self):
+        channels = []
+        for record in self.packages.values():
+            channel = channel_name(record)
+            if channel and channel not in channels:
+                channels.append(channel)
+        return channels
+
+    def fingerprint(self):
+        """
+        Content hash of the installed conda and pip packages and the conda install history
+        """
+        h = hashlib.sha256()
+        for name, record in sorted(self.packages.items()):
+            h.update(
+                f"conda {name} {record['version']} {record.get('build', '')} "
+                f"{record_url(record)}\n".encode("utf-8")
+            )
+        for name, pkg in sorted(self.pip_packages.items()):
+            h.update(f"pip {name} {pkg['version']}\n".encode("utf-8"))
+        history_path = self.prefix / "conda-meta" / "history"
+        if history_path.exists():
+            h.update(history_path.read_bytes())
+        return h.hexdigest()
+
+    def dependency_graph(self):
+        if self._graph is None:
+            self._graph = conda_dependency_graph(self.packages)
+        return self._graph
+
+    def marker_env(self):
+        marker_env = {"extra": ""}
+        python = self.packages.get("python")
+        if python:
+            marker_env["python_full_version"] = python["version"]
+            marker_env["python_version"] = ".".join(python["version"].split(".")[:2])
+        return marker_env
+
+    def full_dependency_graph(self):
+        """
+        Dependency graph of the conda and pip packages together. Pip packages are keyed by
+        their canonical name, and their requirements point to the conda package that
+        provides them when they were installed by conda.
+        """
+        if self._full_graph is not None:
+            return self._full_graph
+        graph = conda_dependency_graph(self.packages)
+        for name, pkg in self.pip_packages.items():
+            graph.add_node(name, pkg)
+        marker_env = self.marker_env()
+        for name, pkg in self.pip_packages.items():
+            for req in requirement_names(pkg["requires_dist"], marker_env):
+                if req in self.pip_packages:
+                    graph.add_edge(name, req)
+                elif req in self.dist_info_owners:
+                    graph.add_edge(name, self.dist_info_owners[req])
+                elif req in self.packages:
+                    graph.add_edge(name, req)
+        self._full_graph = graph
+        return graph
+
+    def root_packages(self):
+        """
+        Returns the pinned conda and pip packages that no other installed package depends on
+        """
+        conda_roots = []
+        pip_roots = []
+        for name in self.full_dependency_graph().leaves():
+            if name in ROOT_PACKAGE_EXCLUDES:
+                continue
+            if name in self.pip_packages:
+                pkg = self.pip_packages[name]
+                pip_roots.append(f"{pkg['name']}=={pkg['version']}")
+            else:
+                conda_roots.append(f"{name}=={self.packages[name]['version']}")
+        return conda_roots, pip_roots
+
+    def ordered_packages(self):
+        # Dependencies first, the order in which conda itself would install them
+        return [
+            self.packages[name] for name in self.dependency_graph().topological_order()
+        ]
+
+    def explicit_list(self):
+        urls = [record_url(record) for record in self.ordered_packages()]
+        return (
+            f"{EXPLICIT_HEADER}# platform: {self.platform}\n@EXPLICIT\n"
+            + "\n".join(urls)
+            + "\n"
+        )
+
+    def pip_requirements(self):
+        return [
+            f"{p['name']}=={p['version']}" for _, p in sorted(self.pip_packages.items())
+        ]
+
+    def requirements(self):
+        res = [f"{r['name']}=={r['version']}" for r in self.ordered_packages()]
+        return res + self.pip_requirements()
+
+    def env_dict(self, only_explicitly_installed=False):
+        if only_explicitly_installed:
+            dependencies = list(
+                parse_history_specs(self.prefix / "conda-meta" / "history").values()
+            )
+        else:
+            dependencies = [
+                f"{r['name']}={r['version']}={r.get('build', '')}".rstrip("=")
+                for r in self.ordered_packages()
+            ]
+            pip_requirements = self.pip_requirements()
+            if pip_requirements:
+                dependencies.append({"pip": pip_requirements})
+        return {
+            "name": self.name,
+            "channels": self.channels(),
+            "dependencies": dependencies,
+            "prefix": str(self.prefix),
+        }
+
+    def env_yaml(self, only_explicitly_installed=False):
+        return yaml.safe_dump(
+            self.env_dict(only_explicitly_installed),
+            default_flow_style=False,
+            sort_keys=False,
+        )
+
+
+local_envs = {}
+
+
+def env_state_key(prefix: Path):
+    # Installing or removing packages with conda or pip touches these folders
+    dirs = [prefix / "conda-meta"] + list(prefix.glob("lib/python*/site-packages"))
+    return tuple((str(d), d.stat().st_mtime_ns) for d in dirs if d.is_dir())
+
+
+def read_local_env(env_name: str):
+    """
+    Returns the CondaEnvironment for the local environment, or None if its prefix cannot be found.
+    The scan is reused as long as the environment does not change.
+    """
+    prefix = find_env_prefix(env_name)
+    if prefix is None:
+        clog.debug(f"Could not locate conda-meta of environment '{env_name}'")
+        return None
+    name = prefix.name if env_name.startswith("source ") else env_name
+    state_key = env_state_key(prefix)
+    cached = local_envs.get((name, prefix))
+    if cached is not None and cached[0] == state_key:
+        return cached[1]
+    try:
+        env = CondaEnvironment(prefix, name=name)
+    except (OSError, ValueError) as ex:
+        clog.debug(f"Could not read conda-meta of environment '{env_name}': {ex}")
+        return None
+    local_envs[(name, prefix)] = (state_key, env)
+    return env
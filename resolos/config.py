@@ -1,4 +1,7 @@
 import os
+import copy
+import shutil
+import tempfile
 import yaml
 from .logging import clog
 from .platform import (
@@ -7,6 +10,7 @@ from .platform import (
     get_unison_config_folder,
     get_remotes_config_path,
     find_resolos_dir,
+    forget_resolos_dir,
     in_resolos_dir,
     get_project_config_path,
     get_project_remotes_config_path,
@@ -18,6 +22,7 @@ from .exception import (
     MissingRemoteLocation,
 )
 import pathlib
+import threading
 import string
 import random
 import pkgutil
@@ -26,6 +31,16 @@ import re
 from semver import VersionInfo
 from datetime import datetime
 from click import BadOptionUsage
+from contextlib import contextmanager
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 ver_re = re.compile(r"\d+.\d+.\d+")
@@ -34,18 +49,29 @@ CONDA_MIN_VERSION = VersionInfo.parse("4.8.0")
 UNISON_VERSION = VersionInfo.parse("2.53.3")
 
 SSH_SERVERALIVEINTERVAL = 30
+# Number of remotes that commands targeting all remotes work on at the same time
+PARALLEL_REMOTES = 4
+# Seconds an idle multiplexed SSH master connection is kept alive
+SSH_CONTROL_PERSIST = 600
 CONDA_LINUX_INSTALLER_URL = (
     "https://repo.anaconda.com/miniconda/Miniconda3-latest-Linux-x86_64.sh"
 )
 UNISON_LINUX_INSTALLER_URL = "https://github.com/bcpierce00/unison/releases/download/v2.53.3/unison-2.53.3-ubuntu-x86_64-static.tar.gz"
 
 
-GLOBAL_CONFIG_TEMPLATE = {"app_name": str, "ssh_key": str}
+GLOBAL_CONFIG_TEMPLATE = {
+    "app_name": str,
+    "fast_shell": bool,
+    "parallel_remotes": int,
+    "ssh_key": str,
+    "ssh_multiplexing": bool,
+}
 
 
 GLOBAL_REMOTE_TEMPLATE = {
     "conda_load_command": str,
     "hostname": str,
+    "persistent_shell": bool,
     "port": int,
     "scheduler": str,
     "unison_path": str,
@@ -67,36 +93,123 @@ PROJECT_REMOTE_TEMPLATE = {
     "env_name": str,
     "env_initialized": bool,
     "files_path": str,
+    "last_env_fingerprint": str,
     "last_files_sync": datetime,
     "last_env_sync": datetime,
+    "capabilities": dict,
 }
 
 
 DEBUG_CONFIG_ACCESS = os.getenv("RESOLOS_DEBUG_CONFIG_ACCESS")
 
+# Serializes read-modify-write updates of the config files between remote worker threads
+config_lock = threading.RLock()
+# Open lock files of the config files locked by this process, with their nesting depth
+config_file_locks = {}
+
+
+# Names of the lock files of the config files, see DictConfig.lock_path
+config_lock_file_re = re.compile(r"^\.[^/]+\.yaml\.lock$")
+
+
+def is_config_lock_file(name: str):
+    return config_lock_file_re.match(os.path.basename(name)) is not None
+
+
+# Parsed config files by path, with the stat of the file they were read from
+config_cache = {}
+config_cache_lock = threading.Lock()
+
+
+def config_file_key(path: pathlib.Path):
+    st = path.stat()
+    # Atomic writes replace the file, so the inode changes even within the mtime resolution
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
 
 class DictConfig(object):
+    """
+    A YAML config file. Reads are served from a process-wide cache as long as the file is
+    not modified, writes go through the cache and replace the file atomically.
+    """
+
     def __init__(self, path, default_generator=None):
         self.path = pathlib.Path(path)
         self.default_generator = default_generator
 
+    @property
+    def lock_path(self):
+        return self.path.with_name(f".{self.path.name}.lock")
+
+    @contextmanager
+    def locked(self):
+        """
+        Locks the config file against writes by other threads and other resolos processes,
+        wrap read-modify-write updates in it so that concurrent updates are not lost.
+        """
+        with config_lock:
+            held = config_file_locks.get(self.lock_path)
+            if held is not None:
+                held[1] += 1
+                try:
+                    yield self
+                finally:
+                    held[1] -= 1
+                return
+            if not self.path.parent.exists():
+                pathlib.Path.mkdir(self.path.parent, parents=True)
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                config_file_locks[self.lock_path] = [lock_file, 1]
+                try:
+                    yield self
+                finally:
+                    del config_file_locks[self.lock_path]
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
     def read(self):
         if not self.path.exists():
             if self.default_generator:
                 self.write(self.default_generator())
-        with self.path.open(mode="r") as f:
-            d = yaml.safe_load(f)
-            if DEBUG_CONFIG_ACCESS:
-                clog.debug(f"Read config {self.path}:\n{d}")
-            return d
+        key = config_file_key(self.path)
+        with config_cache_lock:
+            cached = config_cache.get(self.path)
+        if cached is not None and cached[0] == key:
+            d = copy.deepcopy(cached[1])
+        else:
+            with self.path.open(mode="r") as f:
+                d = yaml.load(f, Loader=SafeLoader)
+            with config_cache_lock:
+                config_cache[self.path] = (key, copy.deepcopy(d))
+        if DEBUG_CONFIG_ACCESS:
+            clog.debug(f"Read config {self.path}:\n{d}")
+        return d
 
     def write(self, d):
         if not self.path.parent.exists():
             pathlib.Path.mkdir(self.path.parent, parents=True)
-        with self.path.open(mode="w") as f:
-            if DEBUG_CONFIG_ACCESS:
-                clog.debug(f"Writing new config to {self.path}:\n{d}")
-            return yaml.dump(d, f)
+        if DEBUG_CONFIG_ACCESS:
+            clog.debug(f"Writing new config to {self.path}:\n{d}")
+        with self.locked():
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, mode="w") as f:
+                    yaml.dump(d, f, Dumper=SafeDumper)
+                if self.path.exists():
+                    shutil.copymode(self.path, tmp_path)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            with config_cache_lock:
+                config_cache[self.path] = (
+                    config_file_key(self.path),
+                    copy.deepcopy(d),
+                )
 
 
 def get_project_dict_config():
@@ -113,14 +226,19 @@ def read_project_remote_config(remote_id):
     return get_project_remote_dict_config().read().get(remote_id)
 
 
-def write_project_remote_config(remote_id, remote_config: dict):
+def write_project_remote_config(remote_id, remote_config: dict, replace=False):
+    """
+    Merges the settings of a remote into the project remote config file as it is on disk, so
+    that the updates of other remotes by concurrent resolos processes are kept.
+    """
     prdc = get_project_remote_dict_config()
-    prc = prdc.read()
-    if remote_id in prc:
-        prc[remote_id].update(remote_config)
-    else:
-        prc[remote_id] = remote_config
-    prdc.write(prc)
+    with prdc.locked():
+        prc = prdc.read()
+        if remote_id in prc and not replace:
+            prc[remote_id].update(remote_config)
+        else:
+            prc[remote_id] = remote_config
+        prdc.write(prc)
 
 
 def default_global_configs():
@@ -186,6 +304,7 @@ def create_project_folder():
     pathlib.Path.mkdir(resolos_hidden)
     pathlib.Path.mkdir(resolos_hidden / ("remotes"))
     pathlib.Path.touch(resolos_hidden / (".resolos_init_complete"))
+    forget_resolos_dir()
     return localdir
 
 
@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from .logging import clog
+from .exception import DownloadError
+
+# Number of ranges downloaded at the same time
+DOWNLOAD_CONNECTIONS = 4
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Chunks are sized so that downloading one takes about this long at the measured speed
+CHUNK_SECONDS = 2.0
+READ_SIZE = 256 * 1024
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0
+REQUEST_TIMEOUT = 30
+# Response codes worth retrying a request for
+RETRY_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+
+
+def parse_checksum(checksum: str):
+    """Splits a checksum like 'sha256:<hex digest>' into the algorithm and the digest"""
+    algorithm, sep, digest = checksum.partition(":")
+    algorithm = algorithm.lower()
+    if not sep or algorithm not in hashlib.algorithms_available:
+        raise DownloadError(
+            f"Invalid checksum '{checksum}', expected the format <algorithm>:<hex digest>, "
+            f"like sha256:9f86d081..."
+        )
+    return algorithm, digest.strip().lower()
+
+
+def file_checksum(path, algorithm):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(size, done):
+    """Returns the [start, end) ranges of the download that are not in the done ranges"""
+    missing = []
+    position = 0
+    for start, end in merge_ranges(done):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+class RangeScheduler(object):
+    """
+    Hands out the missing ranges of a download to the workers in order. The size of each
+    chunk follows the download speed of the worker that asks for it, so fast connections
+    make few requests and slow ones do not hold back the end of the download.
+    """
+
+    def __init__(
+        self, gaps, min_chunk_size=MIN_CHUNK_SIZE, max_chunk_size=MAX_CHUNK_SIZE
+    ):
+        self.lock = threading.Lock()
+        self.gaps = [list(gap) for gap in gaps]
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+
+    def chunk_size(self, rate):
+        if rate is None:
+            return self.min_chunk_size
+        return max(
+            self.min_chunk_size, min(self.max_chunk_size, int(rate * CHUNK_SECONDS))
+        )
+
+    def next_range(self, rate=None):
+        with self.lock:
+            if not self.gaps:
+                return None
+            start, end = self.gaps[0]
+            chunk_end = min(end, start + self.chunk_size(rate))
+            if chunk_end == end:
+                self.gaps.pop(0)
+            else:
+                self.gaps[0][0] = chunk_end
+            return start, chunk_end
+
+
+class Downloader(object):
+    """
+    Downloads a file over HTTP with parallel range requests. The data is written to
+    '<target>.part', and the finished ranges to '<target>.part.json', so an interrupted
+    download resumes where it stopped. Servers without range support are downloaded in a
+    single request. The size and validator of a finished download are kept in
+    '<target>.json', so that the target is not downloaded again while it is unchanged.
+    """
+
+    def __init__(
+        self,
+        url,
+        target_filename,
+        session=None,
+        connections=DOWNLOAD_CONNECTIONS,
+        checksum=None,
+        min_chunk_size=MIN_CHUNK_SIZE,
+        max_chunk_size=MAX_CHUNK_SIZE,
+    ):
+        self.url = url
+        self.target_filename = str(target_filename)
+        self.part_filename = f"{self.target_filename}.part"
+        self.state_filename = f"{self.target_filename}.part.json"
+        self.info_filename = f"{self.target_filename}.json"
+        self.session = session or requests.Session()
+        self.connections = connections
+        self.checksum = parse_checksum(checksum) if checksum else None
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.state_lock = threading.Lock()
+        self.state = None
+
+    def get(self, headers=None):
+        resp = self.session.get(
+            self.url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+        )
+        if resp.status_code in RETRY_STATUS_CODES:
+            resp.close()
+            raise requests.HTTPError(
+                f"Received response code {resp.status_code} for {self.url}"
+            )
+        if resp.status_code not in [200, 206]:
+            resp.close()
+            raise DownloadError(
+                f"Could not download {self.url}, received response code {resp.status_code}"
+            )
+        return resp
+
+    def retry(self, func, *args):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return func(*args)
+            except requests.RequestException as ex:
+                if attempt == MAX_RETRIES:
+                    raise DownloadError(
+                        f"Could not download {self.url} after {MAX_RETRIES} retries, "
+                        f"the error was: {ex}"
+                    )
+                delay = RETRY_BACKOFF * 2**attempt
+                clog.debug(f"Download request failed ({ex}), retrying in {delay}s...")
+                time.sleep(delay)
+
+    def probe(self):
+        """
+        Returns the size of the file, whether the server accepts range requests and the
+        validator (ETag or Last-Modified) of the file
+        """
+        with self.get({"Range": "bytes=0-0"}) as resp:
+            validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+            content_range = resp.headers.get("Content-Range", "")
+            if resp.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                if total.isdigit():
+                    return int(total), True, validator
+            length = resp.headers.get("Content-Length")
+            return (
+                int(length) if length and length.isdigit() else None,
+                False,
+                validator,
+            )
+
+    def load_state(self, size, validator):
+        state = {"url": self.url, "size": size, "validator": validator, "done": []}
+        if os.path.exists(self.state_filename) and os.path.exists(self.part_filename):
+            try:
+                with open(self.state_filename, "r") as f:
+                    saved = json.load(f)
+            except ValueError:
+                saved = {}
+            if (
+                saved.get("url") == self.url
+                and saved.get("size") == size
+                and saved.get("validator") == validator
+                and os.path.getsize(self.part_filename) == size
+            ):
+                state["done"] = saved.get("done", [])
+        if not state["done"]:
+            with open(self.part_filename, "wb") as f:
+                f.truncate(size)
+        return state
+
+    def mark_done(self, start, end):
+        with self.state_lock:
+            self.state["done"] = merge_ranges(self.state["done"] + [[start, end]])
+            tmp_filename = f"{self.state_filename}.tmp"
+            with open(tmp_filename, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_filename, self.state_filename)
+
+    def fetch_range(self, f, start, end, progress):
+        position = start + progress[0]
+        with self.get({"Range": f"bytes={position}-{end - 1}"}) as resp:
+            if resp.status_code != 206 or not resp.headers.get(
+                "Content-Range", ""
+            ).startswith(f"bytes {position}-"):
+                raise DownloadError(
+                    f"The server did not return the requested range of {self.url}, "
+                    f"has the file changed during the download?"
+                )
+            f.seek(position)
+            for data in resp.iter_content(READ_SIZE):
+                data = data[: end - position]
+                f.write(data)
+                position += len(data)
+                progress[0] = position - start
+        if position < end:
+            raise requests.ConnectionError(
+                f"Connection closed after {position - start} of {end - start} bytes"
+            )
+
+    def worker(self, scheduler):
+        rate = None
+        with open(self.part_filename, "r+b") as f:
+            while True:
+                chunk = scheduler.next_range(rate)
+                if chunk is None:
+                    return
+                start, end = chunk
+                started = time.monotonic()
+                # Retries continue from the last byte written
+                self.retry(self.fetch_range, f, start, end, [0])
+                rate = (end - start) / max(time.monotonic() - started, 0.001)
+                self.mark_done(start, end)
+
+    def download_ranges(self, size, validator):
+        self.state = self.load_state(size, validator)
+        gaps = missing_ranges(size, self.state["done"])
+        remaining = sum(end - start for start, end in gaps)
+        if remaining < size:
+            clog.info(f"Resuming download, {remaining} of {size} bytes are missing")
+        scheduler = RangeScheduler(gaps, self.min_chunk_size, self.max_chunk_size)
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = [
+                executor.submit(self.worker, scheduler) for _ in range(self.connections)
+            ]
+            for future in futures:
+                future.result()
+
+    def fetch_all(self):
+        with self.get() as resp, open(self.part_filename, "wb") as f:
+            for data in resp.iter_content(READ_SIZE):
+                f.write(data)
+
+    def verify(self, size):
+        actual_size = os.path.getsize(self.part_filename)
+        if size is not None and actual_size != size:
+            self.discard()
+            raise DownloadError(
+                f"Downloaded {actual_size} bytes from {self.url}, expected {size}"
+            )
+        if self.checksum:
+            algorithm, digest = self.checksum
+            actual = file_checksum(self.part_filename, algorithm)
+            if actual != digest:
+                self.discard()
+                raise DownloadError(
+                    f"The {algorithm} checksum of {self.url} is {actual}, expected {digest}"
+                )
+
+    def discard(self):
+        for filename in [self.part_filename, self.state_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def is_downloaded(self, size, validator):
+        """Returns whether the target is a finished download of the current file"""
+        if not os.path.exists(self.target_filename):
+            return False
+        try:
+            with open(self.info_filename, "r") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if info.get("url") != self.url or info.get("validator") != validator:
+            return False
+        if size is None and self.checksum is None:
+            return False
+        if size is not None and os.path.getsize(self.target_filename) != size:
+            return False
+        if self.checksum:
+            algorithm, digest = self.checksum
+            return file_checksum(self.target_filename, algorithm) == digest
+        return True
+
+    def download(self):
+        started = time.monotonic()
+        size, ranges, validator = self.retry(self.probe)
+        if self.is_downloaded(size, validator):
+            clog.info(f"Using the file downloaded earlier from {self.url}")
+            return self.target_filename
+        if os.path.exists(self.info_filename):
+            os.remove(self.info_filename)
+        if ranges and size:
+            clog.debug(
+                f"Downloading {size} bytes from {self.url} with {self.connections} connections"
+            )
+            self.download_ranges(size, validator)
+        else:
+            clog.debug(
+                f"The server does not support range requests, downloading {self.url} at once"
+            )
+            self.retry(self.fetch_all)
+        self.verify(size)
+        os.replace(self.part_filename, self.target_filename)
+        if os.path.exists(self.state_filename):
+            os.remove(self.state_filename)
+        with open(self.info_filename, "w") as f:
+            json.dump({"url": self.url, "size": size, "validator": validator}, f)
+        clog.debug(
+            f"Downloaded {self.url} to {self.target_filename} in {time.monotonic() - started:.1f}s"
+        )
+        return self.target_filename
+
+
+def download(url, target_filename, session=None, checksum=None, **kwargs):
+    """
+    Downloads url to target_filename, resuming an interrupted download of the same file.
+    If checksum ('<algorithm>:<hex digest>') is given, the downloaded file is verified.
+    """
+    return Downloader(
+        url, target_filename, session=session, checksum=checksum, **kwargs
+    ).download()
+
+
+def discard_download(target_filename):
+    """Removes a finished download and the information kept to reuse it"""
+    for filename in [target_filename, f"{target_filename}.json"]:
+        if os.path.exists(filename):
+            os.remove(filename)
@@ -0,0 +1,138 @@
+from .logging import clog
+from .config import DictConfig
+from .platform import get_env_snapshots_path
+from .conda_meta import record_url, EXPLICIT_HEADER
+
+# The snapshot of a remote environment looks like:
+
+# remote_id:
+#    env_name: Name of the environment on the remote
+#    platform: Platform of the synced conda packages, e.g. linux-64
+#    conda: Map of conda package names to the URL of the installed package
+#    pip: Map of canonical pip package names to the installed 'name==version'
+
+
+def get_env_snapshots_dict_config():
+    return DictConfig(get_env_snapshots_path(), dict)
+
+
+def env_snapshot(env, remote_env):
+    """Returns the snapshot of the packages of a local CondaEnvironment, synced to remote_env"""
+    return {
+        "env_name": remote_env,
+        "platform": env.platform,
+        "conda": {name: record_url(record) for name, record in env.packages.items()},
+        "pip": {
+            name: f"{pkg['name']}=={pkg['version']}"
+            for name, pkg in env.pip_packages.items()
+        },
+    }
+
+
+def read_env_snapshot(remote_id):
+    return (get_env_snapshots_dict_config().read() or {}).get(remote_id)
+
+
+def write_env_snapshot(remote_id, snapshot):
+    dc = get_env_snapshots_dict_config()
+    with dc.locked():
+        snapshots = dc.read() or {}
+        snapshots[remote_id] = snapshot
+        dc.write(snapshots)
+
+
+def forget_env_snapshot(remote_id):
+    if not get_env_snapshots_path().exists():
+        return
+    dc = get_env_snapshots_dict_config()
+    with dc.locked():
+        snapshots = dc.read() or {}
+        if snapshots.pop(remote_id, None) is not None:
+            dc.write(snapshots)
+
+
+def diff_env_snapshots(old, new):
+    """
+    Returns the plan that turns the environment described by the old snapshot into the new one.
+    Changed conda packages are replaced by installing their new URL, changed pip packages are
+    reinstalled in their new version.
+    """
+    old_conda, new_conda = old.get("conda", {}), new.get("conda", {})
+    old_pip, new_pip = old.get("pip", {}), new.get("pip", {})
+    return {
+        "pip_uninstall": sorted(
+            old_pip[name].split("==")[0] for name in old_pip if name not in new_pip
+        ),
+        "conda_remove": sorted(name for name in old_conda if name not in new_conda),
+        "conda_install": [
+            new_conda[name]
+            for name in sorted(new_conda)
+            if old_conda.get(name) != new_conda[name]
+        ],
+        "pip_install": [
+            new_pip[name]
+            for name in sorted(new_pip)
+            if old_pip.get(name) != new_pip[name]
+        ],
+    }
+
+
+def plan_is_empty(plan):
+    return not any(plan.values())
+
+
+def plan_env_delta(remote_id, remote_env, env):
+    """
+    Returns the delta plan to sync the local CondaEnvironment env to the remote environment,
+    or None if the remote environment has no usable snapshot and needs a full sync
+    """
+    old = read_env_snapshot(remote_id)
+    if old is None:
+        clog.debug(f"No environment snapshot of remote '{remote_id}' was found")
+        return None
+    if old.get("env_name") != remote_env or old.get("platform") != env.platform:
+        clog.debug(
+            f"The environment snapshot of remote '{remote_id}' was taken of a different environment"
+        )
+        return None
+    return diff_env_snapshots(old, env_snapshot(env, remote_env))
+
+
+def write_plan_files(plan, platform, spec_file, requirements_file):
+    with open(spec_file, "w") as f:
+        f.write(
+            f"{EXPLICIT_HEADER}# platform: {platform}\n@EXPLICIT\n"
+            + "".join(f"{url}\n" for url in plan["conda_install"])
+        )
+    with open(requirements_file, "w") as f:
+        f.write("\n".join(plan["pip_install"]))
+
+
+def plan_command(plan, remote_env, remote_spec_file, remote_requirements_file):
+    """
+    Returns a single command that applies the plan in the activated remote environment.
+    Conda packages are removed without solving and installed from explicit URLs,
+    pip packages are installed without their dependencies like in the full sync.
+    """
+    cmds = []
+    if plan["pip_uninstall"]:
+        cmds.append(f"pip uninstall -y {' '.join(plan['pip_uninstall'])}")
+    if plan["conda_remove"]:
+        cmds.append(
+            f"conda remove -y --force -n {remote_env} {' '.join(plan['conda_remove'])}"
+        )
+    if plan["conda_install"]:
+        cmds.append(f"conda install -y -n {remote_env} --file {remote_spec_file}")
+    if plan["pip_install"]:
+        cmds.append(
+            f"pip install --no-cache-dir --no-deps -r {remote_requirements_file}"
+        )
+    return " && ".join(cmds)
+
+
+def describe_plan(plan):
+    return ", ".join(
+        f"{action.replace('_', ' ')} {len(items)}"
+        for action, items in plan.items()
+        if items
+    )
@@ -21,6 +21,11 @@ class ShellError(ResolosException):
         super().__init__(msg)
 
 
+class RemoteShellUnavailableError(ShellError):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
 class SSHError(ResolosException):
     def __init__(self, msg):
         super().__init__(msg)
@@ -36,6 +41,12 @@ class RemoteCommandError(ResolosException):
         super().__init__(msg)
 
 
+class RemoteFanoutError(ResolosException):
+    def __init__(self, msg, failures=None):
+        super().__init__(msg)
+        self.failures = failures or {}
+
+
 class RemoteSpecificationError(ResolosException):
     def __init__(self, msg):
         super().__init__(msg)
@@ -114,3 +125,13 @@ class NotAResolosArchiveError(ResolosException):
 class YaretaError(ResolosException):
     def __init__(self, msg):
         super().__init__(msg)
+
+
+class DownloadError(ResolosException):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class UploadError(ResolosException):
+    def __init__(self, msg):
+        super().__init__(msg)
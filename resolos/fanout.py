@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from .logging import clog, remote_context
+from .config import get_global_dict_config, PARALLEL_REMOTES
+from .remote import list_remote_ids, get_remote
+from .exception import RemoteFanoutError
+
+
+def parallel_remotes():
+    value = get_global_dict_config().read().get("parallel_remotes")
+    return max(1, value) if value else PARALLEL_REMOTES
+
+
+# Label of the local machine in the prefixed output and in the reports
+LOCAL_ID = "local"
+
+
+def run_labelled(label, func, *args, **kwargs):
+    remote_context.remote_id = label
+    try:
+        return func(*args, **kwargs)
+    finally:
+        remote_context.remote_id = None
+
+
+def run_on_remote(func, remote_settings, *args, **kwargs):
+    return run_labelled(remote_settings["name"], func, remote_settings, *args, **kwargs)
+
+
+def run_on_remotes(func, remotes, *args, max_workers=None, **kwargs):
+    """
+    Calls func(remote_settings, *args, **kwargs) for all remotes at the same time, at most
+    max_workers of them at once. Messages logged by func are prefixed with the remote name.
+    Returns the map of remote ids to (True, return value) or (False, raised exception).
+    """
+    if max_workers is None:
+        max_workers = parallel_remotes()
+    results = {}
+    if not remotes:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(remotes))) as executor:
+        futures = {
+            remote_settings["name"]: executor.submit(
+                run_on_remote, func, remote_settings, *args, **kwargs
+            )
+            for remote_settings in remotes
+        }
+        for remote_id, future in futures.items():
+            try:
+                results[remote_id] = (True, future.result())
+            except Exception as ex:
+                results[remote_id] = (False, ex)
+    return results
+
+
+def run_local_and_remotes(local_func, remote_func, remotes, max_workers=None):
+    """
+    Calls local_func() while remote_func(remote_settings) runs for all remotes, as the local
+    and the remote work are independent. Returns the (success, value or exception) result of
+    the local call and the map of remote results, like run_on_remotes.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        local_future = executor.submit(run_labelled, LOCAL_ID, local_func)
+        results = run_on_remotes(remote_func, remotes, max_workers=max_workers)
+        try:
+            local_result = (True, local_future.result())
+        except Exception as ex:
+            local_result = (False, ex)
+    return local_result, results
+
+
+def list_remotes(db):
+    return [get_remote(db, remote_id) for remote_id in list_remote_ids(db)]
+
+
+def error_message(ex):
+    return ex.msg if hasattr(ex, "msg") else repr(ex)
+
+
+def target_name(target_id):
+    return "the local machine" if target_id == LOCAL_ID else f"remote '{target_id}'"
+
+
+def report_results(results, action, local_result=None, rollback_hint=None):
+    """
+    Logs the outcome of the action on each remote (and on the local machine, if local_result
+    is given), and raises RemoteFanoutError if it failed on any of them.
+    If the action changed some of the targets only, it logs the rollback_hint.
+    """
+    if local_result is not None:
+        results = {LOCAL_ID: local_result, **results}
+    failures = {
+        target_id: ex for target_id, (success, ex) in results.items() if not success
+    }
+    for target_id, (success, result) in results.items():
+        if success:
+            clog.info(f"PASS - {action} on {target_name(target_id)}")
+        else:
+            clog.error(
+                f"FAIL - {action} on {target_name(target_id)}, the error was:\n\n"
+                f"{error_message(result)}\n"
+            )
+    if rollback_hint and failures and len(failures) < len(results):
+        succeeded = [target_name(t) for t in results if t not in failures]
+        clog.warning(
+            f"{action} succeeded on {', '.join(succeeded)} but failed on "
+            f"{', '.join(target_name(t) for t in failures)}, the environments are not in sync anymore. "
+            f"{rollback_hint}"
+        )
+    if failures:
+        raise RemoteFanoutError(
+            f"{action} failed on {len(failures)} of {len(results)} targets: "
+            + ", ".join(failures),
+            failures=failures,
+        )
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import shlex
+import threading
+from pathlib import Path
+from shutil import which
+from .logging import clog
+from .config import DictConfig, get_global_dict_config, config_lock
+from .platform import get_conda_shell_cache_path
+from .shell import run_shell_cmd, run_exec_cmd, trim_stdout, CMD_BEGIN
+from .exception import ShellError
+
+# Variables that describe the capturing shell itself rather than the conda setup
+IGNORED_ENV_VARS = ["PWD", "OLDPWD", "SHLVL", "_"]
+
+conda_shell_env_lock = threading.Lock()
+conda_env_prefixes = {}
+conda_env_prefixes_lock = threading.Lock()
+
+
+def fast_shell_enabled():
+    return bool(get_global_dict_config().read().get("fast_shell", False))
+
+
+def get_conda_shell_cache():
+    return DictConfig(get_conda_shell_cache_path(), dict)
+
+
+def find_conda_exe():
+    conda_exe = os.environ.get("CONDA_EXE")
+    if conda_exe and Path(conda_exe).exists():
+        return conda_exe
+    # conda is usually only initialized by the user's shell profile
+    ret_val, output = run_shell_cmd('echo "CONDA_EXE=$CONDA_EXE"')
+    m = re.search(r"CONDA_EXE=(\S+)", output)
+    if ret_val == 0 and m and Path(m.group(1)).exists():
+        return m.group(1)
+    return which("conda")
+
+
+def capture_conda_shell_env(conda_exe):
+    """
+    Returns the environment variables that 'conda shell.bash hook' adds or changes,
+    captured from a shell that does not read any profile
+    """
+    ret_val, output = run_exec_cmd(
+        [
+            "bash",
+            "--noprofile",
+            "--norc",
+            "-c",
+            f'eval "$("$1" shell.bash hook)" && echo {CMD_BEGIN} && env -0',
+            "bash",
+            conda_exe,
+        ]
+    )
+    if ret_val != 0:
+        raise ShellError(
+            f"Could not capture the conda shell environment, the output was:\n\n{output}\n\n"
+        )
+    env = {}
+    for item in trim_stdout(output).lstrip("\n").split("\0"):
+        key, sep, value = item.partition("=")
+        if sep and key not in IGNORED_ENV_VARS and os.environ.get(key) != value:
+            env[key] = value
+    return env
+
+
+def get_conda_shell_env():
+    """
+    Returns the conda executable and the environment to run it with, captured once and
+    cached in the global config folder. The cache is refreshed when the conda executable
+    changes. Returns (None, None) if conda cannot be found.
+    """
+    cached = read_conda_shell_env()
+    if cached is not None:
+        return cached
+    # Concurrent callers wait for a single capture, which takes seconds, without holding
+    # the config lock that every config read and write needs
+    with conda_shell_env_lock:
+        cached = read_conda_shell_env()
+        if cached is not None:
+            return cached
+        return capture_and_cache_conda_shell_env()
+
+
+def read_conda_shell_env():
+    """Returns the cached conda executable and environment, or None if they are stale"""
+    with config_lock:
+        cached = get_conda_shell_cache().read() or {}
+    conda_exe = cached.get("conda_exe")
+    current_conda_exe = os.environ.get("CONDA_EXE")
+    if (
+        conda_exe
+        and Path(conda_exe).exists()
+        and Path(conda_exe).stat().st_mtime == cached.get("conda_exe_mtime")
+        and (current_conda_exe is None or current_conda_exe == conda_exe)
+    ):
+        env = dict(os.environ)
+        env.update(cached.get("env", {}))
+        return conda_exe, env
+    return None
+
+
+def capture_and_cache_conda_shell_env():
+    conda_exe = find_conda_exe()
+    if conda_exe is None:
+        return None, None
+    clog.debug(f"Capturing conda shell environment of {conda_exe}...")
+    try:
+        captured = capture_conda_shell_env(conda_exe)
+    except ShellError as ex:
+        clog.debug(ex.msg)
+        return None, None
+    with config_lock:
+        get_conda_shell_cache().write(
+            {
+                "conda_exe": conda_exe,
+                "conda_exe_mtime": Path(conda_exe).stat().st_mtime,
+                "env": captured,
+            }
+        )
+    env = dict(os.environ)
+    env.update(captured)
+    return conda_exe, env
+
+
+def invalidate_conda_shell_env():
+    with config_lock:
+        get_conda_shell_cache().write({})
+    conda_env_prefixes.clear()
+
+
+def get_conda_env_prefix(env_name: str):
+    """
+    Returns the prefix of the named conda environment, or None if it does not exist
+    or conda is not available
+    """
+    if env_name in conda_env_prefixes:
+        return conda_env_prefixes[env_name]
+    # Concurrent lookups wait for a single 'conda env list' run
+    with conda_env_prefixes_lock:
+        if env_name in conda_env_prefixes:
+            return conda_env_prefixes[env_name]
+        return list_conda_env_prefixes().get(env_name)
+
+
+def list_conda_env_prefixes():
+    conda_exe, env = get_conda_shell_env()
+    if conda_exe is None:
+        return {}
+    ret_val, output = run_exec_cmd([conda_exe, "env", "list", "--json"], env=env)
+    if ret_val != 0:
+        return {}
+    try:
+        prefixes = json.loads(output[output.index("{") :])["envs"]
+    except (ValueError, KeyError):
+        clog.debug(f"Could not parse conda environment list:\n{output}")
+        return {}
+    root_prefix = str(Path(conda_exe).parent.parent)
+    found = {}
+    for prefix in prefixes:
+        name = "base" if prefix == root_prefix else Path(prefix).name
+        found.setdefault(name, prefix)
+    conda_env_prefixes.clear()
+    conda_env_prefixes.update(found)
+    return found
+
+
+def forget_conda_env_prefixes():
+    conda_env_prefixes.clear()
+
+
+def activated_env(env, env_name, prefix):
+    """Emulates 'conda activate' for commands that only rely on the conda variables"""
+    env = dict(env)
+    env["CONDA_PREFIX"] = prefix
+    env["CONDA_DEFAULT_ENV"] = env_name
+    env["CONDA_SHLVL"] = "1"
+    env["PATH"] = f"{Path(prefix) / 'bin'}{os.pathsep}{env.get('PATH', '')}"
+    return env
+
+
+def run_local_conda_cmd(cmd, env_name=None, stdout_as_info=False, mamba=False):
+    """
+    Runs 'conda <cmd>' (or 'mamba <cmd>') by executing conda directly with the cached shell
+    environment instead of starting an interactive login shell.
+    Returns None if this is not possible, in which case the caller should fall back to
+    running the command in a shell.
+    """
+    if env_name is not None and env_name.startswith("source "):
+        return None
+    conda_exe, env = get_conda_shell_env()
+    if conda_exe is None:
+        return None
+    if env_name is not None:
+        prefix = get_conda_env_prefix(env_name)
+        if prefix is None:
+            return None
+        env = activated_env(env, env_name, prefix)
+    if mamba:
+        exe = which("mamba", path=env.get("PATH"))
+        if exe is None:
+            return None
+    else:
+        exe = conda_exe
+    try:
+        return run_exec_cmd(
+            [exe] + shlex.split(cmd), env=env, stdout_as_info=stdout_as_info
+        )
+    except OSError as ex:
+        clog.debug(f"Cached conda shell environment is stale ({ex}), discarding it")
+        invalidate_conda_shell_env()
+        return None
@@ -0,0 +1,106 @@
+import re
+import heapq
+from collections import deque
+
+spec_name_re = re.compile(r"^([^\s=<>!~\[]+)")
+
+
+def spec_name(spec: str):
+    """Returns the package name of a match spec like 'numpy >=1.19,<2.0a0'"""
+    m = spec_name_re.match(spec.strip().split("::")[-1])
+    return m.group(1) if m else None
+
+
+class DependencyGraph(object):
+    """
+    Directed graph of packages, with an edge from each package to each of its dependencies.
+    Both directions are indexed, so dependency and dependent lookups do not scan the graph.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.depends = {}
+        self.required_by = {}
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_node(self, name, data=None):
+        self.nodes[name] = data
+        self.depends.setdefault(name, set())
+        self.required_by.setdefault(name, set())
+
+    def add_edge(self, name, dependency):
+        for node in (name, dependency):
+            if node not in self.nodes:
+                self.add_node(node)
+        if name != dependency:
+            self.depends[name].add(dependency)
+            self.required_by[dependency].add(name)
+
+    def leaves(self):
+        """Packages that no other package depends on, the ones a user installed explicitly"""
+        return sorted(n for n, dependents in self.required_by.items() if not dependents)
+
+    def roots(self):
+        """Packages without any dependencies"""
+        return sorted(n for n, deps in self.depends.items() if not deps)
+
+    def _walk(self, name, edges, recursive):
+        if not recursive:
+            return sorted(edges.get(name, ()))
+        seen = set()
+        queue = deque(edges.get(name, ()))
+        while queue:
+            node = queue.popleft()
+            if node in seen or node == name:
+                continue
+            seen.add(node)
+            queue.extend(edges[node])
+        return sorted(seen)
+
+    def dependencies(self, name, recursive=False):
+        return self._walk(name, self.depends, recursive)
+
+    def dependents(self, name, recursive=False):
+        return self._walk(name, self.required_by, recursive)
+
+    def topological_order(self):
+        """
+        Returns the packages ordered so that each comes after its dependencies, ties are broken
+        by name. Packages on a dependency cycle are appended in name order.
+        """
+        remaining = {name: len(deps) for name, deps in self.depends.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            name = heapq.heappop(ready)
+            order.append(name)
+            for dependent in self.required_by[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, dependent)
+        if len(order) < len(self.nodes):
+            placed = set(order)
+            order.extend(sorted(n for n in self.nodes if n not in placed))
+        return order
+
+
+def conda_dependency_graph(packages: dict):
+    """
+    Builds the dependency graph of conda package records, keyed by package name.
+    Dependencies that are not installed, like virtual packages (__glibc), are left out.
+    """
+    graph = DependencyGraph()
+    for name, record in packages.items():
+        graph.add_node(name, record)
+    for name, record in packages.items():
+        for spec in record.get("depends", []):
+            dependency = spec_name(spec)
+            if dependency in packages:
+                graph.add_edge(name, dependency)
+    return graph
@@ -5,12 +5,20 @@ from .config import (
     randomString,
     get_project_dict_config,
     get_project_remote_dict_config,
+    write_project_remote_config,
     in_resolos_dir,
     get_project_settings_for_remote,
 )
-from .platform import get_arch, get_user_platform, in_home_folder, find_resolos_dir
+from .platform import (
+    get_arch,
+    get_user_platform,
+    in_home_folder,
+    find_resolos_dir,
+    forget_resolos_dir,
+)
 from .remote import list_remote_ids, read_remote_db, get_remote
 from .shell import remove_remote_folder
+from .capabilities import forget_remote_capabilities
 from .conda import (
     check_conda_env_exists_local,
     create_conda_env_local,
@@ -120,10 +128,15 @@ def _init_project(
             ):
                 now = datetime.utcnow()
                 sync_env_and_files(remote_settings)
-                project_remote_config[remote_id]["env_initialized"] = True
-                project_remote_config[remote_id]["last_files_sync"] = now
-                project_remote_config[remote_id]["last_env_sync"] = now
-                prdc.write(project_remote_config)
+                # The sync updates the remote config, e.g. with the env fingerprint
+                write_project_remote_config(
+                    remote_id,
+                    {
+                        "env_initialized": True,
+                        "last_files_sync": now,
+                        "last_env_sync": now,
+                    },
+                )
                 clog.info(
                     f"Project files and environment successfully synced to remote '{remote_id}'"
                 )
@@ -189,6 +202,7 @@ def teardown(skip_local=True, skip_remotes=True):
                     execute_remote_conda_command(
                         f"env remove --name {remote_env}", remote_settings
                     )
+                    forget_remote_capabilities(remote_settings)
                     clog.info(f"Removed remote env '{remote_env}'")
                 else:
                     clog.info(f"Found no configured remote env to remove")
@@ -206,4 +220,5 @@ def teardown(skip_local=True, skip_remotes=True):
             clog.info(f"No linked local environment was found to be deleted")
         resolos_dir = find_resolos_dir()
         shutil.rmtree(resolos_dir)
+        forget_resolos_dir()
         clog.info(f"Removed folder {resolos_dir}")
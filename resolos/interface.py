@@ -10,27 +10,11 @@ import click_log
 from .logging import clog
 from .remote import (
     get_remote,
-    list_remote_ids,
     read_remote_db,
 )
-from .remote_configuration import (
-    add_remote_configuration,
-    update_remote_configuration,
-    teardown_remote_configuration,
-)
-from .check import check_target, check, setup_ssh
-from .unison import sync_files
-from .conda import (
-    execute_command_in_local_conda_env,
-    install_conda_packages,
-    uninstall_conda_packages,
-    sync_env_and_files,
-    sync_env_and_files_with_auto_resolve_deps,
-)
-from .archive import make_archive, load_archive
-from .job import job_cancel, job_list, job_status, job_submit, job_run
+from .fanout import list_remotes
+from .compression import CODECS, DEFAULT_CODEC
 from .exception import NoRemotesError
-from .init import init_project, teardown
 import yaml
 
 
@@ -119,6 +103,10 @@ def res_init(ctx, **kwargs):
     - Initializes a new conda environment or link and existing one for the project
 
     """
+    # Subcommands import the modules implementing them when they run, so that a command
+    # does not pay for importing the dependencies of all the others
+    from .check import check_target
+    from .init import init_project
 
     verify_mutually_exclusive_options(
         ["url", "filename", "deposit_id"],
@@ -164,6 +152,8 @@ def res_teardown(ctx, **kwargs):
     - Removes the linked conda environment
 
     """
+    from .init import teardown
+
     teardown(kwargs.get("skip_local", False), kwargs.get("skip_remotes", False))
 
 
@@ -181,6 +171,8 @@ def res_check(ctx, **kwargs):
     Must be called from a resolos project
 
     """
+    from .check import check
+
     check(kwargs.get("raise_on_error", False))
 
 
@@ -209,6 +201,8 @@ def res_setup_ssh(ctx, **kwargs):
     Only needs to be run once per remote.
 
     """
+    from .check import setup_ssh
+
     remote_settings = get_remote(read_remote_db(), kwargs.get("remote"))
     setup_ssh(remote_settings)
 
@@ -266,6 +260,14 @@ def res_remote(ctx):
     default="./bin/unison",
     help="The path of the unison executable on the remote",
 )
+@click.option(
+    "--persistent-shell",
+    is_flag=True,
+    default=False,
+    help="Keep one login shell open on the remote and run all commands in it, "
+    "so that the shell profile and the conda load command are only sourced once",
+    required=False,
+)
 @click.option(
     "--remote-env-name",
     type=str,
@@ -294,6 +296,8 @@ def res_remote_add(ctx, **kwargs):
     """
     Adds a new remote with name 'name' to the Resolos configuration
     """
+    from .remote_configuration import add_remote_configuration
+
     add_remote_configuration(**kwargs)
 
 
@@ -333,6 +337,12 @@ def res_remote_add(ctx, **kwargs):
     type=str,
     help="The path of the unison executable on the remote",
 )
+@click.option(
+    "--persistent-shell/--no-persistent-shell",
+    default=None,
+    help="Keep one login shell open on the remote and run all commands in it, "
+    "so that the shell profile and the conda load command are only sourced once",
+)
 @click.option(
     "--remote-env-name",
     type=str,
@@ -355,6 +365,8 @@ def res_remote_update(ctx, **kwargs):
     """
     Updates existing remote with name 'name' in the Resolos configuration
     """
+    from .remote_configuration import update_remote_configuration
+
     update_remote_configuration(**kwargs)
 
 
@@ -371,6 +383,8 @@ def res_remote_remove(ctx, **kwargs):
     """
     Removes the remote from the Resolos configuration
     """
+    from .remote_configuration import teardown_remote_configuration
+
     teardown_remote_configuration(**kwargs)
 
 
@@ -397,6 +411,12 @@ def res_remote_list(ctx):
     help="Also update the conda environment on remote with the packages installed on the local machine",
     required=False,
 )
+@click.option(
+    "--force-env",
+    is_flag=True,
+    help="Sync the conda environment even if it did not change since the last sync with the remote",
+    required=False,
+)
 @click.option(
     "--auto-resolve-deps",
     is_flag=True,
@@ -418,14 +438,19 @@ def res_sync(ctx, **kwargs):
     """
     Performs a 2-way sync on the project files
     If the --env flag is specified, locally installed packages are synced to the remote environment.
+    The environment sync is skipped if the local environment did not change since the last sync,
+    unless the --force-env flag is specified.
     If the --auto-resolve-deps flag is specified, dependent package versions will not be pinned.
     In case only one remote is configured, the remote does not need to be specified.
     """
+    from .unison import sync_files
+    from .conda import sync_env_and_files, sync_env_and_files_with_auto_resolve_deps
+
     remote_settings = get_remote(read_remote_db(), kwargs.get("remote"))
 
     if kwargs.get("env"):
-        sync_env_and_files(remote_settings)
-    elif kwargs.get("auto-resolve-deps"):
+        sync_env_and_files(remote_settings, force=kwargs.get("force_env"))
+    elif kwargs.get("auto_resolve_deps"):
         sync_env_and_files_with_auto_resolve_deps(
             remote_settings=remote_settings, mamba=kwargs.get("mamba")
         )
@@ -438,6 +463,8 @@ def res_sync(ctx, **kwargs):
 @click.argument("command", type=str)
 @click.pass_context
 def res_run(ctx, **kwargs):
+    from .conda import execute_command_in_local_conda_env
+
     cmd = kwargs.get("command")
     local_env = get_project_env()
     execute_command_in_local_conda_env(cmd, local_env)
@@ -496,6 +523,8 @@ def res_job_run(ctx, command, **kwargs):
     """
     Submits the given command on the remote
     """
+    from .job import job_run
+
     local_env, remote_env, remote_path = get_project_settings_for_remote(
         ctx.obj["remote"]
     )
@@ -509,6 +538,8 @@ def res_job_submit(ctx, submission_script, **kwargs):
     """
     Submits the given script on the remote
     """
+    from .job import job_submit
+
     local_env, remote_env, remote_path = get_project_settings_for_remote(
         ctx.obj["remote"]
     )
@@ -522,6 +553,8 @@ def res_job_cancel(ctx, job_id, **kwargs):
     """
     Cancels the job on the remote identified by the supplied job_id
     """
+    from .job import job_cancel
+
     job_cancel(ctx.obj["remote_settings"], job_id)
     clog.info(f"Cancelled job {job_id}")
 
@@ -533,6 +566,8 @@ def res_job_status(ctx, job_id, **kwargs):
     """
     Displays the job details on the remote identified by the supplied job_id
     """
+    from .job import job_status
+
     job_status(ctx.obj["remote_settings"], job_id)
 
 
@@ -548,6 +583,8 @@ def res_job_list(ctx, **kwargs):
     """
     Lists the job(s) on the remote
     """
+    from .job import job_list
+
     job_list(ctx.obj["remote_settings"], kwargs.get("all_users", False))
 
 
@@ -589,6 +626,14 @@ def res_archive(ctx):
     default=None,
     help="The filename of the archive",
 )
+@click.option(
+    "-s",
+    "--store",
+    type=click.Path(),
+    default=None,
+    help="The folder of a snapshot store to add the archive to, "
+    "only the files changed since the previous snapshots are stored",
+)
 @click.option(
     "-t",
     "--title",
@@ -632,11 +677,27 @@ def res_archive(ctx):
     help="Do not pack installed conda packages in the archive, only store the package list.",
     required=False,
 )
+@click.option(
+    "--compression",
+    type=click.Choice(list(CODECS)),
+    default=DEFAULT_CODEC,
+    help="The compression of the archive. pgzip compresses gzip on all cores, "
+    "zstd needs the 'zstandard' package.",
+    required=False,
+)
+@click.option(
+    "--no-wait",
+    is_flag=True,
+    default=False,
+    help="Return once the archive is uploaded to Yareta, without waiting to submit the deposit. "
+    "Use 'r3s archive status' to submit it later.",
+    required=False,
+)
 @click.pass_context
 def res_archive_create(ctx, **kwargs):
     """
-    Archives the project to the specified destination. The currently supported destinations are local file (-f, --filename)
-    and Yareta archive (-o, --organizational-unit-id).
+    Archives the project to the specified destination. The currently supported destinations are local file (-f, --filename),
+    Yareta archive (-o, --organizational-unit-id) and snapshot store (-s, --store).
 
     Notes for the local file destination:
 
@@ -644,6 +705,8 @@ def res_archive_create(ctx, **kwargs):
         Filename must be a filesystem path (e.g. ../res_v1.tar.gz) writeable for the the resolos process.
         The path should not be inside the project folder.
     """
+    from .archive import make_archive
+
     local_env = get_project_env()
     make_archive(local_env, **kwargs)
 
@@ -681,6 +744,24 @@ def res_archive_create(ctx, **kwargs):
     type=str,
     help="The url to load the archive from",
 )
+@click.option(
+    "-s",
+    "--store",
+    type=click.Path(),
+    help="The folder of the snapshot store to load the archive from",
+)
+@click.option(
+    "--snapshot",
+    type=str,
+    help="The id of the snapshot to load from --store, the latest one by default",
+    required=False,
+)
+@click.option(
+    "--checksum",
+    type=str,
+    help="The expected checksum of the archive downloaded from --url, like sha256:<hex digest>",
+    required=False,
+)
 @click.option(
     "-y",
     is_flag=True,
@@ -694,10 +775,51 @@ def res_archive_load(ctx, **kwargs):
 
     Source can be a filesystem path or a publicly accessible https download url.
     """
+    from .archive import load_archive
 
     load_archive(confirm_needed=not kwargs.get("y"), **kwargs)
 
 
+@res_archive.command("status")
+@click.option(
+    "--base-url",
+    type=str,
+    envvar="YARETA_BASE_URL",
+    default="https://access.yareta.unige.ch",
+    help="The base url of the Yareta API",
+)
+@click.option(
+    "-a",
+    "--access-token",
+    type=str,
+    envvar="YARETA_ACCESS_TOKEN",
+    help="The personal DLCM access token",
+)
+@click.option(
+    "-d",
+    "--deposit-id",
+    type=str,
+    help="The deposit id of the Yareta deposit",
+)
+@click.option(
+    "--wait",
+    is_flag=True,
+    default=False,
+    help="Wait until Yareta has processed the deposit, then submit it.",
+    required=False,
+)
+@click.pass_context
+def res_archive_status(ctx, **kwargs):
+    """
+    Shows the status of a Yareta deposit, and submits it if Yareta has processed the uploaded archive.
+
+    Use it to finish deposits created with 'r3s archive create --no-wait'.
+    """
+    from .archive import archive_status
+
+    archive_status(**kwargs)
+
+
 @res.command("install")
 @click.argument("packages", nargs=-1)
 @click.option(
@@ -732,31 +854,26 @@ def res_install(ctx, packages, **kwargs):
     Installs conda package(s) into the linked local and remote conda environments
 
     """
+    from .conda import install_conda_packages_local_and_remote
+
     all_remotes = kwargs.get("all_remotes")
     channel = kwargs.get("channel")
     mamba = kwargs.get("mamba")
 
+    db = read_remote_db()
     if all_remotes:
-        install_conda_packages(packages, channel=channel, mamba=mamba)
-        db = read_remote_db()
-        remote_ids = list_remote_ids(db)
-        for remote_id in remote_ids:
-            remote_settings = get_remote(db, remote_id)
-            install_conda_packages(
-                packages, target=remote_settings, channel=channel, mamba=mamba
-            )
+        remotes = list_remotes(db)
     else:
         try:
-            remote_settings = get_remote(read_remote_db(), kwargs.get("remote"))
-            install_conda_packages(packages, channel=channel, mamba=mamba)
-            install_conda_packages(
-                packages, target=remote_settings, channel=channel, mamba=mamba
-            )
+            remotes = [get_remote(db, kwargs.get("remote"))]
         except NoRemotesError as ex:
             clog.info(
                 "No remotes were specified, will only install the package locally"
             )
-            install_conda_packages(packages, channel=channel, mamba=mamba)
+            remotes = []
+    install_conda_packages_local_and_remote(
+        packages, remotes, channel=channel, mamba=mamba
+    )
 
     clog.info(f"Successfully installed packages {packages}")
 
@@ -782,23 +899,20 @@ def res_uninstall(ctx, packages, **kwargs):
     Uninstall conda package(s) from the linked local and remote conda environments
 
     """
+    from .conda import uninstall_conda_packages_local_and_remote
+
     all_remotes = kwargs.get("all_remotes")
+    db = read_remote_db()
     if all_remotes:
-        uninstall_conda_packages(packages)
-        db = read_remote_db()
-        remote_ids = list_remote_ids(db)
-        for remote_id in remote_ids:
-            remote_settings = get_remote(db, remote_id)
-            uninstall_conda_packages(packages, remote_settings)
+        remotes = list_remotes(db)
     else:
         try:
-            remote_settings = get_remote(read_remote_db(), kwargs.get("remote"))
-            uninstall_conda_packages(packages)
-            uninstall_conda_packages(packages, remote_settings)
+            remotes = [get_remote(db, kwargs.get("remote"))]
         except NoRemotesError as ex:
             clog.info(
                 "No remotes were specified, will only uninstall the package(s) locally"
             )
-            uninstall_conda_packages(packages)
+            remotes = []
+    uninstall_conda_packages_local_and_remote(packages, remotes)
 
     clog.info(f"Successfully uninstalled packages {packages}")
@@ -1,5 +1,9 @@
 import click_log
 import logging
+import threading
+
+# Set in worker threads that handle a single remote, see fanout.run_on_remotes
+remote_context = threading.local()
 
 
 class MyFormatter(click_log.ColorFormatter):
@@ -16,8 +20,20 @@ class MyFormatter(click_log.ColorFormatter):
         return new_msg
 
 
+class RemotePrefixFilter(logging.Filter):
+    """Prefixes the messages logged while working on a remote with the remote name"""
+
+    def filter(self, record):
+        remote_id = getattr(remote_context, "remote_id", None)
+        if remote_id is not None:
+            record.msg = f"[{remote_id}] {record.getMessage()}"
+            record.args = ()
+        return True
+
+
 clog = logging.getLogger(__name__)
 myhandler = click_log.ClickHandler()
 myhandler.formatter = MyFormatter()
 clog.handlers = [myhandler]
 clog.propagate = False
+clog.addFilter(RemotePrefixFilter())
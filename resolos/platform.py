@@ -3,7 +3,7 @@ import pathlib
 import os
 from platform import machine, python_version
 from .logging import clog
-from .exception import NotAProjectFolderError
+from .exception import NotAProjectFolderError, ResolosPathException
 
 
 def get_user_platform():
@@ -85,6 +85,18 @@ def get_unison_config_folder():
     return get_default_config_dir() / ("unison")
 
 
+def get_ssh_control_dir():
+    return get_default_config_dir() / ("ssh")
+
+
+def get_conda_shell_cache_path():
+    return get_default_config_dir() / ("conda_shell.yaml")
+
+
+def get_downloads_dir():
+    return get_default_config_dir() / ("downloads")
+
+
 def get_local_remotes_dir():
     return find_resolos_dir() / ("remotes")
 
@@ -93,6 +105,10 @@ def get_project_remotes_config_path():
     return get_local_remotes_dir() / ("remotes.yaml")
 
 
+def get_env_snapshots_path():
+    return get_local_remotes_dir() / ("env_snapshots.yaml")
+
+
 def get_envs_path():
     return get_local_remotes_dir() / ("envs.yaml")
 
@@ -101,8 +117,12 @@ def get_project_config_path():
     return find_resolos_dir() / ("config.yaml")
 
 
-def find_resolos_dir():
-    localdir = pathlib.Path.cwd()
+# The .resolos folder found for each working directory or RESOLOS_PROJECT_DIR value, None
+# if it is not in a project
+resolos_dirs = {}
+
+
+def search_resolos_dir(localdir: pathlib.Path):
     px = localdir
     i = 1
     while True and i < 256:
@@ -116,10 +136,41 @@ def find_resolos_dir():
         i += 1
         if px_old == px:
             break
-    raise NotAProjectFolderError(
-        f"Folder '{localdir}' is not in a resolos project folder. Please execute the command from a "
-        f"resolos project folder instead"
-    )
+    return None
+
+
+def find_resolos_dir():
+    """
+    Returns the .resolos folder of the project of the working directory, or of the project
+    folder set in the RESOLOS_PROJECT_DIR environment variable. The result is cached for
+    the process, call forget_resolos_dir() after creating or removing a project.
+    """
+    project_dir = os.getenv("RESOLOS_PROJECT_DIR")
+    if project_dir:
+        key = ("RESOLOS_PROJECT_DIR", project_dir)
+        if key not in resolos_dirs:
+            resolos_dir = pathlib.Path(project_dir).absolute() / (".resolos")
+            if not pathlib.Path.exists(resolos_dir / (".resolos_init_complete")):
+                resolos_dir = None
+            resolos_dirs[key] = resolos_dir
+        if resolos_dirs[key] is None:
+            raise NotAProjectFolderError(
+                f"Folder '{project_dir}' set in RESOLOS_PROJECT_DIR is not a resolos project folder"
+            )
+        return resolos_dirs[key]
+    localdir = pathlib.Path.cwd()
+    if localdir not in resolos_dirs:
+        resolos_dirs[localdir] = search_resolos_dir(localdir)
+    if resolos_dirs[localdir] is None:
+        raise NotAProjectFolderError(
+            f"Folder '{localdir}' is not in a resolos project folder. Please execute the command from a "
+            f"resolos project folder instead"
+        )
+    return resolos_dirs[localdir]
+
+
+def forget_resolos_dir():
+    resolos_dirs.clear()
 
 
 def find_project_dir():
@@ -141,7 +192,16 @@ def in_home_folder():
 def resolos_relative_path(path=None):
     if path is None:
         path = pathlib.Path.cwd()
-
+    path = pathlib.Path(path)
     project_dir = find_project_dir()
-    relative_path = path.absolute().relative_to(project_dir)
-    return relative_path
+    if not path.is_absolute():
+        cwd = pathlib.Path.cwd().absolute()
+        # With RESOLOS_PROJECT_DIR set, the working directory might be outside the project
+        if cwd != project_dir and project_dir not in cwd.parents:
+            path = project_dir / path
+    try:
+        return path.absolute().relative_to(project_dir)
+    except ValueError:
+        raise ResolosPathException(
+            f"Path '{path}' is not inside the project folder '{project_dir}'"
+        )
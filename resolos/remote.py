@@ -39,13 +39,13 @@ def add_remote(db, remote_id, desc):
     if remote_id in db:
         raise RemoteAlreadyExistsError(f"Remote '{remote_id}' already exists")
     db[remote_id] = desc
-    write_dict_to_remote_db(db)
+    write_remote_to_remote_db(remote_id, desc, new=True)
     return
 
 
 def set_remote(db, remote_id, desc):
     db[remote_id] = desc
-    write_dict_to_remote_db(db)
+    write_remote_to_remote_db(remote_id, desc)
     return
 
 
@@ -57,7 +57,7 @@ def delete_remote(db, remote_id):
             f"Remote '{remote_id}' does not exist, cannot delete it"
         )
 
-    write_dict_to_remote_db(db)
+    write_remote_to_remote_db(remote_id, None)
     return
 
 
@@ -73,6 +73,23 @@ def write_dict_to_remote_db(d):
     return get_global_remotes_dict_config().write(d)
 
 
+def write_remote_to_remote_db(remote_id, desc, new=False):
+    """
+    Writes the settings of a single remote, or deletes the remote if desc is None, in the
+    remotes file as it is on disk, keeping the changes of concurrent resolos processes
+    """
+    dc = get_global_remotes_dict_config()
+    with dc.locked():
+        db = dc.read()
+        if new and remote_id in db:
+            raise RemoteAlreadyExistsError(f"Remote '{remote_id}' already exists")
+        if desc is None:
+            db.pop(remote_id, None)
+        else:
+            db[remote_id] = desc
+        dc.write(db)
+
+
 def update_remote_settings(db, remote_id, **kwargs):
     desc = db.get(remote_id)
     if desc is None:
@@ -84,7 +101,8 @@ def update_remote_settings(db, remote_id, **kwargs):
         "scheduler",
         "conda_load_command",
         "unison_path",
-        "conda_install_path"
+        "conda_install_path",
+        "persistent_shell",
     ]
     for key in global_config_keys:
         new_val = kwargs.get(key)
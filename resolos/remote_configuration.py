@@ -9,12 +9,14 @@ from .remote import (
 from .logging import clog
 from .check import setup_ssh, check_target
 from .config import (
-    get_project_remote_dict_config,
+    read_project_remote_config,
+    write_project_remote_config,
     randomString,
 )
 from .conda import check_conda_env_exists_remote, create_conda_env_remote
-from .shell import remove_remote_folder
+from .shell import remove_remote_folder, ssh_connections, close_remote_session
 from .platform import find_project_dir
+from .capabilities import forget_remote_capabilities
 from .exception import NotAProjectFolderError, ResolosException
 import click
 
@@ -31,6 +33,7 @@ def add_remote_configuration(**kwargs):
         "conda_load_command": kwargs.get("conda_load_command"),
         "conda_install_path": kwargs.get("conda_install_path"),
         "unison_path": kwargs.get("unison_path"),
+        "persistent_shell": kwargs.get("persistent_shell", False),
     }
     add_remote(read_remote_db(), remote_name, create_dict)
     remote_settings = get_remote(read_remote_db(), remote_name)
@@ -56,7 +59,6 @@ def add_remote_configuration(**kwargs):
                 clog.info(f"Remote {remote_name} added!")
     try:
         project_dir = find_project_dir()
-        project_remote_config = get_project_remote_dict_config().read()
         files_path = (
             kwargs.get("remote_path")
             or f"./resolos_projects/{project_dir.name}_{randomString()}"
@@ -64,11 +66,14 @@ def add_remote_configuration(**kwargs):
         remote_env_name = (
             kwargs.get("remote_env_name") or f"resolos_env_{randomString()}"
         )
-        project_remote_config[remote_name] = {
-            "env_name": remote_env_name,
-            "files_path": files_path,
-        }
-        get_project_remote_dict_config().write(project_remote_config)
+        write_project_remote_config(
+            remote_name,
+            {
+                "env_name": remote_env_name,
+                "files_path": files_path,
+            },
+            replace=True,
+        )
         if not no_remote_setup:
             if not check_conda_env_exists_remote(create_dict, remote_env_name):
                 if no_confirm or click.confirm(
@@ -96,14 +101,17 @@ def update_remote_configuration(**kwargs):
     db = read_remote_db()
     update_dict = update_remote_settings(db, remote_id, **kwargs)
     update_dict["name"] = remote_id
+    # Connection details might have changed, the next command opens a new connection
+    close_remote_session(update_dict)
+    ssh_connections.close(update_dict)
+    forget_remote_capabilities(update_dict)
     clog.debug(f"The new remote config is:\n\n{update_dict}")
     clog.info(f"Running checks on updated remote '{remote_id}'...")
     no_confirm = kwargs.get("y", False)
     check_target(update_dict, no_confirm=no_confirm)
     try:
         project_dir = find_project_dir()
-        project_remote_config = get_project_remote_dict_config().read()
-        project_remote_settings = project_remote_config.get(remote_id)
+        project_remote_settings = read_project_remote_config(remote_id)
         if project_remote_settings is None:
             files_path = (
                 kwargs.get("remote_path")
@@ -112,7 +120,7 @@ def update_remote_configuration(**kwargs):
             remote_env_name = (
                 kwargs.get("remote_env_name") or f"resolos_env_{randomString()}"
             )
-            project_remote_config[remote_id] = {
+            project_remote_settings = {
                 "env_name": remote_env_name,
                 "files_path": files_path,
             }
@@ -120,11 +128,12 @@ def update_remote_configuration(**kwargs):
             if kwargs.get("remote_env_name"):
                 remote_env_name = kwargs.get("remote_env_name")
                 project_remote_settings["env_name"] = remote_env_name
+                project_remote_settings["last_env_fingerprint"] = None
             else:
                 remote_env_name = project_remote_settings.get("env_name")
             if kwargs.get("remote_path"):
                 project_remote_settings["files_path"] = kwargs.get("remote_path")
-        get_project_remote_dict_config().write(project_remote_config)
+        write_project_remote_config(remote_id, project_remote_settings)
         if not check_conda_env_exists_remote(update_dict, remote_env_name):
             if no_confirm or click.confirm(
                 f"Remote conda environment '{remote_env_name}' does not exists yet. "
@@ -157,5 +166,7 @@ def teardown_remote_configuration(**kwargs):
         clog.warning(
             f"Could not remove ~/.unison folder, the error message was:\n{ex}\n"
         )
+    close_remote_session(remote_settings)
+    ssh_connections.close(remote_settings)
     delete_remote(read_remote_db(), remote_id)
     clog.info(f"Removed remote '{remote_id}'!")
@@ -1,12 +1,27 @@
 import subprocess
 import os
+import selectors
+import threading
+import atexit
+import hashlib
+import tempfile
+import uuid
 from shutil import which
-from time import sleep
+from time import monotonic
 from shlex import quote
 from .logging import clog
-from .config import get_ssh_key, SSH_SERVERALIVEINTERVAL, BASH_MIN_VERSION, ver_re
+from .config import (
+    get_ssh_key,
+    get_global_dict_config,
+    SSH_SERVERALIVEINTERVAL,
+    SSH_CONTROL_PERSIST,
+    BASH_MIN_VERSION,
+    ver_re,
+)
+from .platform import get_ssh_control_dir, get_user_platform
 from .exception import (
     ShellError,
+    RemoteShellUnavailableError,
     MissingDependency,
     DependencyVersionError,
     SSHError,
@@ -17,6 +32,10 @@ from pathlib import Path
 
 CMD_BEGIN = "-----------------RESOLOS_BEGIN-----------------"
 CMD_END = "-----------------RESOLOS_END-----------------"
+READ_CHUNK_SIZE = 65536
+# Upper bound on how long a finished process can go unnoticed when a background
+# child (e.g. a daemonized ssh) keeps its output pipe open
+EXIT_CHECK_INTERVAL = 0.1
 
 
 def check_bash_version_local():
@@ -69,15 +88,141 @@ def trim_stdout(stdout):
             return parts[0]
 
 
+class LineReader(object):
+    """
+    Reads lines from a pipe as soon as they become available, using a selector
+    instead of polling the process on a fixed interval.
+    """
+
+    def __init__(self, stream):
+        self.fd = stream.fileno()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.buffer = b""
+        self.eof = False
+
+    def _fill(self, timeout):
+        if not self.selector.select(timeout):
+            return False
+        chunk = os.read(self.fd, READ_CHUNK_SIZE)
+        if chunk:
+            self.buffer = self.buffer + chunk
+        else:
+            self.eof = True
+        return True
+
+    def _pop_line(self):
+        idx = self.buffer.find(b"\n")
+        if idx < 0:
+            if not self.eof:
+                return None
+            idx = len(self.buffer) - 1
+        line = self.buffer[: idx + 1]
+        self.buffer = self.buffer[idx + 1 :]
+        return line.decode(errors="replace")
+
+    def readline(self, timeout=None):
+        """
+        Returns the next line, an empty string on EOF or None if no complete line
+        arrived within timeout seconds
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            line = self._pop_line()
+            if line is not None:
+                return line
+            remaining = None if deadline is None else max(deadline - monotonic(), 0)
+            if not self._fill(remaining) and remaining is not None:
+                if monotonic() >= deadline:
+                    return None
+
+    def read_available(self):
+        """Returns all complete and partial lines that can be read without blocking"""
+        while not self.eof and self._fill(0):
+            pass
+        lines = []
+        line = self._pop_line()
+        while line:
+            lines.append(line)
+            line = self._pop_line()
+        if self.buffer:
+            lines.append(self.buffer.decode(errors="replace"))
+            self.buffer = b""
+        return lines
+
+    def close(self):
+        self.selector.close()
+
+
+def log_output_line(line, stdout_as_info, print_to_info):
+    if stdout_as_info:
+        if line.startswith(CMD_END):
+            print_to_info = False
+        if print_to_info:
+            clog.info(line.rstrip("\n"))
+        if line.startswith(CMD_BEGIN):
+            print_to_info = True
+    else:
+        clog.debug(line.rstrip("\n"))
+    return print_to_info
+
+
+def stream_process_output(
+    proc, cmd, max_wait_secs: int = 3600, stdout_as_info=False, print_to_info=False
+):
+    """
+    Collects the merged stdout/stderr of proc while logging it line by line,
+    and returns as soon as the process exits.
+    """
+    deadline = monotonic() + max_wait_secs
+    reader = LineReader(proc.stdout)
+    lines = []
+    try:
+        while True:
+            line = reader.readline(
+                timeout=min(max(deadline - monotonic(), 0), EXIT_CHECK_INTERVAL)
+            )
+            if line is None:
+                # No new output: the process might have exited while a background
+                # child still holds the pipe open
+                if proc.poll() is not None:
+                    for line in reader.read_available():
+                        print_to_info = log_output_line(
+                            line, stdout_as_info, print_to_info
+                        )
+                        lines.append(line)
+                    break
+                if monotonic() >= deadline:
+                    proc.kill()
+                    proc.wait()
+                    raise TimeoutError(
+                        f"Command '{cmd}' did not finish in {max_wait_secs} seconds"
+                    )
+                continue
+            if line == "":
+                break
+            print_to_info = log_output_line(line, stdout_as_info, print_to_info)
+            lines.append(line)
+        try:
+            ret_val = proc.wait(timeout=max(deadline - monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise TimeoutError(
+                f"Command '{cmd}' did not finish in {max_wait_secs} seconds"
+            )
+    finally:
+        reader.close()
+        proc.stdout.close()
+    return ret_val, "".join(lines)
+
+
 def run_shell_cmd(
     cmd,
     max_wait_secs: int = 3600,
-    sleep_secs: int = 1,
     stdout_as_info=False,
     shell_type="bash_interactive_login",
 ):
-    waited = 0
-    stdout = ""
     if shell_type == "bash_interactive_login":
         bash_cmd = f"bash -i -l -c {quote(f'cd {Path.cwd()} && echo {CMD_BEGIN} && ' + cmd + f' && echo {CMD_END}; exit 2>/dev/null')}"
     elif shell_type == "bash_login":
@@ -93,80 +238,425 @@ def run_shell_cmd(
         stderr=subprocess.STDOUT,
         stdin=subprocess.PIPE,
         shell=True,
-        bufsize=1,
-        universal_newlines=True,
     )
-    # Wait for the process end and print error in case of failure
-    ret_val = proc.poll()
-    print_to_info = False
-    while ret_val is None:
-        if waited >= max_wait_secs:
-            proc.kill()
-            raise TimeoutError()
-        new_stdout = proc.stdout.readline()
-        while new_stdout:
-            if stdout_as_info:
-                if new_stdout.startswith(CMD_END):
-                    print_to_info = False
-                if print_to_info:
-                    clog.info(new_stdout.replace("\n", ""))
-                if new_stdout.startswith(CMD_BEGIN):
-                    print_to_info = True
-            else:
-                clog.debug(new_stdout.replace("\n", ""))
-            stdout = stdout + new_stdout
-            new_stdout = proc.stdout.readline()
-        waited = waited + sleep_secs
-        sleep(sleep_secs)
-        ret_val = proc.poll()
-    # Get the last part
-    proc.stdout.flush()
-    new_stdout = proc.stdout.readline()
-    while new_stdout:
-        if stdout_as_info:
-            if new_stdout.startswith(CMD_END):
-                print_to_info = False
-            if print_to_info:
-                clog.info(new_stdout.trim())
-            if new_stdout.startswith(CMD_BEGIN):
-                print_to_info = True
-        else:
-            clog.debug(new_stdout.replace("\n", ""))
-        stdout = stdout + new_stdout
-        new_stdout = proc.stdout.readline()
+    ret_val, stdout = stream_process_output(
+        proc, bash_cmd, max_wait_secs=max_wait_secs, stdout_as_info=stdout_as_info
+    )
     clog.debug(f"Command '{bash_cmd}' finished with exit code {ret_val}")
     return ret_val, trim_stdout(stdout)
 
 
+def run_exec_cmd(args, env=None, max_wait_secs: int = 3600, stdout_as_info=False):
+    """
+    Runs the executable directly, without any shell startup.
+    Unlike run_shell_cmd, the whole output is returned as there are no markers to trim.
+    """
+    clog.debug(f"Running executable '{' '.join(args)}'...")
+    proc = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        cwd=Path.cwd(),
+        env=env,
+    )
+    ret_val, stdout = stream_process_output(
+        proc,
+        " ".join(args),
+        max_wait_secs=max_wait_secs,
+        # There are no CMD_BEGIN/CMD_END markers, everything is command output
+        stdout_as_info=stdout_as_info,
+        print_to_info=stdout_as_info,
+    )
+    clog.debug(f"Executable '{' '.join(args)}' finished with exit code {ret_val}")
+    return ret_val, stdout
+
+
+def ssh_destination(remote_settings):
+    return f"{remote_settings['username']}@{remote_settings['hostname']}"
+
+
+def use_sshpass(remote_settings, force_password=False):
+    return (get_ssh_key() is None or force_password) and (
+        which("sshpass") is not None and "SSHPASS" in os.environ
+    )
+
+
+class SSHConnectionManager(object):
+    """
+    Keeps a single multiplexed SSH master connection (OpenSSH ControlMaster) per remote,
+    so that every ssh and unison call after the first one skips the TCP, key exchange
+    and authentication handshake.
+
+    Masters are started lazily on first use and stopped when the resolos process exits.
+    ControlPersist makes sure a master does not outlive its last use by more than
+    SSH_CONTROL_PERSIST seconds, even if resolos is killed.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.failed = set()
+        # Guards the dicts above, while the lock of each connection is held during its
+        # handshake so that masters to different remotes are opened concurrently
+        self.lock = threading.Lock()
+        self.connection_locks = {}
+        self.cleanup_registered = False
+
+    @staticmethod
+    def connection_id(remote_settings):
+        return remote_settings.get("name") or (
+            f"{ssh_destination(remote_settings)}:{remote_settings['port']}"
+        )
+
+    @staticmethod
+    def control_path(remote_settings):
+        digest = hashlib.sha1(
+            f"{ssh_destination(remote_settings)}:{remote_settings['port']}".encode()
+        ).hexdigest()[:16]
+        return get_ssh_control_dir() / digest
+
+    @staticmethod
+    def enabled():
+        if get_user_platform() == "win":
+            return False
+        return get_global_dict_config().read().get("ssh_multiplexing", True)
+
+    def _control_cmd(self, remote_settings, control_path, operation):
+        return subprocess.run(
+            [
+                "ssh",
+                "-O",
+                operation,
+                "-S",
+                str(control_path),
+                "-p",
+                str(remote_settings["port"]),
+                ssh_destination(remote_settings),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+
+    def _start_master(self, remote_settings, control_path):
+        control_dir = control_path.parent
+        control_dir.mkdir(parents=True, exist_ok=True)
+        control_dir.chmod(0o700)
+        master_cmd = [
+            "ssh",
+            "-M",
+            "-N",
+            "-f",
+            "-S",
+            str(control_path),
+            "-o",
+            f"ControlPersist={SSH_CONTROL_PERSIST}",
+            "-o",
+            f"ServerAliveInterval={SSH_SERVERALIVEINTERVAL}",
+            "-p",
+            str(remote_settings["port"]),
+        ]
+        ssh_key = get_ssh_key()
+        if ssh_key is not None:
+            master_cmd.extend(["-i", ssh_key])
+        elif use_sshpass(remote_settings):
+            master_cmd = ["sshpass", "-e"] + master_cmd
+        master_cmd.append(ssh_destination(remote_settings))
+        clog.debug(f"Opening SSH master connection '{' '.join(master_cmd)}'...")
+        # The daemonized master inherits the output handles, so they must not be pipes
+        # that we would wait on
+        with tempfile.TemporaryFile() as log:
+            ret_val = subprocess.run(
+                master_cmd, stdin=subprocess.DEVNULL, stdout=log, stderr=log
+            ).returncode
+            log.seek(0)
+            output = log.read().decode(errors="replace")
+        if ret_val != 0:
+            clog.debug(
+                f"Could not open SSH master connection to '{self.connection_id(remote_settings)}', "
+                f"falling back to one connection per command. The error was:\n{output}"
+            )
+        return ret_val == 0
+
+    def connection_lock(self, connection_id):
+        with self.lock:
+            return self.connection_locks.setdefault(connection_id, threading.Lock())
+
+    def known(self, connection_id):
+        """Returns whether the connection was set up or failed already, and its control path"""
+        with self.lock:
+            if connection_id in self.connections:
+                return True, self.connections[connection_id][1]
+            return connection_id in self.failed, None
+
+    def get(self, remote_settings, connect=True):
+        """
+        Returns the control socket path to use for the remote, or None if commands
+        should open their own connection
+        """
+        connection_id = self.connection_id(remote_settings)
+        known, control_path = self.known(connection_id)
+        if known or not connect or not self.enabled():
+            return control_path
+        with self.connection_lock(connection_id):
+            # Another thread might have set up the connection while this one waited
+            known, control_path = self.known(connection_id)
+            if known:
+                return control_path
+            control_path = self.control_path(remote_settings)
+            if not (
+                control_path.exists()
+                and self._control_cmd(remote_settings, control_path, "check") == 0
+            ):
+                if not self._start_master(remote_settings, control_path):
+                    with self.lock:
+                        self.failed.add(connection_id)
+                    return None
+            with self.lock:
+                self.connections[connection_id] = (dict(remote_settings), control_path)
+                if not self.cleanup_registered:
+                    atexit.register(self.close_all)
+                    self.cleanup_registered = True
+            return control_path
+
+    def close(self, remote_settings):
+        connection_id = self.connection_id(remote_settings)
+        with self.lock:
+            self.failed.discard(connection_id)
+            connection = self.connections.pop(connection_id, None)
+        if connection is not None:
+            settings, control_path = connection
+            clog.debug(f"Closing SSH master connection to '{connection_id}'")
+            # 'stop' lets sessions still running on the master (possibly from another
+            # resolos process) finish, while new sessions connect directly
+            self._control_cmd(settings, control_path, "stop")
+
+    def close_all(self):
+        for settings, control_path in list(self.connections.values()):
+            self.close(settings)
+
+
+ssh_connections = SSHConnectionManager()
+
+
+def ssh_options(remote_settings, force_password=False, connect=True):
+    options = (
+        f"-p {remote_settings['port']} -o ServerAliveInterval={SSH_SERVERALIVEINTERVAL}"
+    )
+    ssh_key = get_ssh_key()
+    if ssh_key is not None and not force_password:
+        options = f"{options} -i {ssh_key}"
+    if not force_password:
+        control_path = ssh_connections.get(remote_settings, connect=connect)
+        if control_path is not None:
+            options = f"{options} -S {control_path}"
+    return options
+
+
+class RemoteShellSession(object):
+    """
+    A long-lived 'bash -l' on the remote, started over the multiplexed SSH connection.
+    The login profile and the remote's conda_load_command are sourced only once, then
+    every command is written to the shell's stdin and run in a subshell, framed by
+    sentinel lines carrying the command's exit code.
+    """
+
+    def __init__(self, remote_settings):
+        self.remote_settings = remote_settings
+        self.proc = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self, max_wait_secs: int = 300):
+        ssh_cmd = (
+            f"ssh {ssh_destination(self.remote_settings)} "
+            f"{ssh_options(self.remote_settings)} 'bash -l -s'"
+        )
+        clog.debug(f"Starting persistent remote shell '{ssh_cmd}'...")
+        self.proc = subprocess.Popen(
+            ssh_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            shell=True,
+        )
+        self.reader = LineReader(self.proc.stdout)
+        init_cmd = self.remote_settings.get("conda_load_command") or "true"
+        ret_val, output = self.run(
+            init_cmd, max_wait_secs=max_wait_secs, isolated=False
+        )
+        if ret_val != 0:
+            self.close()
+            raise ShellError(
+                f"Could not initialize persistent shell on remote "
+                f"'{self.remote_settings.get('name')}', the output was:\n\n{output}\n\n"
+            )
+
+    def run(self, cmd, max_wait_secs: int = 3600, stdout_as_info=False, isolated=True):
+        with self.lock:
+            if not self.alive:
+                raise RemoteShellUnavailableError(
+                    f"The persistent shell on remote '{self.remote_settings.get('name')}' is not running"
+                )
+            token = uuid.uuid4().hex
+            begin = f"{CMD_BEGIN}{token}"
+            end = f"{CMD_END}{token}"
+            # The subshell keeps 'cd', 'exit' or 'conda activate' from leaking into the session,
+            # and stdin is detached so that the command cannot consume the following ones
+            if isolated:
+                script = f"echo {begin}\n( {cmd}\n) </dev/null 2>&1\necho {end} $?\n"
+            else:
+                script = f"echo {begin}\n{{ {cmd}\n}} </dev/null 2>&1\necho {end} $?\n"
+            clog.debug(f"Running command '{cmd}' in persistent remote shell...")
+            try:
+                self.proc.stdin.write(script.encode())
+                self.proc.stdin.flush()
+            except OSError as ex:
+                self.close()
+                raise RemoteShellUnavailableError(
+                    f"Could not write to persistent remote shell: {ex}"
+                )
+            deadline = monotonic() + max_wait_secs
+            lines = []
+            started = False
+            while True:
+                line = self.reader.readline(timeout=max(deadline - monotonic(), 0))
+                if line is None:
+                    self.close()
+                    raise TimeoutError(
+                        f"Command '{cmd}' did not finish in {max_wait_secs} seconds"
+                    )
+                if line == "":
+                    self.close()
+                    raise ShellError(
+                        f"Persistent remote shell exited unexpectedly while running command '{cmd}', "
+                        f"which might have run partly. The output was:\n\n{''.join(lines)}\n\n"
+                    )
+                if not started:
+                    # Skip any leftover output, e.g. login banners
+                    started = line.startswith(begin)
+                    continue
+                if line.startswith(end):
+                    ret_val = int(line[len(end) :].strip())
+                    break
+                log_output_line(line, stdout_as_info, stdout_as_info)
+                lines.append(line)
+            clog.debug(f"Command '{cmd}' finished with exit code {ret_val}")
+            return ret_val, "".join(lines)
+
+    def close(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(b"exit\n")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+        self.reader.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+
+remote_sessions = {}
+remote_sessions_lock = threading.Lock()
+
+
+def get_remote_session(remote_settings):
+    """
+    Returns the running persistent shell for the remote, starting it if needed.
+    Returns None if persistent shells are not enabled for the remote or could not be started,
+    in which case every command should run in its own login shell.
+    """
+    if not remote_settings.get("persistent_shell"):
+        return None
+    session_id = SSHConnectionManager.connection_id(remote_settings)
+    with remote_sessions_lock:
+        session = remote_sessions.get(session_id)
+        if session is False:
+            return None
+        if session is not None and session.alive:
+            return session
+        if not remote_sessions:
+            atexit.register(close_remote_sessions)
+        session = RemoteShellSession(remote_settings)
+        try:
+            session.start()
+        except (ShellError, TimeoutError) as ex:
+            clog.debug(
+                f"Falling back to one login shell per command on remote '{session_id}': {repr(ex)}"
+            )
+            remote_sessions[session_id] = False
+            return None
+        remote_sessions[session_id] = session
+        return session
+
+
+def close_remote_session(remote_settings):
+    with remote_sessions_lock:
+        session = remote_sessions.pop(
+            SSHConnectionManager.connection_id(remote_settings), None
+        )
+    if session:
+        session.close()
+
+
+def close_remote_sessions():
+    with remote_sessions_lock:
+        for session in remote_sessions.values():
+            if session:
+                session.close()
+        remote_sessions.clear()
+
+
+def conda_load_prefix(remote_settings):
+    """
+    Prefix for remote commands that need the 'conda' command. Empty if the command is going
+    to run in a persistent remote shell that has already sourced conda_load_command.
+    """
+    if get_remote_session(remote_settings) is not None:
+        return ""
+    return f"{remote_settings['conda_load_command']} && "
+
+
 def run_ssh_cmd(
     remote_settings,
     cmd,
     max_wait_secs: int = 3600,
-    sleep_secs: int = 1,
     stdout_as_info=False,
     shell_type="bash_login",
     login_shell_remote=True,
     force_password=False,
 ):
-    username = remote_settings["username"]
-    hostname = remote_settings["hostname"]
-    port = remote_settings["port"]
+    if login_shell_remote and not force_password:
+        session = get_remote_session(remote_settings)
+        if session is not None:
+            try:
+                return session.run(
+                    cmd, max_wait_secs=max_wait_secs, stdout_as_info=stdout_as_info
+                )
+            except RemoteShellUnavailableError as ex:
+                # Only commands that were not sent to the shell can be run again safely
+                clog.debug(f"{ex.msg}, running command in a new login shell instead")
+                if remote_settings.get("conda_load_command"):
+                    # The command was built for a shell that has conda loaded already
+                    cmd = f"{remote_settings['conda_load_command']} && {cmd}"
     if login_shell_remote:
         remote_cmd = f"bash -l -c {quote(cmd)}"
     else:
         remote_cmd = cmd
-    ssh_key = get_ssh_key()
-    if ssh_key is None or force_password:
-        if which("sshpass") and "SSHPASS" in os.environ:
-            ssh_cmd = f"sshpass -e ssh {username}@{hostname} -p {port} -o ServerAliveInterval={SSH_SERVERALIVEINTERVAL} {quote(remote_cmd)}"
-        else:
-            ssh_cmd = f"ssh {username}@{hostname} -p {port} -o ServerAliveInterval={SSH_SERVERALIVEINTERVAL} {quote(remote_cmd)}"
-    else:
-        ssh_cmd = f"ssh {username}@{hostname} -p {port} -o ServerAliveInterval={SSH_SERVERALIVEINTERVAL} -i {ssh_key} {quote(remote_cmd)}"
+    ssh_cmd = f"ssh {ssh_destination(remote_settings)} {ssh_options(remote_settings, force_password)} {quote(remote_cmd)}"
+    if use_sshpass(remote_settings, force_password):
+        ssh_cmd = f"sshpass -e {ssh_cmd}"
     ret_val, output = run_shell_cmd(
         ssh_cmd,
         max_wait_secs=max_wait_secs,
-        sleep_secs=sleep_secs,
         stdout_as_info=stdout_as_info,
         shell_type=shell_type,
     )
@@ -1,15 +1,27 @@
-import jwt
-import requests
 from ..exception import ResolosException, YaretaError
 from ..logging import clog
 from ..config import get_option
-from time import sleep
+from time import sleep, monotonic
 
-DOWNLOAD_CHUNK_SIZE = 8192
+REQUEST_TIMEOUT = 15
+# Yareta processes the uploaded files before a deposit can be approved, its status is
+# polled with an exponential backoff
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 30.0
+POLL_TIMEOUT = 30 * 60
+DEPOSIT_IN_PROGRESS = "IN_PROGRESS"
+DATA_FILE_READY = "READY"
+DATA_FILE_IN_ERROR = "IN_ERROR"
+# Checksum algorithms of the deposit files, in order of preference
+CHECKSUM_ALGORITHMS = ["SHA256", "SHA1", "MD5"]
 
 
 class YaretaClient(object):
     def __init__(self, base_url, access_token):
+        # requests and jwt are imported when they are used, so that they do not slow down
+        # the startup of the commands that do not talk to Yareta
+        import requests
+
         self.base_url = base_url
         self.access_token = access_token
         self.session = requests.Session()
@@ -17,7 +29,11 @@ class YaretaClient(object):
 
     def request(self, method, path, expected_status_code=None, **kwargs):
         url = f"{self.base_url}{path}"
-        resp = self.session.request(method, url, timeout=15, **kwargs)
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        resp = self.session.request(method, url, **kwargs)
+        return self.check_response(resp, method, url, expected_status_code)
+
+    def check_response(self, resp, method, url, expected_status_code=None):
         if resp.status_code == 401:
             raise YaretaError(
                 f"Received 'Unauthorized' response from the server for request [{method}] {url}\n"
@@ -45,6 +61,8 @@ class YaretaClient(object):
 
 
 def get_uid_from_token(access_token: str):
+    import jwt
+
     d = jwt.decode(access_token, options={"verify_signature": False})
     username = d.get("user_name")
     if username is None:
@@ -115,12 +133,11 @@ def set_deposit_contributors(yc: YaretaClient, deposit_id, authors):
 
 
 def upload_file_to_deposit(yc: YaretaClient, deposit_id, filename):
-    with open(filename, "rb") as f:
-        resp = yc.post(
-            f"/ingestion/preingest/deposits/{deposit_id}/upload",
-            expected_status_code=200,
-            files={"file": f},
-        )
+    from ..upload import upload_file
+
+    url = f"{yc.base_url}/ingestion/preingest/deposits/{deposit_id}/upload"
+    resp = upload_file(yc.session, url, filename)
+    yc.check_response(resp, "POST", url, expected_status_code=200)
     res = resp.json()
     clog.info(f"Successfully uploaded file '{filename}' to deposit '{deposit_id}'")
     return res
@@ -135,6 +152,74 @@ def approve_deposit(yc: YaretaClient, deposit_id):
     return res
 
 
+def get_deposit(yc: YaretaClient, deposit_id):
+    resp = yc.get(
+        f"/ingestion/preingest/deposits/{deposit_id}", expected_status_code=200
+    )
+    return resp.json()
+
+
+def get_deposit_data_files(yc: YaretaClient, deposit_id):
+    resp = yc.get(
+        f"/ingestion/preingest/deposits/{deposit_id}/data",
+        expected_status_code=200,
+    )
+    return resp.json()["_data"]
+
+
+def deposit_files_ready(yc: YaretaClient, deposit_id):
+    """Returns whether Yareta has finished processing all files of the deposit"""
+    data_files = get_deposit_data_files(yc, deposit_id)
+    for data_file in data_files:
+        if data_file.get("status") == DATA_FILE_IN_ERROR:
+            raise YaretaError(
+                f"Yareta could not process file '{data_file.get('fullFileName')}' "
+                f"of deposit '{deposit_id}'"
+            )
+    return bool(data_files) and all(
+        data_file.get("status") == DATA_FILE_READY for data_file in data_files
+    )
+
+
+def wait_for_deposit_files(yc: YaretaClient, deposit_id, timeout=POLL_TIMEOUT):
+    delay = POLL_INITIAL_DELAY
+    deadline = monotonic() + timeout
+    while not deposit_files_ready(yc, deposit_id):
+        if monotonic() + delay > deadline:
+            raise YaretaError(
+                f"Yareta did not finish processing deposit '{deposit_id}' in {timeout}s, "
+                f"run 'r3s archive status -d {deposit_id}' later to submit it"
+            )
+        clog.debug(
+            f"Yareta is processing the files of deposit '{deposit_id}', checking again in {delay}s..."
+        )
+        sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def submit_deposit(deposit_id: str, access_token: str, base_url: str, wait=False):
+    """
+    Approves the deposit once Yareta has processed its files. If wait is not set and the
+    files are still being processed, the deposit is left as it is.
+    Returns the status of the deposit.
+    """
+    yc = YaretaClient(base_url, access_token)
+    status = get_deposit(yc, deposit_id).get("status")
+    clog.info(f"Deposit '{deposit_id}' is in status {status}")
+    if status != DEPOSIT_IN_PROGRESS:
+        return status
+    if wait:
+        wait_for_deposit_files(yc, deposit_id)
+    elif not deposit_files_ready(yc, deposit_id):
+        clog.info(
+            f"Yareta is still processing the files of deposit '{deposit_id}', "
+            f"run this command again later to submit it"
+        )
+        return status
+    approve_deposit(yc, deposit_id)
+    return get_deposit(yc, deposit_id).get("status")
+
+
 def deposit_archive(
     archive_filename: str,
     base_url: str,
@@ -167,7 +252,13 @@ def deposit_archive(
     )
     deposit_id = res["resId"]
     upload_file_to_deposit(yc, deposit_id, archive_filename)
-    sleep(10)
+    if get_option(kwargs, "no_wait"):
+        clog.info(
+            f"Deposit '{deposit_id}' will be submitted once Yareta has processed it, "
+            f"run 'r3s archive status -d {deposit_id}' to submit it"
+        )
+        return deposit_id
+    wait_for_deposit_files(yc, deposit_id)
     approve_deposit(yc, deposit_id)
     return deposit_id
 
@@ -185,36 +276,46 @@ def search_deposit(yc: YaretaClient, deposit_id, archive_filename):
             f"Expected 2 files in deposit '{deposit_id}': the archive file {full_file_name} and the metadata XML. "
             f"Are you sure this deposit was created by Resolos?"
         )
-    file_id = None
+    data_file = None
     for r in results:
         if r["fullFileName"] == full_file_name:
-            file_id = r["resId"]
-    if file_id is None:
+            data_file = r
+    if data_file is None:
         raise ResolosException(
             f"Could not find file '{full_file_name}' in deposit '{deposit_id}'. "
             f"Are you sure this deposit was created by Resolos?"
         )
     clog.debug(
-        f"Found file '{archive_filename}' with id '{file_id}' in deposit '{deposit_id}'"
+        f"Found file '{archive_filename}' with id '{data_file['resId']}' in deposit '{deposit_id}'"
     )
-    return file_id
+    return data_file
 
 
-def download_file(yc, deposit_id, file_id, target_filename):
-    r = yc.get(
-        f"/ingestion/preingest/deposits/{deposit_id}/data/{file_id}/download",
-        expected_status_code=200,
-        stream=True,
+def data_file_checksum(data_file: dict):
+    """Returns the checksum of a deposit file in the '<algorithm>:<digest>' format, if known"""
+    checksums = {
+        c.get("checksumAlgo", "").upper(): c.get("checksum")
+        for c in data_file.get("checksums") or []
+        if c.get("checksum")
+    }
+    for algorithm in CHECKSUM_ALGORITHMS:
+        if algorithm in checksums:
+            return f"{algorithm.lower()}:{checksums[algorithm]}"
+    return None
+
+
+def download_file(yc, deposit_id, file_id, target_filename, checksum=None):
+    from ..download import download
+
+    clog.info(f"Downloading file '{file_id}'...")
+    download(
+        f"{yc.base_url}/ingestion/preingest/deposits/{deposit_id}/data/{file_id}/download",
+        target_filename,
+        session=yc.session,
+        checksum=checksum,
     )
-    try:
-        clog.info(f"Downloading file '{file_id}'...")
-        with open(target_filename, "wb") as f:
-            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                f.write(chunk)
-        clog.info(f"Successfully downloaded file '{file_id}' to '{target_filename}'")
-        return target_filename
-    finally:
-        r.close()
+    clog.info(f"Successfully downloaded file '{file_id}' to '{target_filename}'")
+    return target_filename
 
 
 def download_archive(
@@ -226,5 +327,11 @@ def download_archive(
 ):
 
     yc = YaretaClient(base_url, access_token)
-    file_id = search_deposit(yc, deposit_id, archive_filename)
-    download_file(yc, deposit_id, file_id, target_filename)
+    data_file = search_deposit(yc, deposit_id, archive_filename)
+    download_file(
+        yc,
+        deposit_id,
+        data_file["resId"],
+        target_filename,
+        checksum=data_file_checksum(data_file),
+    )
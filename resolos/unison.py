@@ -4,8 +4,6 @@ from .config import (
     read_project_remote_config,
     write_project_remote_config,
     randomString,
-    get_ssh_key,
-    SSH_SERVERALIVEINTERVAL,
     UNISON_VERSION,
 )
 from .exception import (
@@ -14,8 +12,9 @@ from .exception import (
     LocalCommandError,
     DependencyVersionError,
 )
-from .shell import run_shell_cmd, run_ssh_cmd
+from .shell import run_shell_cmd, run_ssh_cmd, ssh_options
 from .platform import find_project_dir, get_unison_config_folder
+from .capabilities import remote_capabilities, forget_remote_capabilities
 import click
 from semver import VersionInfo
 from datetime import datetime
@@ -56,16 +55,14 @@ def check_unison_installed_local():
     verify_unison_version(output)
 
 
-def check_unison_installed_remote(remote_settings):
-    ret_val, output = run_ssh_cmd(
-        remote_settings, f"{remote_settings['unison_path']} -version"
-    )
-    if ret_val != 0:
+def check_unison_installed_remote(remote_settings, refresh=False):
+    capabilities = remote_capabilities(remote_settings, refresh=refresh)
+    if capabilities["unison_version"] is None:
         raise MissingDependency(
-            f"Unison test command 'unison -version' raised error on remote {remote_settings['name']}:\n\n{output}\n\n"
+            f"Unison test command 'unison -version' raised error on remote {remote_settings['name']}\n\n"
             f"Please try and reinstall unison"
         )
-    verify_unison_version(output)
+    verify_unison_version(capabilities["unison_version"])
 
 
 def install_unison_remote(remote_settings):
@@ -80,26 +77,18 @@ def install_unison_remote(remote_settings):
         raise RemoteCommandError(
             f"Could not install unison on remote, the error message was:\n\n{output}\n\n"
         )
+    forget_remote_capabilities(remote_settings)
 
 
 def main_unison_command(remote_settings, local_folder, remote_folder):
-    ssh_key = get_ssh_key()
-    if ssh_key is None:
-        return (
-            f"{unison_base_command()} default "
-            f"{local_folder} "
-            f"ssh://{remote_settings['username']}@{remote_settings['hostname']}/{remote_folder} "
-            f'-sshargs "-p {remote_settings["port"]} -o ServerAliveInterval={SSH_SERVERALIVEINTERVAL}" '
-            f"-servercmd {remote_settings['unison_path']}"
-        )
-    else:
-        return (
-            f"{unison_base_command()} default "
-            f"{local_folder} "
-            f"ssh://{remote_settings['username']}@{remote_settings['hostname']}/{remote_folder} "
-            f'-sshargs "-p {remote_settings["port"]} -i {ssh_key}" '
-            f"-servercmd {remote_settings['unison_path']}"
-        )
+    # Reuse the multiplexed connection opened by the preceding ssh commands, if any
+    return (
+        f"{unison_base_command()} default "
+        f"{local_folder} "
+        f"ssh://{remote_settings['username']}@{remote_settings['hostname']}/{remote_folder} "
+        f'-sshargs "{ssh_options(remote_settings, connect=False)}" '
+        f"-servercmd {remote_settings['unison_path']}"
+    )
 
 
 def check_unison_connection(remote_settings):
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import requests
+from .logging import clog
+from .exception import UploadError
+from .download import MAX_RETRIES, RETRY_BACKOFF, RETRY_STATUS_CODES
+
+READ_SIZE = 1024 * 1024
+# Seconds between two progress messages
+PROGRESS_INTERVAL = 5.0
+CONNECT_TIMEOUT = 15
+# Servers may only answer once they have processed the whole upload
+RESPONSE_TIMEOUT = 600
+
+
+def format_size(size):
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+
+class UploadProgress(object):
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def update(self, sent):
+        now = time.monotonic()
+        if now - self.reported >= PROGRESS_INTERVAL or sent == self.total:
+            self.reported = now
+            rate = sent / max(now - self.started, 0.001)
+            clog.info(
+                f"Uploaded {format_size(sent)} of {format_size(self.total)} "
+                f"of '{self.name}' ({format_size(rate)}/s)"
+            )
+
+
+class MultipartFile(object):
+    """
+    Read-only file object that produces the multipart/form-data body of a single file field.
+    The file is read while the body is sent, so it is never held in memory, and the length
+    of the body is known up front, so it is sent with a Content-Length header.
+    """
+
+    def __init__(self, field, path, boundary=None):
+        self.path = path
+        self.boundary = boundary or uuid.uuid4().hex
+        filename = os.path.basename(path).replace('"', "")
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.file_size = os.path.getsize(path)
+        self.file = None
+        self.progress = None
+        self.rewind()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.file_size + len(self.tail)
+
+    def rewind(self):
+        self.close()
+        self.file = open(self.path, "rb")
+        self.parts = [self.head, self.file, self.tail]
+        self.sent = 0
+        self.progress = UploadProgress(os.path.basename(self.path), len(self))
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self)
+        data = b""
+        while self.parts and len(data) < size:
+            part = self.parts[0]
+            if isinstance(part, bytes):
+                take = size - len(data)
+                data += part[:take]
+                if len(part) > take:
+                    self.parts[0] = part[take:]
+                else:
+                    self.parts.pop(0)
+            else:
+                chunk = part.read(min(size - len(data), READ_SIZE))
+                if chunk:
+                    data += chunk
+                else:
+                    self.parts.pop(0)
+        self.sent += len(data)
+        if data:
+            self.progress.update(self.sent)
+        return data
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def upload_file(session, url, path, field="file"):
+    """
+    Uploads the file at path in a streamed multipart POST request, retrying with backoff if
+    the connection fails or the server is unavailable. Returns the last response.
+    """
+    with MultipartFile(field, path) as body:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                resp = session.post(
+                    url,
+                    data=body,
+                    headers={
+                        "Content-Type": body.content_type,
+                        "Content-Length": str(len(body)),
+                    },
+                    timeout=(CONNECT_TIMEOUT, RESPONSE_TIMEOUT),
+                )
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    return resp
+                error = f"received response code {resp.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                error = str(ex)
+            if attempt == MAX_RETRIES:
+                raise UploadError(
+                    f"Could not upload '{path}' to {url} after {MAX_RETRIES} retries, "
+                    f"the error was: {error}"
+                )
+            delay = RETRY_BACKOFF * 2**attempt
+            clog.warning(
+                f"Upload of '{path}' failed ({error}), retrying in {delay}s..."
+            )
+            time.sleep(delay)
+            body.rewind()
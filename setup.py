@@ -34,8 +34,9 @@ setup(
         "conda-pack",
         "requests",
         "pyjwt",
-        "pipdeptree",
+        "packaging",
     ],
+    extras_require={"zstd": ["zstandard"]},
     zip_safe=False,
     entry_points="""
         [console_scripts]
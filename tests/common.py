@@ -1,10 +1,24 @@
 import logging
+import threading
+import json
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from click.testing import Result
 from resolos.logging import clog
 
 logger = logging.getLogger(__name__)
 
 
+# Remote settings used by tests that never connect to the host
+REMOTE = {
+    "name": "test_remote",
+    "hostname": "hostname",
+    "username": "username",
+    "conda_load_command": "source ~/miniconda3/bin/activate",
+    "unison_path": "~/bin/unison",
+}
+
+
 def verify_result(result: Result):
     logger.debug(result.output)
     if result.exit_code != 0:
@@ -27,13 +41,20 @@ def fake_ssh_cmd(
     remote_settings,
     cmd,
     max_wait_secs: int = 3600,
-    sleep_secs: int = 1,
     stdout_as_info=False,
     shell_type="bash_login",
     login_shell_remote=True,
     force_password=False,
 ):
-    if "conda --version" in cmd:
+    if "resolos-probe" in cmd:
+        return 0, echo(
+            'resolos-probe {"conda": "conda 4.9.2", "unison": "unison version 2.53.3", '
+            '"bash": "5.1.4(1)-release", "sbatch": "/usr/bin/sbatch", '
+            '"squeue": "/usr/bin/squeue", '
+            '"env_prefix": "/home/user/miniconda3/envs/remote_env", '
+            '"free_space": "1048576", "quota": ""}'
+        )
+    elif "conda --version" in cmd:
         return 0, echo("conda 4.9.2")
     elif "unison -version" in cmd:
         return 0, echo("unison version 2.53.3")
@@ -66,7 +87,6 @@ def fake_ssh_cmd(
 def fake_shell_cmd(
     cmd,
     max_wait_secs: int = 3600,
-    sleep_secs: int = 1,
     stdout_as_info=False,
     shell_type="bash_interactive_login",
 ):
@@ -76,3 +96,103 @@ def fake_shell_cmd(
         return 0, echo("[mock] Successfully ran unison command")
     else:
         return 1, echo(f"Missing mock implementation for shell command: '{cmd}'")
+
+
+class LocalServer(ThreadingHTTPServer):
+    """
+    HTTP server on a free local port, handling requests with handler_class. The keyword
+    arguments are set as attributes of the server, for the handler to use.
+    """
+
+    def __init__(self, handler_class, path="", **attributes):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.path = path
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{self.path}"
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    # Starts LocalServers in background threads, they are stopped after the test
+    servers = []
+
+    def start(handler_class, **attributes):
+        server = LocalServer(handler_class, **attributes)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+CHANNEL = "https://repo.anaconda.com/pkgs/main"
+
+
+def write_record(prefix, name, version, build, subdir="linux-64", files=None):
+    record = {
+        "name": name,
+        "version": version,
+        "build": build,
+        "subdir": subdir,
+        "channel": f"{CHANNEL}/{subdir}",
+        "fn": f"{name}-{version}-{build}.tar.bz2",
+        "url": f"{CHANNEL}/{subdir}/{name}-{version}-{build}.tar.bz2",
+        "depends": [],
+        "files": files or [],
+    }
+    with open(prefix / "conda-meta" / f"{name}-{version}-{build}.json", "w") as f:
+        json.dump(record, f)
+
+
+def make_fake_env(tmp_path):
+    prefix = tmp_path / "fake_env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    site_packages = prefix / "lib" / "python3.8" / "site-packages"
+    site_packages.mkdir(parents=True)
+    write_record(prefix, "python", "3.8.5", "h7579374_1")
+    write_record(
+        prefix,
+        "six",
+        "1.15.0",
+        "py_0",
+        subdir="noarch",
+        files=["lib/python3.8/site-packages/six-1.15.0.dist-info/METADATA"],
+    )
+    for dist_info, name, version in [
+        ("six-1.15.0.dist-info", "six", "1.15.0"),
+        ("Flask_Login-0.5.0.dist-info", "Flask-Login", "0.5.0"),
+    ]:
+        (site_packages / dist_info).mkdir()
+        (site_packages / dist_info / "METADATA").write_text(
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+            f"Requires-Dist: Flask\n"
+        )
+    (site_packages / "mylib-1.0.dist-info").mkdir()
+    (site_packages / "mylib-1.0.dist-info" / "METADATA").write_text(
+        "Metadata-Version: 2.1\nName: mylib\nVersion: 1.0\n"
+        "Requires-Dist: six (>=1.10)\n"
+        "Requires-Dist: flask-login ; python_version < '3'\n"
+        "Requires-Dist: pytest ; extra == 'test'\n"
+    )
+    (prefix / "conda-meta" / "history").write_text(
+        "==> 2020-10-01 10:00:00 <==\n"
+        "# cmd: conda create -n fake_env python=3.8\n"
+        "# create specs: ['python=3.8']\n"
+        "==> 2020-10-01 10:01:00 <==\n"
+        "# update specs: ['six', 'defaults::requests']\n"
+        "==> 2020-10-01 10:02:00 <==\n"
+        "# remove specs: ['requests']\n"
+    )
+    return prefix
@@ -1,6 +1,6 @@
 from click.testing import CliRunner
 from resolos.interface import res_init, res_teardown, res_remote_add, res_remote_remove
-from tests.common import verify_result
+from tests.common import verify_result, local_server  # noqa: F401
 from pytest import fixture
 import os
 import tempfile
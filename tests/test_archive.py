@@ -40,6 +40,7 @@ def delete_project_files(project_folders, project_files):
 
 @patch("resolos.shell.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.conda.run_ssh_cmd", wraps=fake_ssh_cmd)
+@patch("resolos.capabilities.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.unison.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.unison.run_shell_cmd", wraps=fake_shell_cmd)
 @patch("resolos.check.run_ssh_cmd", wraps=fake_ssh_cmd)
@@ -0,0 +1,139 @@
+from resolos.capabilities import (
+    remote_capabilities,
+    forget_remote_capabilities,
+    probe_command,
+    parse_probe_output,
+    probe_remote,
+)
+from resolos.config import (
+    create_project_folder,
+    read_project_remote_config,
+    write_project_remote_config,
+)
+from resolos.conda import check_conda_env_exists_remote, check_conda_installed_remote
+from resolos.unison import check_unison_installed_remote
+from resolos.exception import MissingDependency, RemoteCommandError
+from tests.common import REMOTE
+from datetime import datetime, timedelta
+import subprocess
+import json
+import os
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def probes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    create_project_folder()
+    write_project_remote_config("test_remote", {"env_name": "remote_env"})
+    monkeypatch.setattr("resolos.capabilities.probed_capabilities", {})
+    commands = []
+
+    def fake_ssh_cmd(remote_settings, cmd, **kwargs):
+        commands.append(cmd)
+        values = {
+            "conda": "conda 4.9.2",
+            "unison": "",
+            "bash": "5.1.4(1)-release",
+            "sbatch": "/usr/bin/sbatch",
+            "squeue": "/usr/bin/squeue",
+        }
+        if "remote_env" in cmd:
+            values["env_prefix"] = "/home/username/envs/remote_env"
+        elif "env list" in cmd:
+            values["env_prefix"] = ""
+        return 0, f"resolos-probe {json.dumps(values)}"
+
+    monkeypatch.setattr("resolos.capabilities.run_ssh_cmd", fake_ssh_cmd)
+    return commands
+
+
+class TestCapabilities:
+    def test_probe_command(self, tmp_path):
+        cmd = probe_command(REMOTE, "remote_env")
+        assert cmd.startswith("source ~/miniconda3/bin/activate && true; ")
+        assert "~/bin/unison -version" in cmd
+        assert '$1 == "remote_env"' in cmd
+        output = 'Welcome!\nresolos-probe {"conda": "conda 4.9.2", "unison": " "}\n'
+        assert parse_probe_output(output) == {"conda": "conda 4.9.2", "unison": None}
+        assert parse_probe_output("Welcome!\n") is None
+        # The probe prints valid JSON whatever the checks output
+        unison = tmp_path / "unison"
+        unison.write_text(
+            "#!/bin/sh\nprintf '%s\\t%s\\n' 'unison \"2.53.3\"' '\\x'\necho second line\n"
+        )
+        os.chmod(unison, 0o755)
+        remote = dict(REMOTE, conda_load_command="true", unison_path=str(unison))
+        cmd = probe_command(remote, files_path=str(tmp_path / "missing" / "project"))
+        output = subprocess.run(
+            ["bash", "-c", cmd], stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+        values = parse_probe_output(output)
+        assert values["unison"] == 'unison "2.53.3" \\x'
+        assert values["bash"]
+        assert int(values["free_space"]) > 0
+
+    def test_probe_remote(self, monkeypatch):
+        def fake_ssh_cmd(remote_settings, cmd, **kwargs):
+            return 0, (
+                'resolos-probe {"conda": "", "unison": "", "bash": "4.2.46(2)-release", '
+                '"sbatch": "/usr/bin/sbatch", "squeue": "", "free_space": "2048", '
+                '"quota": ""}'
+            )
+
+        monkeypatch.setattr("resolos.capabilities.run_ssh_cmd", fake_ssh_cmd)
+        capabilities = probe_remote(REMOTE, files_path="~/project")
+        assert capabilities["bash_version"] == "4.2.46(2)-release"
+        # Jobs need both submitting and listing
+        assert capabilities["scheduler"] is None
+        assert capabilities["free_space"] == 2048 * 1024
+        assert capabilities["conda_version"] is None
+        monkeypatch.setattr(
+            "resolos.capabilities.run_ssh_cmd",
+            lambda remote_settings, cmd, **kwargs: (255, "Connection refused"),
+        )
+        with pytest.raises(RemoteCommandError):
+            probe_remote(REMOTE)
+
+    def test_cached_capabilities(self, probes):
+        # One probe answers all the checks of a command
+        check_conda_installed_remote(REMOTE)
+        assert check_conda_env_exists_remote(REMOTE, "remote_env")
+        with pytest.raises(MissingDependency):
+            check_unison_installed_remote(REMOTE)
+        assert len(probes) == 1
+        capabilities = read_project_remote_config("test_remote")["capabilities"]
+        assert capabilities["scheduler"] == "slurm"
+        assert capabilities["env_prefix"] == "/home/username/envs/remote_env"
+        # Other environments and refreshes probe the remote again
+        assert not check_conda_env_exists_remote(REMOTE, "other_env")
+        assert len(probes) == 2
+        check_conda_installed_remote(REMOTE, refresh=True)
+        assert len(probes) == 3
+        assert "other_env" in probes[-1]
+
+    def test_expiry_and_invalidation(self, probes, monkeypatch):
+        remote_capabilities(REMOTE)
+        # Later commands reuse the capabilities stored in the project
+        monkeypatch.setattr("resolos.capabilities.probed_capabilities", {})
+        remote_capabilities(REMOTE)
+        assert len(probes) == 1
+        write_project_remote_config(
+            "test_remote",
+            {
+                "capabilities": dict(
+                    remote_capabilities(REMOTE),
+                    probed_at=datetime.utcnow() - timedelta(days=1),
+                )
+            },
+        )
+        monkeypatch.setattr("resolos.capabilities.probed_capabilities", {})
+        remote_capabilities(REMOTE)
+        assert len(probes) == 2
+        forget_remote_capabilities(REMOTE)
+        assert read_project_remote_config("test_remote")["capabilities"] is None
+        remote_capabilities(REMOTE)
+        assert len(probes) == 3
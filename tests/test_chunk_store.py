@@ -0,0 +1,105 @@
+from resolos.archive import (
+    filter_files,
+    snapshot_tree,
+    restore_snapshot,
+    extract_tarball,
+    FILES_NAME,
+    PACK_NAME,
+)
+from resolos.chunk_store import ChunkStore
+from resolos.exception import ResolosException
+import tarfile
+import io
+import os
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024
+
+
+def make_project(path):
+    (path / "data").mkdir(parents=True)
+    (path / "data" / "big.bin").write_bytes(os.urandom(5 * CHUNK_SIZE + 10))
+    (path / "script.py").write_text("print('hello')\n")
+    (path / "empty").mkdir()
+    os.symlink("script.py", path / "link.py")
+
+
+class TestChunkStore:
+    def test_chunk_reader(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.chunk_store.CHUNK_SIZE", CHUNK_SIZE)
+        store = ChunkStore(tmp_path / "store")
+        data = os.urandom(3 * CHUNK_SIZE + 100)
+        (tmp_path / "file").write_bytes(data)
+        chunks = store.put_file(tmp_path / "file")
+        assert len(chunks) == 4
+        reader = store.open_file(chunks)
+        parts = []
+        while True:
+            part = reader.read(700)
+            if not part:
+                break
+            parts.append(part)
+        assert b"".join(parts) == data
+        assert store.open_file(chunks).read() == data
+        store.chunk_path(chunks[1]).write_bytes(
+            store.chunk_path(chunks[0]).read_bytes()
+        )
+        with pytest.raises(ResolosException):
+            store.open_file(chunks).read()
+
+    def test_deduplication(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.chunk_store.CHUNK_SIZE", CHUNK_SIZE)
+        project = tmp_path / "project"
+        make_project(project)
+        store = ChunkStore(tmp_path / "store")
+        entries = snapshot_tree(store, str(project), FILES_NAME, filter_files)
+        first = store.write_manifest({"entries": entries})
+        assert store.written_chunks == 7
+        # Only the changed chunk of the big file and the new file are stored again
+        with open(project / "data" / "big.bin", "r+b") as f:
+            f.seek(2 * CHUNK_SIZE)
+            f.write(b"changed")
+        (project / "new.txt").write_text("new")
+        store = ChunkStore(tmp_path / "store")
+        entries = snapshot_tree(store, str(project), FILES_NAME, filter_files)
+        second = store.write_manifest({"entries": entries})
+        assert store.written_chunks == 2
+        assert store.snapshots() == [first, second]
+        assert store.read_manifest()["snapshot_id"] == second
+        with pytest.raises(ResolosException):
+            store.read_manifest("missing")
+
+    def test_restore_snapshot(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.chunk_store.CHUNK_SIZE", CHUNK_SIZE)
+        project = tmp_path / "project"
+        make_project(project)
+        store = ChunkStore(tmp_path / "store")
+        entries = snapshot_tree(store, str(project), FILES_NAME, filter_files)
+        pack = io.BytesIO()
+        with tarfile.open(fileobj=pack, mode="w:gz") as tar:
+            ti = tarfile.TarInfo("bin/python")
+            ti.size = 6
+            tar.addfile(ti, io.BytesIO(b"python"))
+        (tmp_path / PACK_NAME).write_bytes(pack.getvalue())
+        pack_chunks = store.put_file(tmp_path / PACK_NAME)
+        entries.append({"name": PACK_NAME, "type": "file", "chunks": pack_chunks})
+        manifest = store.read_manifest(store.write_manifest({"entries": entries}))
+        restored = tmp_path / "restored"
+        names = restore_snapshot(store, manifest, {FILES_NAME: str(restored)}, {})
+        assert PACK_NAME in names
+        assert (restored / "data" / "big.bin").read_bytes() == (
+            project / "data" / "big.bin"
+        ).read_bytes()
+        assert (restored / "empty").is_dir()
+        assert os.readlink(restored / "link.py") == "script.py"
+        assert not (restored / PACK_NAME).exists()
+        extract_tarball(store.open_file(pack_chunks), tmp_path / "env")
+        assert (tmp_path / "env" / "bin" / "python").read_bytes() == b"python"
+        manifest["entries"].append(
+            {"name": f"{FILES_NAME}/../escape", "type": "dir", "mode": 0o755}
+        )
+        with pytest.raises(ResolosException):
+            restore_snapshot(store, manifest, {FILES_NAME: str(restored)}, {})
@@ -0,0 +1,240 @@
+from resolos.archive import (
+    ArchiveWriter,
+    INDEX_NAME,
+    open_archive,
+    read_archive_index,
+    open_archive_member,
+    extract_members,
+    extract_pack,
+    make_archive_file,
+    PACK_NAME,
+    FILES_NAME,
+    RESOLOS_FOLDER_NAME,
+)
+from resolos.config import (
+    create_project_folder,
+    get_project_dict_config,
+    is_config_lock_file,
+)
+from resolos.compression import (
+    CompressedStream,
+    DecompressedStream,
+    GzipCodec,
+    ZstdCodec,
+    ParallelGzipCodec,
+    get_codec,
+    detect_compression,
+    read_footer,
+)
+import tarfile
+import gzip
+import io
+import os
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+GZIP_CODECS = [GzipCodec.name, ParallelGzipCodec.name]
+CODEC_DATA = os.urandom(100000) + b"resolos" * 500000
+
+
+def write_codec_members(path, name):
+    with open(path, "wb") as f:
+        stream = CompressedStream(f, get_codec(name))
+        stream.write(CODEC_DATA[:50000])
+        stream.new_member(store=True)
+        stream.write(CODEC_DATA[50000:100000])
+        stream.new_member()
+        stream.write(CODEC_DATA[100000:])
+        stream.close()
+
+
+def check_index(tmp_path, name):
+    project = tmp_path / "project"
+    project.mkdir(exist_ok=True)
+    contents = {}
+    for i in range(20):
+        contents[f"file{i}.txt"] = (f"{i} " * 2000 + "\n").encode("utf-8")
+        (project / f"file{i}.txt").write_bytes(contents[f"file{i}.txt"])
+    pack = tmp_path / "pack.tar.gz"
+    pack.write_bytes(gzip.compress(os.urandom(20000)))
+    archive_path = tmp_path / f"archive.{name}"
+    with ArchiveWriter(
+        archive_path,
+        codec=get_codec(name),
+        pax_headers={"resolos_version": "1"},
+    ) as archive:
+        archive.add(str(project), "files")
+        archive.add(str(pack), "env_pack.tar.gz", compressed=True)
+    with open(archive_path, "rb") as f:
+        assert read_footer(f) is not None
+    index = read_archive_index(archive_path)
+    assert sorted(index) == sorted(
+        [f"files/{file}" for file in contents] + ["env_pack.tar.gz"]
+    )
+    # The files were split into several compressed members
+    assert len(set(e["member_offset"] for e in index.values())) > 5
+    for file, data in contents.items():
+        with open_archive_member(archive_path, f"files/{file}", index) as f:
+            assert f.read() == data
+    with open_archive_member(archive_path, "env_pack.tar.gz") as f:
+        assert f.read() == pack.read_bytes()
+    # The footer does not change the contents of the archive
+    with open_archive(archive_path) as tar:
+        assert tar.pax_headers["compression"] == name
+        extract_members(
+            tar,
+            {"files": str(tmp_path / f"extracted_{name}")},
+            {"env_pack.tar.gz": str(tmp_path / f"pack_{name}")},
+        )
+    for file, data in contents.items():
+        assert (tmp_path / f"extracted_{name}" / file).read_bytes() == data
+    assert (
+        tmp_path / f"pack_{name}" / "env_pack.tar.gz"
+    ).read_bytes() == pack.read_bytes()
+
+
+class TestCompression:
+    def test_members(self):
+        out = io.BytesIO()
+        stream = CompressedStream(out, GzipCodec())
+        stream.write(b"a" * 1000)
+        stream.new_member(store=True)
+        stream.write(b"b" * 1000)
+        stream.new_member()
+        stream.new_member()
+        stream.write(b"c" * 1000)
+        stream.close()
+        assert stream.tell() == 3000
+        assert (
+            gzip.decompress(out.getvalue()) == b"a" * 1000 + b"b" * 1000 + b"c" * 1000
+        )
+        # The stored member keeps the data as it is
+        assert b"b" * 1000 in out.getvalue()
+        assert b"a" * 1000 not in out.getvalue()
+
+    def test_archive_writer(self, tmp_path):
+        project = tmp_path / "project"
+        (project / "folder").mkdir(parents=True)
+        (project / "folder" / "file.txt").write_text("hello " * 1000)
+        pack = tmp_path / "pack.tar.gz"
+        pack.write_bytes(gzip.compress(os.urandom(20000)))
+        archive_path = tmp_path / "archive.tar.gz"
+        with ArchiveWriter(
+            archive_path, pax_headers={"resolos_version": "1"}
+        ) as archive:
+            archive.add(str(project), "files")
+            archive.add(str(pack), "env_pack.tar.gz", compressed=True)
+            archive.add(str(project / "folder" / "file.txt"), "requirements.txt")
+        assert pack.read_bytes() in archive_path.read_bytes()
+        with tarfile.open(archive_path, "r:gz", format=tarfile.PAX_FORMAT) as tar:
+            assert tar.pax_headers["resolos_version"] == "1"
+            assert tar.getnames() == [
+                "files",
+                "files/folder",
+                "files/folder/file.txt",
+                "env_pack.tar.gz",
+                "requirements.txt",
+                INDEX_NAME,
+            ]
+            assert tar.extractfile("env_pack.tar.gz").read() == pack.read_bytes()
+            assert tar.extractfile("requirements.txt").read() == b"hello " * 1000
+
+    def test_codecs(self, tmp_path):
+        for name in GZIP_CODECS:
+            path = tmp_path / f"archive.{name}"
+            write_codec_members(path, name)
+            assert detect_compression(path) == GzipCodec.name
+            assert gzip.decompress(path.read_bytes()) == CODEC_DATA
+
+    def test_zstd_codec(self, tmp_path, monkeypatch):
+        pytest.importorskip("zstandard")
+        monkeypatch.setattr("resolos.archive.INDEX_MEMBER_SIZE", 10000)
+        path = tmp_path / "archive.zst"
+        write_codec_members(path, ZstdCodec.name)
+        assert detect_compression(path) == ZstdCodec.name
+        with open(path, "rb") as f:
+            assert DecompressedStream(f, ZstdCodec.name).read() == CODEC_DATA
+        check_index(tmp_path, ZstdCodec.name)
+
+    def test_index(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.archive.INDEX_MEMBER_SIZE", 10000)
+        for name in GZIP_CODECS:
+            check_index(tmp_path, name)
+
+    def test_codec_closed_on_error(self, tmp_path):
+        codec = ParallelGzipCodec(threads=2)
+        with pytest.raises(ValueError):
+            with ArchiveWriter(tmp_path / "archive.tar.gz", codec=codec) as archive:
+                archive.add(str(tmp_path), "files")
+                raise ValueError("interrupted")
+        assert codec.executor is None
+        assert archive.file.closed
+
+    def test_archive_without_index(self, tmp_path):
+        (tmp_path / "file.txt").write_text("hello")
+        archive_path = tmp_path / "archive.tar.gz"
+        with tarfile.open(archive_path, "w:gz", format=tarfile.PAX_FORMAT) as tar:
+            tar.add(str(tmp_path / "file.txt"), "file.txt")
+        assert read_archive_index(archive_path) is None
+        with open_archive_member(archive_path, "file.txt") as f:
+            assert f.read() == b"hello"
+
+    def test_extract_pack(self, tmp_path):
+        env = tmp_path / "env"
+        (env / "bin").mkdir(parents=True)
+        (env / "bin" / "activate").write_text("echo activated")
+        pack = tmp_path / "env_pack.tar.gz"
+        with tarfile.open(pack, "w:gz") as tar:
+            tar.add(str(env / "bin"), "bin")
+        archive_path = tmp_path / "archive.tar.gz"
+        with ArchiveWriter(
+            archive_path, pax_headers={"resolos_version": "1"}
+        ) as archive:
+            archive.add(str(pack), "env_pack.tar.gz", compressed=True)
+            archive.add(str(env / "bin" / "activate"), "env.yaml")
+        with open_archive(archive_path) as tar:
+            names = extract_members(tar, {}, {"env.yaml": str(tmp_path / "out")})
+        assert "env_pack.tar.gz" in names
+        assert not (tmp_path / "out" / "env_pack.tar.gz").exists()
+        extract_pack(archive_path, str(tmp_path / "restored"))
+        assert (
+            tmp_path / "restored" / "bin" / "activate"
+        ).read_text() == "echo activated"
+
+    def test_make_archive_file(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        create_project_folder()
+        (tmp_path / "script.py").write_text("print('hello')\n")
+        (tmp_path / "poetry.lock").write_text("[[package]]\n")
+        get_project_dict_config().read()
+        pack = gzip.compress(os.urandom(20000))
+
+        def fake_pack(env_name, filename):
+            with open(filename, "wb") as f:
+                f.write(pack)
+
+        def fake_export(env_name, filename=None, **kwargs):
+            with open(filename, "w") as f:
+                f.write(env_name)
+
+        monkeypatch.setattr("resolos.archive.pack_conda_env", fake_pack)
+        for name in [
+            "export_conda_env",
+            "explicit_package_list",
+            "pip_installed_package_list",
+        ]:
+            monkeypatch.setattr(f"resolos.archive.{name}", fake_export)
+        archive_path = tmp_path.parent / f"{tmp_path.name}.tar.gz"
+        make_archive_file("env", str(archive_path), light=False)
+        index = read_archive_index(archive_path)
+        assert f"{FILES_NAME}/script.py" in index
+        # Lock files of the project are kept, only those of the config files are left out
+        assert f"{FILES_NAME}/poetry.lock" in index
+        assert f"{RESOLOS_FOLDER_NAME}/config.yaml" in index
+        assert not any(is_config_lock_file(name) for name in index)
+        assert (tmp_path / ".resolos" / ".config.yaml.lock").exists()
+        with open_archive_member(archive_path, PACK_NAME, index) as f:
+            assert f.read() == pack
@@ -0,0 +1,107 @@
+from resolos.conda_meta import (
+    CondaEnvironment,
+    read_local_env,
+    parse_history_specs,
+    find_env_prefix,
+)
+from tests.common import CHANNEL, make_fake_env, write_record
+import yaml
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestCondaMeta:
+    def test_packages(self, tmp_path):
+        env = CondaEnvironment(make_fake_env(tmp_path))
+        assert sorted(env.packages) == ["python", "six"]
+        # six is installed by conda, its dist-info must not show up as a pip package
+        assert list(env.pip_packages) == ["flask-login", "mylib"]
+        assert env.pip_packages["flask-login"]["requires_dist"] == ["Flask"]
+        assert env.requirements() == [
+            "python==3.8.5",
+            "six==1.15.0",
+            "Flask-Login==0.5.0",
+            "mylib==1.0",
+        ]
+
+    def test_explicit_list(self, tmp_path):
+        env = CondaEnvironment(make_fake_env(tmp_path))
+        explicit = env.explicit_list()
+        assert "# platform: linux-64\n@EXPLICIT\n" in explicit
+        assert f"{CHANNEL}/linux-64/python-3.8.5-h7579374_1.tar.bz2" in explicit
+        assert f"{CHANNEL}/noarch/six-1.15.0-py_0.tar.bz2" in explicit
+
+    def test_env_yaml(self, tmp_path):
+        env = CondaEnvironment(make_fake_env(tmp_path), name="fake_env")
+        env_dict = yaml.safe_load(env.env_yaml())
+        assert env_dict["name"] == "fake_env"
+        assert env_dict["channels"] == ["defaults"]
+        assert env_dict["dependencies"] == [
+            "python=3.8.5=h7579374_1",
+            "six=1.15.0=py_0",
+            {"pip": ["Flask-Login==0.5.0", "mylib==1.0"]},
+        ]
+        from_history = yaml.safe_load(env.env_yaml(only_explicitly_installed=True))
+        assert from_history["dependencies"] == ["python=3.8", "six"]
+
+    def test_root_packages(self, tmp_path):
+        env = CondaEnvironment(make_fake_env(tmp_path))
+        graph = env.full_dependency_graph()
+        # six is provided by conda, the python 2 only and the extra requirements do not apply
+        assert graph.dependencies("mylib") == ["six"]
+        assert graph.dependents("six") == ["mylib"]
+        assert env.root_packages() == (
+            ["python==3.8.5"],
+            ["Flask-Login==0.5.0", "mylib==1.0"],
+        )
+
+    def test_fingerprint(self, tmp_path):
+        prefix = make_fake_env(tmp_path)
+        fingerprint = CondaEnvironment(prefix).fingerprint()
+        assert CondaEnvironment(prefix).fingerprint() == fingerprint
+        write_record(prefix, "zlib", "1.2.11", "h7b6447c_3")
+        assert CondaEnvironment(prefix).fingerprint() != fingerprint
+
+    def test_history_specs(self, tmp_path):
+        prefix = make_fake_env(tmp_path)
+        assert parse_history_specs(prefix / "conda-meta" / "history") == {
+            "python": "python=3.8",
+            "six": "six",
+        }
+
+    def test_read_local_env_is_cached(self, tmp_path):
+        prefix = make_fake_env(tmp_path)
+        env_name = f"source {prefix / 'bin' / 'activate'}"
+        env = read_local_env(env_name)
+        assert env.name == "fake_env"
+        assert read_local_env(env_name) is env
+        write_record(prefix, "zlib", "1.2.11", "h7b6447c_3")
+        changed_env = read_local_env(env_name)
+        assert changed_env is not env
+        assert "zlib" in changed_env.packages
+
+    def test_find_env_prefix(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("HOME", str(tmp_path))
+        other = tmp_path / "other_conda" / "envs" / "myenv"
+        active = tmp_path / "miniconda3" / "envs" / "myenv"
+        for prefix in [other, active]:
+            (prefix / "conda-meta").mkdir(parents=True)
+        (tmp_path / ".conda").mkdir()
+        (tmp_path / ".conda" / "environments.txt").write_text(f"{other}\n{active}\n")
+        monkeypatch.setattr(
+            "resolos.conda_meta.get_conda_shell_env",
+            lambda: (str(tmp_path / "miniconda3" / "bin" / "conda"), {}),
+        )
+        # The active install decides which environment a name refers to
+        monkeypatch.setattr(
+            "resolos.conda_meta.get_conda_env_prefix", lambda env_name: str(active)
+        )
+        assert find_env_prefix("myenv") == active
+        # Without an answer from conda only environments of the active install are used
+        monkeypatch.setattr(
+            "resolos.conda_meta.get_conda_env_prefix", lambda env_name: None
+        )
+        assert find_env_prefix("myenv") == active
+        (tmp_path / ".conda" / "environments.txt").write_text(f"{other}\n")
+        assert find_env_prefix("myenv") is None
@@ -0,0 +1,79 @@
+from resolos.config import DictConfig
+import multiprocessing
+import os
+import yaml
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_keys(path, prefix, count):
+    dc = DictConfig(path, dict)
+    for i in range(count):
+        with dc.locked():
+            d = dc.read()
+            d[f"{prefix}_{i}"] = i
+            dc.write(d)
+
+
+class TestConfig:
+    def test_dict_config_cache(self, tmp_path, monkeypatch):
+        loads = []
+        load = yaml.load
+
+        def counting_load(*args, **kwargs):
+            loads.append(args)
+            return load(*args, **kwargs)
+
+        monkeypatch.setattr("resolos.config.yaml.load", counting_load)
+        path = tmp_path / "config.yaml"
+        dc = DictConfig(path, lambda: {"remotes": {}})
+        assert dc.read() == {"remotes": {}}
+        d = DictConfig(path).read()
+        d["remotes"]["a"] = {"hostname": "a"}
+        # Written configs are served from the cache, copies of them can be modified freely
+        assert dc.read() == {"remotes": {}}
+        assert loads == []
+        dc.write(d)
+        assert DictConfig(path).read() == {"remotes": {"a": {"hostname": "a"}}}
+        assert loads == []
+        assert not [n for n in os.listdir(tmp_path) if n.endswith(".tmp")]
+        # Changes made by other processes are picked up
+        path.write_text("remotes: {}\napp_name: other\n")
+        assert dc.read() == {"remotes": {}, "app_name": "other"}
+        assert len(loads) == 1
+        assert dc.read()["app_name"] == "other"
+        assert len(loads) == 1
+
+    def test_dict_config_write_error(self, tmp_path):
+        path = tmp_path / "config.yaml"
+        dc = DictConfig(path)
+        dc.write({"a": 1})
+        os.chmod(path, 0o640)
+        with pytest.raises(Exception):
+            dc.write({"a": object()})
+        assert dc.read() == {"a": 1}
+        assert not [n for n in os.listdir(tmp_path) if n.endswith(".tmp")]
+        dc.write({"a": 2})
+        assert os.stat(path).st_mode & 0o777 == 0o640
+
+    def test_concurrent_updates(self, tmp_path):
+        path = tmp_path / "remotes.yaml"
+        processes = [
+            multiprocessing.Process(target=add_keys, args=(path, f"p{n}", 20))
+            for n in range(4)
+        ]
+        for p in processes:
+            p.start()
+        # Locks are reentrant within a process
+        dc = DictConfig(path, dict)
+        with dc.locked():
+            with dc.locked():
+                dc.write(dict(dc.read(), local=True))
+        for p in processes:
+            p.join()
+            assert p.exitcode == 0
+        d = DictConfig(path).read()
+        assert len(d) == 4 * 20 + 1
+        assert d["p3_19"] == 19
@@ -0,0 +1,189 @@
+from resolos.download import (
+    Downloader,
+    RangeScheduler,
+    download,
+    missing_ranges,
+    merge_ranges,
+    discard_download,
+)
+from resolos.archive import load_archive, download_target
+from resolos.config import create_project_folder
+from resolos.exception import DownloadError, ResolosException
+from tests.common import QuietHandler
+import hashlib
+import json
+import threading
+import os
+import re
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATA = os.urandom(3 * 1024 * 1024 + 12345)
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeHandler(QuietHandler):
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get("Range")
+        with server.lock:
+            server.requests.append(range_header)
+            fail = server.failures > 0
+            server.failures -= 1
+        if fail:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        m = re.match(r"bytes=(\d+)-(\d+)", range_header or "")
+        if server.ranges and m:
+            start, end = int(m.group(1)), int(m.group(2))
+            body = server.data[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.data)}")
+        else:
+            body = server.data
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def serve(local_server):
+    def start(data=DATA, ranges=True, failures=0):
+        # Failures is the number of requests answered with an error before serving the data
+        return local_server(
+            RangeHandler,
+            path="/archive.tar.gz",
+            data=data,
+            ranges=ranges,
+            failures=failures,
+            requests=[],
+            lock=threading.Lock(),
+            etag='"v1"',
+        )
+
+    return start
+
+
+def sha256(data):
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+class TestDownload:
+    def test_ranges(self):
+        assert merge_ranges([[5, 10], [0, 5], [20, 30]]) == [[0, 10], [20, 30]]
+        assert missing_ranges(40, [[5, 10], [20, 30]]) == [[0, 5], [10, 20], [30, 40]]
+        assert missing_ranges(10, []) == [[0, 10]]
+        scheduler = RangeScheduler([[0, 100]], min_chunk_size=10, max_chunk_size=40)
+        assert scheduler.next_range() == (0, 10)
+        # Fast workers get bigger chunks, up to the maximum size
+        assert scheduler.next_range(rate=10) == (10, 30)
+        assert scheduler.next_range(rate=1000) == (30, 70)
+        assert scheduler.next_range(rate=1000) == (70, 100)
+        assert scheduler.next_range() is None
+
+    def test_parallel_download(self, serve, tmp_path):
+        server = serve()
+        target = tmp_path / "archive.tar.gz"
+        download(
+            server.url,
+            target,
+            checksum=sha256(DATA),
+            min_chunk_size=CHUNK_SIZE,
+            max_chunk_size=CHUNK_SIZE,
+        )
+        assert target.read_bytes() == DATA
+        assert not (tmp_path / "archive.tar.gz.part").exists()
+        assert not (tmp_path / "archive.tar.gz.part.json").exists()
+        # The probe, then one request per chunk
+        assert len(server.requests) == 1 + len(DATA) // CHUNK_SIZE + 1
+
+    def test_resume(self, serve, tmp_path):
+        server = serve()
+        target = tmp_path / "archive.tar.gz"
+        part = tmp_path / "archive.tar.gz.part"
+        # An interrupted download, which finished the first half of the file
+        half = len(DATA) // 2
+        part.write_bytes(DATA[:half] + b"\0" * (len(DATA) - half))
+        (tmp_path / "archive.tar.gz.part.json").write_text(
+            json.dumps(
+                {
+                    "url": server.url,
+                    "size": len(DATA),
+                    "validator": '"v1"',
+                    "done": [[0, half]],
+                }
+            )
+        )
+        download(server.url, target, checksum=sha256(DATA))
+        assert target.read_bytes() == DATA
+        requested = [r for r in server.requests if r != "bytes=0-0"]
+        assert all(int(r[len("bytes=") :].split("-")[0]) >= half for r in requested)
+
+    def test_retry(self, serve, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.download.RETRY_BACKOFF", 0.01)
+        server = serve(failures=3)
+        target = tmp_path / "archive.tar.gz"
+        download(server.url, target, connections=2)
+        assert target.read_bytes() == DATA
+
+    def test_without_ranges(self, serve, tmp_path):
+        server = serve(ranges=False)
+        target = tmp_path / "archive.tar.gz"
+        download(server.url, target, checksum=sha256(DATA))
+        assert target.read_bytes() == DATA
+
+    def test_checksum_mismatch(self, serve, tmp_path):
+        server = serve()
+        target = tmp_path / "archive.tar.gz"
+        with pytest.raises(DownloadError):
+            Downloader(server.url, target, checksum=sha256(b"other")).download()
+        assert not target.exists()
+        assert not (tmp_path / "archive.tar.gz.part").exists()
+
+    def test_finished_download_is_reused(self, serve, tmp_path):
+        server = serve()
+        target = tmp_path / "archive.tar.gz"
+        download(server.url, target, checksum=sha256(DATA))
+        server.requests.clear()
+        download(server.url, target, checksum=sha256(DATA))
+        assert server.requests == ["bytes=0-0"]
+        # A changed file is downloaded again
+        server.data = DATA[::-1]
+        server.etag = '"v2"'
+        download(server.url, target)
+        assert target.read_bytes() == DATA[::-1]
+        discard_download(target)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_failed_load_keeps_download(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        create_project_folder()
+        monkeypatch.setattr(
+            "resolos.archive.get_downloads_dir", lambda: tmp_path / "downloads"
+        )
+
+        def fake_download(url, target_filename, checksum=None):
+            with open(target_filename, "wb") as f:
+                f.write(DATA)
+
+        def failing_load(input_filename, project_dir):
+            raise ResolosException("conda create failed")
+
+        monkeypatch.setattr("resolos.download.download", fake_download)
+        monkeypatch.setattr("resolos.archive.load_archive_file", failing_load)
+        url = "https://example.com/archive.tar.gz"
+        with pytest.raises(ResolosException):
+            load_archive(url=url)
+        assert os.path.exists(download_target(url))
+        monkeypatch.setattr(
+            "resolos.archive.load_archive_file",
+            lambda input_filename, project_dir: None,
+        )
+        load_archive(url=url)
+        assert not os.path.exists(download_target(url))
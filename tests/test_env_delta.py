@@ -0,0 +1,67 @@
+from resolos.conda_meta import CondaEnvironment
+from resolos.env_delta import (
+    env_snapshot,
+    diff_env_snapshots,
+    plan_is_empty,
+    plan_command,
+    write_plan_files,
+)
+from tests.common import make_fake_env, write_record
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestEnvDelta:
+    def test_unchanged(self, tmp_path):
+        env = CondaEnvironment(make_fake_env(tmp_path))
+        plan = diff_env_snapshots(
+            env_snapshot(env, "remote_env"), env_snapshot(env, "remote_env")
+        )
+        assert plan_is_empty(plan)
+        assert plan_command(plan, "remote_env", "spec.txt", "req.txt") == ""
+
+    def test_changed(self, tmp_path):
+        prefix = make_fake_env(tmp_path)
+        old = env_snapshot(CondaEnvironment(prefix), "remote_env")
+        # Upgrade python, add zlib and remove one of the pip packages
+        (prefix / "conda-meta" / "python-3.8.5-h7579374_1.json").unlink()
+        write_record(prefix, "python", "3.8.6", "h7579374_0")
+        write_record(prefix, "zlib", "1.2.11", "h7b6447c_3")
+        shutil.rmtree(
+            prefix / "lib" / "python3.8" / "site-packages" / "mylib-1.0.dist-info"
+        )
+        env = CondaEnvironment(prefix)
+        plan = diff_env_snapshots(old, env_snapshot(env, "remote_env"))
+        assert plan["pip_uninstall"] == ["mylib"]
+        assert plan["conda_remove"] == []
+        assert [url.split("/")[-1] for url in plan["conda_install"]] == [
+            "python-3.8.6-h7579374_0.tar.bz2",
+            "zlib-1.2.11-h7b6447c_3.tar.bz2",
+        ]
+        assert plan["pip_install"] == []
+        assert plan_command(plan, "remote_env", "spec.txt", "req.txt") == (
+            "pip uninstall -y mylib && conda install -y -n remote_env --file spec.txt"
+        )
+        write_plan_files(
+            plan, env.platform, tmp_path / "spec.txt", tmp_path / "req.txt"
+        )
+        spec = (tmp_path / "spec.txt").read_text()
+        assert "@EXPLICIT\n" in spec
+        assert spec.endswith("zlib-1.2.11-h7b6447c_3.tar.bz2\n")
+
+    def test_removed(self, tmp_path):
+        prefix = make_fake_env(tmp_path)
+        old = env_snapshot(CondaEnvironment(prefix), "remote_env")
+        (prefix / "conda-meta" / "six-1.15.0-py_0.json").unlink()
+        plan = diff_env_snapshots(
+            old, env_snapshot(CondaEnvironment(prefix), "remote_env")
+        )
+        assert plan["conda_remove"] == ["six"]
+        # Without the conda record, the six dist-info is reported as a pip package
+        assert plan["pip_install"] == ["six==1.15.0"]
+        assert plan_command(plan, "remote_env", "spec.txt", "req.txt") == (
+            "conda remove -y --force -n remote_env six && "
+            "pip install --no-cache-dir --no-deps -r req.txt"
+        )
@@ -0,0 +1,95 @@
+from resolos.conda import sync_env_and_files, get_local_env_fingerprint
+from resolos.conda_meta import read_local_env
+from resolos.env_delta import env_snapshot, write_env_snapshot, read_env_snapshot
+from resolos.config import (
+    create_project_folder,
+    get_project_dict_config,
+    read_project_remote_config,
+    write_project_remote_config,
+)
+from tests.common import make_fake_env, REMOTE
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+FULL_SYNC_CMD = "install --name remote_env --file ~/project/.env/spec-file.txt"
+
+
+@pytest.fixture
+def env_sync(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    create_project_folder()
+    local_env = f"source {make_fake_env(tmp_path) / 'bin' / 'activate'}"
+    pdc = get_project_dict_config()
+    pdc.write(dict(pdc.read(), env_name=local_env))
+    write_project_remote_config(
+        "test_remote", {"env_name": "remote_env", "files_path": "~/project"}
+    )
+    calls = []
+
+    def fake_export(env_name, filename=None, **kwargs):
+        with open(filename, "w") as f:
+            f.write(env_name)
+
+    def fake_remote_cmd(cmd, remote_settings, env=None):
+        calls.append(cmd)
+
+    monkeypatch.setattr(
+        "resolos.conda.sync_files", lambda remote_settings: calls.append("sync_files")
+    )
+    monkeypatch.setattr("resolos.conda.is_linux_64", lambda: True)
+    monkeypatch.setattr("resolos.conda.pip_installed_package_list", fake_export)
+    monkeypatch.setattr("resolos.conda.explicit_package_list", fake_export)
+    monkeypatch.setattr(
+        "resolos.conda.check_conda_env_exists_remote",
+        lambda remote_settings, env_name: True,
+    )
+    monkeypatch.setattr("resolos.conda.execute_remote_conda_command", fake_remote_cmd)
+    monkeypatch.setattr(
+        "resolos.conda.execute_command_in_remote_conda_env", fake_remote_cmd
+    )
+    return local_env, calls
+
+
+class TestEnvSync:
+    def test_unchanged_env_syncs_files_only(self, env_sync):
+        local_env, calls = env_sync
+        write_project_remote_config(
+            "test_remote",
+            {"last_env_fingerprint": get_local_env_fingerprint(local_env)},
+        )
+        sync_env_and_files(REMOTE)
+        assert calls == ["sync_files"]
+
+    def test_changed_env_is_synced(self, env_sync):
+        local_env, calls = env_sync
+        write_project_remote_config("test_remote", {"last_env_fingerprint": "old"})
+        sync_env_and_files(REMOTE)
+        assert "sync_files" in calls
+        assert FULL_SYNC_CMD in calls
+        assert read_project_remote_config("test_remote")[
+            "last_env_fingerprint"
+        ] == get_local_env_fingerprint(local_env)
+
+    def test_force_syncs_unchanged_env(self, env_sync):
+        local_env, calls = env_sync
+        write_project_remote_config(
+            "test_remote",
+            {"last_env_fingerprint": get_local_env_fingerprint(local_env)},
+        )
+        sync_env_and_files(REMOTE, force=True)
+        assert FULL_SYNC_CMD in calls
+
+    def test_force_ignores_snapshot(self, env_sync):
+        local_env, calls = env_sync
+        snapshot = env_snapshot(read_local_env(local_env), "remote_env")
+        write_env_snapshot("test_remote", snapshot)
+        write_project_remote_config("test_remote", {"last_env_fingerprint": "old"})
+        sync_env_and_files(REMOTE)
+        # The snapshot matches the local environment, so there is nothing to sync
+        assert FULL_SYNC_CMD not in calls
+        calls.clear()
+        sync_env_and_files(REMOTE, force=True)
+        assert FULL_SYNC_CMD in calls
+        assert read_env_snapshot("test_remote") == snapshot
@@ -0,0 +1,95 @@
+from resolos.fanout import run_on_remotes, run_local_and_remotes, report_results
+from resolos.exception import RemoteFanoutError, RemoteCommandError
+from resolos.logging import clog
+from pytest import raises
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+REMOTES = [{"name": f"remote_{i}"} for i in range(4)]
+
+
+class TestFanout:
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(len(REMOTES), timeout=10)
+
+        def wait_for_all(remote_settings):
+            # Only passes if all remotes are handled at the same time
+            barrier.wait()
+            return remote_settings["name"]
+
+        results = run_on_remotes(wait_for_all, REMOTES)
+        assert results == {r["name"]: (True, r["name"]) for r in REMOTES}
+
+    def test_bounded_concurrency(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def count(remote_settings):
+            with lock:
+                running.append(remote_settings["name"])
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(remote_settings["name"])
+
+        run_on_remotes(count, REMOTES, max_workers=2)
+        assert max(max_running) == 2
+
+    def test_failures_are_reported(self):
+        def fail_on_odd(remote_settings, suffix):
+            if remote_settings["name"] in ("remote_1", "remote_3"):
+                raise RemoteCommandError(f"failed {suffix}")
+            return suffix
+
+        results = run_on_remotes(fail_on_odd, REMOTES, "x")
+        assert results["remote_0"] == (True, "x")
+        assert not results["remote_1"][0]
+        with raises(RemoteFanoutError) as ex:
+            report_results(results, "Testing")
+        assert sorted(ex.value.failures) == ["remote_1", "remote_3"]
+        assert ex.value.failures["remote_3"].msg == "failed x"
+
+    def test_output_is_prefixed(self):
+        messages = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+
+        handler = ListHandler()
+        clog.addHandler(handler)
+        level = clog.level
+        clog.setLevel(logging.INFO)
+        try:
+            run_on_remotes(lambda r: clog.info("hello"), REMOTES[:2])
+            clog.info("done")
+        finally:
+            clog.removeHandler(handler)
+            clog.setLevel(level)
+        assert sorted(messages) == [
+            "[remote_0] hello",
+            "[remote_1] hello",
+            "done",
+        ]
+
+    def test_local_and_remotes(self):
+        barrier = threading.Barrier(len(REMOTES) + 1, timeout=10)
+
+        def local():
+            barrier.wait()
+            raise RemoteCommandError("local failure")
+
+        local_result, results = run_local_and_remotes(
+            local, lambda r: barrier.wait(), REMOTES
+        )
+        assert not local_result[0]
+        assert all(success for success, _ in results.values())
+        with raises(RemoteFanoutError) as ex:
+            report_results(
+                results, "Testing", local_result=local_result, rollback_hint="Undo it"
+            )
+        assert list(ex.value.failures) == ["local"]
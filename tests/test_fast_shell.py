@@ -0,0 +1,72 @@
+from resolos.fast_shell import (
+    run_local_conda_cmd,
+    get_conda_env_prefix,
+    get_conda_shell_env,
+    invalidate_conda_shell_env,
+)
+from resolos.conda import verify_conda_version
+from resolos.config import config_lock
+from resolos import fast_shell
+from pathlib import Path
+import threading
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(autouse=True)
+def conda_shell_cache(tmp_path, monkeypatch):
+    # Leave the cached conda shell environment of the user untouched
+    monkeypatch.setattr(
+        "resolos.fast_shell.get_conda_shell_cache_path",
+        lambda: tmp_path / "conda_shell.yaml",
+    )
+
+
+class TestFastShell:
+    def test_conda_version(self, *args):
+        invalidate_conda_shell_env()
+        ret_val, output = run_local_conda_cmd("--version")
+        assert ret_val == 0
+        verify_conda_version(output)
+
+    def test_env_is_cached(self, *args):
+        conda_exe, env = get_conda_shell_env()
+        assert Path(conda_exe).exists()
+        assert get_conda_shell_env() == (conda_exe, env)
+
+    def test_capture_does_not_hold_config_lock(self, monkeypatch):
+        invalidate_conda_shell_env()
+        capture = fast_shell.capture_conda_shell_env
+        acquired = []
+
+        def acquire_config_lock():
+            if config_lock.acquire(timeout=5):
+                acquired.append(True)
+                config_lock.release()
+
+        def checked_capture(conda_exe):
+            # Config reads and writes of other threads go on during the capture
+            thread = threading.Thread(target=acquire_config_lock)
+            thread.start()
+            thread.join()
+            return capture(conda_exe)
+
+        monkeypatch.setattr(
+            "resolos.fast_shell.capture_conda_shell_env", checked_capture
+        )
+        conda_exe, env = get_conda_shell_env()
+        assert acquired == [True]
+        assert get_conda_shell_env() == (conda_exe, env)
+
+    def test_base_env_prefix(self, *args):
+        prefix = get_conda_env_prefix("base")
+        assert (Path(prefix) / "conda-meta").exists()
+        ret_val, output = run_local_conda_cmd("list --json", env_name="base")
+        assert ret_val == 0
+        assert '"name": "conda"' in output
+
+    def test_missing_env_falls_back(self, *args):
+        assert get_conda_env_prefix("resolos_missing_env") is None
+        assert run_local_conda_cmd("list", env_name="resolos_missing_env") is None
@@ -0,0 +1,61 @@
+from resolos.graph import DependencyGraph, conda_dependency_graph, spec_name
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def record(name, depends):
+    return {"name": name, "version": "1.0", "depends": depends}
+
+
+PACKAGES = {
+    "python": record("python", ["openssl >=1.1.1g,<1.1.2a", "__glibc >=2.17"]),
+    "openssl": record("openssl", []),
+    "numpy": record("numpy", ["python >=3.8,<3.9.0a0", "libblas"]),
+    "libblas": record("libblas", []),
+    "pandas": record("pandas", ["numpy >=1.16", "python >=3.8,<3.9.0a0"]),
+    "pip": record("pip", ["python >=3.8"]),
+}
+
+
+class TestGraph:
+    def test_spec_name(self):
+        assert spec_name("numpy >=1.16") == "numpy"
+        assert spec_name("conda-forge::numpy==1.19.2") == "numpy"
+        assert spec_name("python_abi 3.8.* *_cp38") == "python_abi"
+
+    def test_leaves_and_roots(self):
+        graph = conda_dependency_graph(PACKAGES)
+        assert "__glibc" not in graph
+        assert graph.leaves() == ["pandas", "pip"]
+        assert graph.roots() == ["libblas", "openssl"]
+
+    def test_dependencies(self):
+        graph = conda_dependency_graph(PACKAGES)
+        assert graph.dependencies("pandas") == ["numpy", "python"]
+        assert graph.dependencies("pandas", recursive=True) == [
+            "libblas",
+            "numpy",
+            "openssl",
+            "python",
+        ]
+        assert graph.dependents("python") == ["numpy", "pandas", "pip"]
+        assert graph.dependents("openssl", recursive=True) == [
+            "numpy",
+            "pandas",
+            "pip",
+            "python",
+        ]
+
+    def test_topological_order(self):
+        order = conda_dependency_graph(PACKAGES).topological_order()
+        assert order == ["libblas", "openssl", "python", "numpy", "pandas", "pip"]
+
+    def test_cycle(self):
+        graph = DependencyGraph()
+        graph.add_edge("a", "b")
+        graph.add_edge("b", "a")
+        graph.add_edge("c", "a")
+        assert graph.leaves() == ["c"]
+        assert graph.roots() == []
+        assert graph.topological_order() == ["a", "b", "c"]
@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 
 @patch("resolos.shell.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.conda.run_ssh_cmd", wraps=fake_ssh_cmd)
+@patch("resolos.capabilities.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.unison.run_ssh_cmd", wraps=fake_ssh_cmd)
 @patch("resolos.unison.run_shell_cmd", wraps=fake_shell_cmd)
 @patch("resolos.check.run_ssh_cmd", wraps=fake_ssh_cmd)
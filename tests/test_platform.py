@@ -0,0 +1,74 @@
+from resolos.platform import (
+    find_resolos_dir,
+    find_project_dir,
+    in_resolos_dir,
+    resolos_relative_path,
+)
+from resolos.config import create_project_folder
+from resolos.job import job_submit
+from resolos.exception import NotAProjectFolderError, ResolosPathException
+import pathlib
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestPlatform:
+    def test_find_resolos_dir(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("RESOLOS_PROJECT_DIR", raising=False)
+        subdir = tmp_path / "project" / "data" / "raw"
+        subdir.mkdir(parents=True)
+        monkeypatch.chdir(subdir)
+        assert not in_resolos_dir()
+        monkeypatch.chdir(tmp_path / "project")
+        project_dir = create_project_folder()
+        monkeypatch.chdir(subdir)
+        assert find_project_dir() == project_dir
+        # The project folder is not searched for again
+        exists = pathlib.Path.exists
+        calls = []
+        monkeypatch.setattr(
+            pathlib.Path, "exists", lambda p: calls.append(p) or exists(p)
+        )
+        assert find_resolos_dir() == project_dir / ".resolos"
+        assert calls == []
+
+    def test_project_dir_override(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        project_dir = create_project_folder()
+        other = tmp_path.parent
+        monkeypatch.chdir(other)
+        monkeypatch.setenv("RESOLOS_PROJECT_DIR", str(project_dir))
+        assert find_project_dir() == project_dir
+        monkeypatch.setenv("RESOLOS_PROJECT_DIR", str(tmp_path / "missing"))
+        with pytest.raises(NotAProjectFolderError):
+            find_resolos_dir()
+
+    def test_relative_path_outside_project(self, tmp_path, monkeypatch):
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        monkeypatch.chdir(project_dir)
+        create_project_folder()
+        (project_dir / "jobs").mkdir()
+        monkeypatch.chdir(project_dir / "jobs")
+        assert resolos_relative_path(pathlib.Path("script.sh")) == pathlib.Path(
+            "jobs/script.sh"
+        )
+        # Relative paths are in the project when working outside of it
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("RESOLOS_PROJECT_DIR", str(project_dir))
+        assert resolos_relative_path(pathlib.Path("jobs/script.sh")) == pathlib.Path(
+            "jobs/script.sh"
+        )
+        assert resolos_relative_path(project_dir / "script.sh") == pathlib.Path(
+            "script.sh"
+        )
+        with pytest.raises(ResolosPathException):
+            resolos_relative_path(tmp_path / "script.sh")
+        monkeypatch.setattr(
+            "resolos.job.run_slurm_command", lambda remote_settings, cmd: cmd
+        )
+        assert job_submit({}, "~/project", "jobs/script.sh") == (
+            "cd ~/project && sbatch jobs/script.sh"
+        )
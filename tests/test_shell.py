@@ -0,0 +1,226 @@
+from resolos.shell import (
+    run_shell_cmd,
+    run_ssh_cmd,
+    get_remote_session,
+    close_remote_sessions,
+    conda_load_prefix,
+    ssh_options,
+    SSHConnectionManager,
+)
+from resolos.config import SSH_CONTROL_PERSIST, SSH_SERVERALIVEINTERVAL
+from resolos.exception import ShellError
+from concurrent.futures import ThreadPoolExecutor
+from pytest import raises, fixture, mark
+from time import monotonic
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class TestShell:
+    def test_output_is_trimmed(self, *args):
+        ret_val, output = run_shell_cmd(
+            "echo first && echo second", shell_type="bash_non_login"
+        )
+        assert ret_val == 0
+        assert output.split() == ["first", "second"]
+
+    def test_returns_without_polling_delay(self, *args):
+        start = monotonic()
+        run_shell_cmd("true", shell_type="bash_non_login")
+        assert monotonic() - start < 0.5
+
+    def test_background_child_does_not_block(self, *args):
+        start = monotonic()
+        ret_val, output = run_shell_cmd(
+            "(sleep 5 &) && echo started", shell_type="bash_non_login"
+        )
+        assert ret_val == 0
+        assert "started" in output
+        assert monotonic() - start < 2
+
+    def test_exit_code(self, *args):
+        ret_val, output = run_shell_cmd("exit 3", shell_type="bash_non_login")
+        assert ret_val == 3
+
+    def test_timeout(self, *args):
+        with raises(TimeoutError):
+            run_shell_cmd("sleep 5", max_wait_secs=1, shell_type="bash_non_login")
+
+
+@fixture
+def fake_ssh(tmp_path, monkeypatch):
+    # An 'ssh' that runs the remote command on the local machine
+    ssh = tmp_path / "ssh"
+    ssh.write_text('#!/bin/bash\neval "${@: -1}"\n')
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    yield
+    close_remote_sessions()
+
+
+@mark.usefixtures("fake_ssh")
+class TestRemoteShellSession:
+    remote_settings = {
+        "name": "session_test_remote",
+        "username": "username",
+        "hostname": "hostname",
+        "port": 22,
+        "conda_load_command": "export RESOLOS_TEST_LOADED=yes",
+        "persistent_shell": True,
+    }
+
+    def test_commands_share_session(self, *args):
+        session = get_remote_session(self.remote_settings)
+        assert session is not None
+        ret_val, output = run_ssh_cmd(self.remote_settings, "echo $RESOLOS_TEST_LOADED")
+        assert ret_val == 0
+        assert output.strip() == "yes"
+        assert get_remote_session(self.remote_settings) is session
+
+    def test_exit_code_and_isolation(self, *args):
+        ret_val, output = run_ssh_cmd(
+            self.remote_settings, "cd / && echo failing >&2 && exit 4"
+        )
+        assert ret_val == 4
+        assert output.strip() == "failing"
+        ret_val, output = run_ssh_cmd(self.remote_settings, "pwd")
+        assert ret_val == 0
+        assert output.strip() != "/"
+
+    def test_sent_command_is_not_run_again(self, tmp_path):
+        runs = tmp_path / "runs"
+        # The command kills the persistent shell after it ran
+        with raises(ShellError):
+            run_ssh_cmd(self.remote_settings, f"echo ran >> {runs}; kill -9 $$")
+        assert runs.read_text() == "ran\n"
+        # The next command starts a new session
+        ret_val, output = run_ssh_cmd(self.remote_settings, "echo $RESOLOS_TEST_LOADED")
+        assert output.strip() == "yes"
+
+    def test_unsent_command_falls_back(self, monkeypatch):
+        session = get_remote_session(self.remote_settings)
+        session.proc.kill()
+        session.proc.wait()
+        monkeypatch.setattr("resolos.shell.get_remote_session", lambda s: session)
+        # The local shell must keep the fake ssh on the PATH
+        ret_val, output = run_ssh_cmd(
+            self.remote_settings,
+            "echo $RESOLOS_TEST_LOADED",
+            shell_type="bash_non_login",
+        )
+        assert ret_val == 0
+        assert output.split()[-1] == "yes"
+
+    def test_conda_load_command_is_skipped(self, *args):
+        assert conda_load_prefix(self.remote_settings) == ""
+        settings = dict(self.remote_settings, persistent_shell=False)
+        assert conda_load_prefix(settings).startswith("export RESOLOS_TEST_LOADED")
+
+
+class FakeGlobalConfig(object):
+    def __init__(self, multiplexing):
+        self.multiplexing = multiplexing
+
+    def read(self):
+        return {"ssh_multiplexing": self.multiplexing}
+
+
+@fixture
+def ssh_master(tmp_path, monkeypatch):
+    # An 'ssh' that logs its arguments, creates the control socket when starting a master
+    # and checks masters by the existence of their socket
+    log = tmp_path / "ssh.log"
+    ssh = tmp_path / "ssh"
+    ssh.write_text(
+        "#!/bin/bash\n"
+        f'echo "$@" >> {log}\n'
+        'if [ "$1" = "-O" ]; then [ -e "$4" ]; exit $?; fi\n'
+        'if [ -n "$RESOLOS_TEST_SSH_FAIL" ]; then echo failed; exit 255; fi\n'
+        'sleep "${RESOLOS_TEST_SSH_DELAY:-0}"\n'
+        'touch "$5"\n'
+    )
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    monkeypatch.setattr(
+        "resolos.shell.get_ssh_control_dir", lambda: tmp_path / "control"
+    )
+    monkeypatch.setattr("resolos.shell.get_ssh_key", lambda: "~/.ssh/id_rsa_resolos")
+    monkeypatch.setattr(
+        "resolos.shell.get_global_dict_config", lambda: FakeGlobalConfig(True)
+    )
+    manager = SSHConnectionManager()
+    monkeypatch.setattr("resolos.shell.ssh_connections", manager)
+
+    def calls():
+        return log.read_text().splitlines() if log.exists() else []
+
+    manager.calls = calls
+    yield manager
+    manager.close_all()
+
+
+class TestSSHConnectionManager:
+    remote_settings = {
+        "name": "multiplexed_remote",
+        "username": "username",
+        "hostname": "hostname",
+        "port": 2222,
+    }
+
+    def test_master_arguments(self, ssh_master):
+        control_path = ssh_master.get(self.remote_settings)
+        assert control_path == SSHConnectionManager.control_path(self.remote_settings)
+        assert ssh_master.calls() == [
+            f"-M -N -f -S {control_path} -o ControlPersist={SSH_CONTROL_PERSIST} "
+            f"-o ServerAliveInterval={SSH_SERVERALIVEINTERVAL} -p 2222 -i ~/.ssh/id_rsa_resolos "
+            f"username@hostname"
+        ]
+        options = ssh_options(self.remote_settings)
+        assert options.endswith(f"-i ~/.ssh/id_rsa_resolos -S {control_path}")
+        # Connections that ask for a password do not go through the master
+        assert "-S" not in ssh_options(self.remote_settings, force_password=True)
+
+    def test_live_master_is_reused(self, ssh_master):
+        control_path = ssh_master.get(self.remote_settings)
+        assert ssh_master.get(self.remote_settings) == control_path
+        assert len(ssh_master.calls()) == 1
+        # A master left by another resolos process is checked instead of started again
+        other = SSHConnectionManager()
+        assert other.get(self.remote_settings) == control_path
+        assert ssh_master.calls()[-1].startswith(f"-O check -S {control_path}")
+        assert len(ssh_master.calls()) == 2
+        other.close_all()
+        ssh_master.close(self.remote_settings)
+        assert ssh_master.calls()[-1].startswith(f"-O stop -S {control_path}")
+
+    def test_fallback(self, ssh_master, monkeypatch):
+        assert ssh_master.get(self.remote_settings, connect=False) is None
+        monkeypatch.setattr(
+            "resolos.shell.get_global_dict_config", lambda: FakeGlobalConfig(False)
+        )
+        assert ssh_master.get(self.remote_settings) is None
+        assert "-S" not in ssh_options(self.remote_settings)
+        assert ssh_master.calls() == []
+        monkeypatch.setattr(
+            "resolos.shell.get_global_dict_config", lambda: FakeGlobalConfig(True)
+        )
+        monkeypatch.setenv("RESOLOS_TEST_SSH_FAIL", "1")
+        assert ssh_master.get(self.remote_settings) is None
+        # A master that failed to start is not tried again for every command
+        assert ssh_master.get(self.remote_settings) is None
+        assert len(ssh_master.calls()) == 1
+
+    def test_masters_start_concurrently(self, ssh_master, monkeypatch):
+        monkeypatch.setenv("RESOLOS_TEST_SSH_DELAY", "1")
+        remotes = [
+            dict(self.remote_settings, name=f"remote_{i}", hostname=f"host_{i}")
+            for i in range(4)
+        ]
+        start = monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            control_paths = list(executor.map(ssh_master.get, remotes + remotes))
+        assert monotonic() - start < 2.5
+        assert len(set(control_paths)) == 4
+        assert len(ssh_master.calls()) == 4
@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import json
+import os
+import resolos
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Runs a command in a new interpreter, reports how long it took and the modules it imported
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from resolos.interface import res
+try:
+    res.main(sys.argv[1:], prog_name="r3s", standalone_mode=False)
+except SystemExit:
+    pass
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+SUBCOMMANDS = [
+    [],
+    ["info"],
+    ["init"],
+    ["sync"],
+    ["install"],
+    ["remote", "add"],
+    ["job"],
+    ["archive", "create"],
+    ["archive", "load"],
+]
+
+
+def run_startup(args, home):
+    # Other tests change the working directory, resolos is imported from where it is now
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(resolos.__file__)))
+    python_path = os.pathsep.join(
+        [package_dir] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+    )
+    env = dict(os.environ, HOME=str(home), PYTHONPATH=python_path)
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestStartup:
+    @pytest.mark.parametrize(
+        "subcommand", SUBCOMMANDS, ids=lambda args: " ".join(["r3s"] + args)
+    )
+    def test_help_imports(self, subcommand, tmp_path):
+        report = run_startup(subcommand + ["--help"], tmp_path)
+        logger.info(f"r3s {' '.join(subcommand)} --help: {report['seconds']:.3f}s")
+        # The help of any command must not load the HTTP client or the archive code
+        for module in ["requests", "jwt", "resolos.archive", "resolos.conda"]:
+            assert module not in report["modules"]
+
+    def test_info_imports(self, tmp_path):
+        report = run_startup(["info"], tmp_path)
+        logger.info(f"r3s info: {report['seconds']:.3f}s")
+        assert "requests" not in report["modules"]
+        assert "jwt" not in report["modules"]
@@ -0,0 +1,100 @@
+from resolos.upload import MultipartFile, upload_file
+from resolos.storage.yareta import YaretaClient, upload_file_to_deposit
+from resolos.exception import UploadError, YaretaError
+from tests.common import QuietHandler
+import requests
+import json
+import os
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATA = os.urandom(2 * 1024 * 1024 + 777)
+
+
+class UploadHandler(QuietHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if server.failures > 0:
+            server.failures -= 1
+            status_code, response = 503, b""
+        else:
+            server.uploads.append((dict(self.headers), body))
+            status_code, response = (
+                server.status_code,
+                json.dumps({"ok": True}).encode(),
+            )
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+@pytest.fixture
+def serve(local_server):
+    def start(failures=0, status_code=200):
+        # Failures is the number of requests answered with an error before accepting the upload
+        return local_server(
+            UploadHandler, failures=failures, status_code=status_code, uploads=[]
+        )
+
+    return start
+
+
+def uploaded_file(headers, body):
+    boundary = headers["Content-Type"].split("boundary=")[1]
+    assert int(headers["Content-Length"]) == len(body)
+    head, sep, rest = body.partition(b"\r\n\r\n")
+    assert head.startswith(f"--{boundary}\r\n".encode())
+    assert b'name="file"; filename="archive.tar.gz"' in head
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    assert rest.endswith(tail)
+    return rest[: -len(tail)]
+
+
+class TestUpload:
+    def test_multipart_file(self, tmp_path):
+        path = tmp_path / "archive.tar.gz"
+        path.write_bytes(DATA)
+        with MultipartFile("file", str(path)) as body:
+            whole = body.read()
+            assert len(whole) == len(body)
+            body.rewind()
+            parts = []
+            while True:
+                data = body.read(100000)
+                if not data:
+                    break
+                assert len(data) <= 100000
+                parts.append(data)
+        assert b"".join(parts) == whole
+        headers = {
+            "Content-Type": body.content_type,
+            "Content-Length": str(len(whole)),
+        }
+        assert uploaded_file(headers, whole) == DATA
+
+    def test_upload_retry(self, serve, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.upload.RETRY_BACKOFF", 0.01)
+        server = serve(failures=2)
+        path = tmp_path / "archive.tar.gz"
+        path.write_bytes(DATA)
+        yc = YaretaClient(server.url, "token")
+        assert upload_file_to_deposit(yc, "deposit", str(path)) == {"ok": True}
+        assert len(server.uploads) == 1
+        headers, body = server.uploads[0]
+        assert headers["Authorization"] == "Bearer token"
+        assert uploaded_file(headers, body) == DATA
+
+    def test_upload_errors(self, serve, tmp_path, monkeypatch):
+        monkeypatch.setattr("resolos.upload.RETRY_BACKOFF", 0.01)
+        monkeypatch.setattr("resolos.upload.MAX_RETRIES", 1)
+        path = tmp_path / "archive.tar.gz"
+        path.write_bytes(DATA)
+        with pytest.raises(UploadError):
+            upload_file(requests.Session(), serve(failures=5).url, str(path))
+        yc = YaretaClient(serve(status_code=400).url, "token")
+        with pytest.raises(YaretaError):
+            upload_file_to_deposit(yc, "deposit", str(path))
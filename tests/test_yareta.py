@@ -0,0 +1,91 @@
+from resolos.storage.yareta import (
+    YaretaClient,
+    submit_deposit,
+    wait_for_deposit_files,
+)
+from resolos.exception import YaretaError
+from tests.common import QuietHandler
+import json
+import pytest
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEPOSIT_PATH = "/ingestion/preingest/deposits/deposit"
+
+
+class DepositHandler(QuietHandler):
+    def send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if self.path == DEPOSIT_PATH:
+            self.send_json({"resId": "deposit", "status": server.status})
+        elif self.path == f"{DEPOSIT_PATH}/data":
+            server.polls += 1
+            status = server.file_statuses[
+                min(server.polls, len(server.file_statuses)) - 1
+            ]
+            self.send_json(
+                {
+                    "_data": [
+                        {"fullFileName": "/resolos_archive.tar.gz", "status": status},
+                        {"fullFileName": "/metadata.xml", "status": "READY"},
+                    ]
+                }
+            )
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path == f"{DEPOSIT_PATH}/approve":
+            self.server.status = "APPROVED"
+            self.send_json({"resId": "deposit", "status": "APPROVED"})
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def serve(local_server, monkeypatch):
+    monkeypatch.setattr("resolos.storage.yareta.POLL_INITIAL_DELAY", 0.01)
+
+    def start(file_statuses):
+        # Statuses of the deposit files reported by successive polls, the last one repeats
+        return local_server(
+            DepositHandler,
+            file_statuses=list(file_statuses),
+            status="IN_PROGRESS",
+            polls=0,
+        )
+
+    return start
+
+
+class TestYareta:
+    def test_wait_for_deposit_files(self, serve):
+        server = serve(["RECEIVED", "PROCESSED", "PROCESSED", "READY"])
+        wait_for_deposit_files(YaretaClient(server.url, "token"), "deposit")
+        assert server.polls == 4
+        server = serve(["RECEIVED", "IN_ERROR"])
+        with pytest.raises(YaretaError):
+            wait_for_deposit_files(YaretaClient(server.url, "token"), "deposit")
+        server = serve(["RECEIVED"])
+        with pytest.raises(YaretaError):
+            wait_for_deposit_files(
+                YaretaClient(server.url, "token"), "deposit", timeout=0.1
+            )
+
+    def test_submit_deposit(self, serve):
+        server = serve(["PROCESSED", "READY"])
+        # The files are still being processed, the deposit is left in progress
+        assert submit_deposit("deposit", "token", server.url) == "IN_PROGRESS"
+        assert submit_deposit("deposit", "token", server.url) == "APPROVED"
+        assert submit_deposit("deposit", "token", server.url) == "APPROVED"
+        assert server.polls == 2
+        server = serve(["PROCESSED", "READY"])
+        assert submit_deposit("deposit", "token", server.url, wait=True) == "APPROVED"